@@ -1,16 +1,31 @@
 # -*- coding: utf-8 -*-
 
+from .cache import TTLCache
+from .hooks import QueryEvent, QueryHook
 from .orm import (
     BaseModelManager,
     RowModelDeclarativeMeta,
     RowModel,
     OrderBy,
+    Query,
+    StatementTimeoutError,
 )
+from .pool import AcquireTimeoutError
+from .slowlog import SlowQueryLog
+from .stats import QueryStatsRegistry
 
 
 __all__ = (
+    'AcquireTimeoutError',
     'BaseModelManager',
     'RowModelDeclarativeMeta',
     'RowModel',
     'OrderBy',
+    'Query',
+    'QueryEvent',
+    'QueryHook',
+    'QueryStatsRegistry',
+    'SlowQueryLog',
+    'StatementTimeoutError',
+    'TTLCache',
 )
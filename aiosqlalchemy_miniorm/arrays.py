@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Filling NumPy arrays from result rows, available only when NumPy is installed.
+"""
+from sqlalchemy import types
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+def get_dtype(type_):
+    """
+    Returns the NumPy dtype of a SQLAlchemy type, `object` for types without a native dtype.
+    """
+    # Interval is a TypeDecorator of DateTime on backends without a native interval type
+    if isinstance(type_, types.Interval):
+        return 'timedelta64[us]'
+
+    if isinstance(type_, types.TypeDecorator):
+        type_ = type_.impl
+
+    if isinstance(type_, types.Boolean):
+        return '?'
+
+    if isinstance(type_, types.Integer):
+        return 'i8'
+
+    if isinstance(type_, types.Numeric):
+        return 'f8'
+
+    if isinstance(type_, types.DateTime):
+        return 'datetime64[us]'
+
+    if isinstance(type_, types.Date):
+        return 'datetime64[D]'
+
+    return 'O'
+
+
+class ArrayBuilder:
+    """
+    Fills preallocated arrays batch by batch, growing their capacity twofold when full.
+
+    Integer and boolean columns can't hold NULLs, override their dtype (e.g. with `f8` or `O`) for nullable columns.
+    """
+
+    def __init__(self, columns: list, dtype_overrides: dict=None, capacity: int=1024):
+        if numpy is None:
+            raise ImportError('NumPy is required to build arrays')
+
+        dtype_overrides = dtype_overrides or {}
+
+        self.dtype = numpy.dtype([
+            (column.key, dtype_overrides.get(column.key, get_dtype(column.type))) for column in columns
+        ])
+        self.size = 0
+        self._array = numpy.empty(max(1, capacity), dtype=self.dtype)
+
+    def append(self, rows: list):
+        """
+        Appends rows given as sequences ordered as the columns.
+        """
+        if not rows:
+            return
+
+        end = self.size + len(rows)
+
+        if end > len(self._array):
+            self._array = numpy.resize(self._array, max(end, 2 * len(self._array)))
+
+        for name, values in zip(self.dtype.names, zip(*rows)):
+            try:
+                self._array[name][self.size:end] = values
+            except (TypeError, ValueError) as e:
+                raise ValueError('Column "{}" does not fit dtype {}: {}'.format(name, self.dtype[name], e))
+
+        self.size = end
+
+    def get_array(self):
+        """
+        Returns a structured array of the appended rows.
+        """
+        return self._array[:self.size].copy()
+
+    def get_columns(self):
+        """
+        Returns a dict of one array per column.
+        """
+        return {name: self._array[name][:self.size].copy() for name in self.dtype.names}
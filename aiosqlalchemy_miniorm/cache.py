@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import collections
+import time
+
+
+_MISSING = object()
+
+
+class SharedFutures:
+    """
+    Futures by key, at most one at a time per key, awaited by any number of callers with `wait()`.
+
+    A future is forgotten once done, its error is retrieved even if every caller has been cancelled.
+    """
+
+    def __init__(self):
+        self._futures = {}
+
+    def __len__(self):
+        return len(self._futures)
+
+    def get_or_start(self, key, start, on_done=None):
+        """
+        Returns `(future, started)`: the pending future of `key`, or a new one wrapping `start()`,
+        a coroutine or a future. `on_done(key, future)` is called when a started future is done,
+        unless it has been discarded meanwhile.
+        """
+        future = self._futures.get(key)
+
+        if future is not None:
+            return future, False
+
+        future = asyncio.ensure_future(start())
+        self._futures[key] = future
+        future.add_done_callback(lambda done: self._on_done(key, done, on_done))
+
+        return future, True
+
+    def _on_done(self, key, future, on_done):
+        if not future.cancelled():
+            future.exception()
+
+        if self._futures.get(key) is not future:
+            return
+
+        del self._futures[key]
+
+        if on_done is not None:
+            on_done(key, future)
+
+    def discard(self, key):
+        self._futures.pop(key, None)
+
+    def discard_if(self, predicate):
+        for key in [key for key in self._futures if predicate(key)]:
+            del self._futures[key]
+
+    def clear(self):
+        self._futures.clear()
+
+    @staticmethod
+    async def wait(future):
+        # a cancelled caller must not cancel the future the other callers share
+        return await asyncio.shield(future)
+
+
+def _get_group(key):
+    return key[0] if isinstance(key, tuple) and key else None
+
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used entry once `maxsize` is reached.
+
+    Hit, miss and eviction counters are kept so the cache can be sized from production stats.
+    Tuple keys are indexed by their first item, so the entries of a group are dropped without a scan,
+    see `discard_group()`.
+    """
+
+    def __init__(self, maxsize: int=1024):
+        assert maxsize > 0, 'maxsize should be positive'
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = collections.OrderedDict()
+        self._groups = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def set(self, key, value):
+        if key not in self._data:
+            self._groups.setdefault(_get_group(key), set()).add(key)
+
+        self._data[key] = value
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            evicted_key, _ = self._data.popitem(last=False)
+            self._unindex(evicted_key)
+            self.evictions += 1
+
+    def _unindex(self, key):
+        group = _get_group(key)
+        keys = self._groups[group]
+        keys.discard(key)
+
+        if not keys:
+            del self._groups[group]
+
+    def pop(self, key, default=None):
+        if key not in self._data:
+            return default
+
+        self._unindex(key)
+
+        return self._data.pop(key)
+
+    def discard_if(self, predicate):
+        """
+        Removes the entries whose key matches `predicate`, returns their number.
+        """
+        keys = [key for key in self._data if predicate(key)]
+
+        for key in keys:
+            self.pop(key)
+
+        return len(keys)
+
+    def discard_group(self, group):
+        """
+        Removes the entries whose key is a tuple starting with `group`, returns their number.
+        """
+        keys = self._groups.pop(group, ())
+
+        for key in keys:
+            del self._data[key]
+
+        return len(keys)
+
+    def clear(self):
+        self._data.clear()
+        self._groups.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class TTLCache(LRUCache):
+    """
+    `LRUCache` whose entries also expire `ttl` seconds after they are set (never if `ttl` is None).
+
+    `get_or_load()` reads through the cache and runs a single load per key at a time, concurrent misses
+    of the same key wait for it instead of loading it again (counted as `shared_loads`).
+    """
+
+    def __init__(self, maxsize: int=1024, ttl: float=None, timer=time.monotonic):
+        super().__init__(maxsize)
+
+        self.ttl = ttl
+        self.timer = timer
+        self.expirations = 0
+        self.shared_loads = 0
+        self._loads = SharedFutures()
+
+    def get(self, key, default=None):
+        try:
+            value, expires_at = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        if expires_at is not None and expires_at <= self.timer():
+            super().pop(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def set(self, key, value):
+        super().set(key, (value, None if self.ttl is None else self.timer() + self.ttl))
+
+    def pop(self, key, default=None):
+        # a load running for the key may return stale data, it won't be cached
+        self._loads.discard(key)
+        entry = super().pop(key)
+
+        return default if entry is None else entry[0]
+
+    def discard_if(self, predicate):
+        self._loads.discard_if(predicate)
+
+        return super().discard_if(predicate)
+
+    def discard_group(self, group):
+        # only the loads running at the moment are scanned
+        self._loads.discard_if(lambda key: _get_group(key) == group)
+
+        return super().discard_group(group)
+
+    def clear(self):
+        super().clear()
+        self._loads.clear()
+
+    async def get_or_load(self, key, load):
+        """
+        Returns the cached value of `key`, or awaits `load()` and caches its result unless it is None.
+        """
+        value = self.get(key, _MISSING)
+
+        if value is not _MISSING:
+            return value
+
+        future, started = self._loads.get_or_start(key, load, self._on_loaded)
+
+        if not started:
+            self.shared_loads += 1
+
+        return await SharedFutures.wait(future)
+
+    def _on_loaded(self, key, future):
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            self.set(key, future.result())
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(ttl=self.ttl, expirations=self.expirations, shared_loads=self.shared_loads)
+
+        return stats
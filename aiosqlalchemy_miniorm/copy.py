@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Encoding of rows for PostgreSQL `COPY ... FROM STDIN` in text format, and the psycopg2 connection sending them.
+"""
+import asyncio
+import functools
+import json
+
+from sqlalchemy import types
+from sqlalchemy.dialects import postgresql
+
+try:
+    import psycopg2
+    from psycopg2.extensions import make_dsn, parse_dsn
+except ImportError:  # pragma: no cover
+    psycopg2 = None
+
+
+NULL = '\\N'
+
+# psycopg2 replaces the password in the dsn of its connections
+_MASKED_PASSWORD = 'xxx'
+
+_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+
+def _escape(value: str):
+    return value.translate(_ESCAPES)
+
+
+def _encode_text(value):
+    return _escape(str(value))
+
+
+def _encode_boolean(value):
+    return 't' if value else 'f'
+
+
+def _encode_temporal(value):
+    return value.isoformat()
+
+
+def _encode_interval(value):
+    # timedelta normalizes its seconds and microseconds as positive, only days can be negative
+    return '{:d} days {:d}.{:06d} seconds'.format(value.days, value.seconds, value.microseconds)
+
+
+def _get_enum_encoder(enum_class):
+    def encode(value):
+        # enum members are stored by name, as by the bind processor of Enum
+        if isinstance(value, enum_class):
+            value = value.name
+
+        return _escape(value)
+
+    return encode
+
+
+def _encode_binary(value):
+    # hex bytea input, the backslash itself is escaped by the text format
+    return '\\\\x' + bytes(value).hex()
+
+
+def _encode_json(value):
+    return _escape(json.dumps(value))
+
+
+def _encode_array_item(value):
+    if value is None:
+        return 'NULL'
+
+    if isinstance(value, (list, tuple)):
+        return '{' + ','.join(_encode_array_item(item) for item in value) + '}'
+
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _encode_array(value):
+    return _escape(_encode_array_item(value))
+
+
+def get_value_encoder(type_):
+    """
+    Returns a function encoding non-null values of the given SQLAlchemy type.
+    """
+    # Interval is a TypeDecorator of DateTime on backends without a native interval type
+    if isinstance(type_, (types.Interval, postgresql.INTERVAL)):
+        return _encode_interval
+
+    if isinstance(type_, types.TypeDecorator):
+        type_ = type_.impl
+
+    if isinstance(type_, types.Enum) and type_.enum_class is not None:
+        return _get_enum_encoder(type_.enum_class)
+
+    if isinstance(type_, types.Boolean):
+        return _encode_boolean
+
+    if isinstance(type_, (types.DateTime, types.Date, types.Time)):
+        return _encode_temporal
+
+    if isinstance(type_, types.LargeBinary):
+        return _encode_binary
+
+    if isinstance(type_, types.JSON):
+        return _encode_json
+
+    if isinstance(type_, types.ARRAY):
+        return _encode_array
+
+    return _encode_text
+
+
+def get_row_encoder(columns):
+    """
+    Returns a function encoding a row (a dict by column key, or a sequence ordered as `columns`) into a COPY line.
+    """
+    keys = [column.key for column in columns]
+    encoders = [get_value_encoder(column.type) for column in columns]
+
+    def encode(row):
+        if isinstance(row, dict):
+            values = [row.get(key) for key in keys]
+        else:
+            values = row
+
+        return '\t'.join(
+            NULL if value is None else encoder(value)
+            for encoder, value in zip(encoders, values)
+        ) + '\n'
+
+    return encode
+
+
+class AsyncIterator:
+    """
+    Wraps a regular iterable to be consumed with `async for`.
+    """
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def get_copy_dsn(dsn: str):
+    """
+    Returns the dsn of a psycopg2 connection without its masked password,
+    libpq reads the password from PGPASSWORD or the password file instead.
+    """
+    params = parse_dsn(dsn)
+
+    if params.get('password') == _MASKED_PASSWORD:
+        del params['password']
+
+    return make_dsn(**params)
+
+
+class Psycopg2CopyConnection:
+    """
+    Dedicated psycopg2 connection for `COPY ... FROM STDIN`, which asynchronous connections (e.g. of aiopg) can't run.
+
+    Its blocking calls run in the default executor. The transaction is committed on exit, or rolled back on error.
+    """
+
+    def __init__(self, dsn: str):
+        self._dsn = dsn
+        self._connection = None
+
+    @staticmethod
+    async def _run(func, *args):
+        return await asyncio.get_event_loop().run_in_executor(None, functools.partial(func, *args))
+
+    async def __aenter__(self):
+        if psycopg2 is None:
+            raise ImportError('psycopg2 is required for COPY')
+
+        self._connection = await self._run(psycopg2.connect, self._dsn)
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        connection, self._connection = self._connection, None
+
+        try:
+            if exc_type is None:
+                await self._run(connection.commit)
+        finally:
+            # closing the connection rolls back a transaction left open
+            await self._run(connection.close)
+
+    async def copy_expert(self, statement: str, stream):
+        await self._run(self._copy_expert, statement, stream)
+
+    def _copy_expert(self, statement: str, stream):
+        with self._connection.cursor() as cursor:
+            cursor.copy_expert(statement, stream)
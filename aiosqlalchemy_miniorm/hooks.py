@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of executed queries, see `BaseModelManager.add_hook()`.
+"""
+import hashlib
+
+
+class _Lazy:
+    """
+    Renders the result of `func` only when formatted, i.e. when a log record is emitted.
+    """
+
+    __slots__ = ('func',)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __str__(self):
+        return str(self.func())
+
+
+class QueryEvent:
+    """
+    A query executed by a model manager, passed to every `QueryHook` callback.
+
+    `acquire_wait` is the time spent waiting for a pooled connection (None for queries of a transaction),
+    `execution_time` and `rowcount` are set once the query has run. The statement, its fingerprint and
+    its parameter count are only computed when read.
+    """
+
+    __slots__ = ('model_manager', 'sql', 'fetch', 'acquire_wait', 'execution_time', 'rowcount', 'prepared',
+                 '_statement', '_params')
+
+    def __init__(self, model_manager, sql, fetch, acquire_wait=None):
+        self.model_manager = model_manager
+        self.sql = sql
+        self.fetch = fetch
+        self.acquire_wait = acquire_wait
+        self.execution_time = None
+        self.rowcount = None
+        self.prepared = None
+        self._statement = None
+        self._params = None
+
+    @property
+    def model(self):
+        return self.model_manager.row_class
+
+    def _compile(self):
+        if self._statement is not None:
+            return
+
+        prepared = self.prepared or (self.sql,)
+
+        if len(prepared) > 1:
+            self._statement, self._params = prepared
+        else:
+            compiled = prepared[0].compile(dialect=self.model_manager.engine.dialect)
+            self._statement, self._params = str(compiled), compiled.params
+
+    @property
+    def statement(self):
+        """
+        SQL text of the query with parameter placeholders.
+        """
+        self._compile()
+
+        return self._statement
+
+    @property
+    def params(self):
+        self._compile()
+
+        return self._params
+
+    @property
+    def param_count(self):
+        return len(self.params or ())
+
+    @property
+    def shape(self):
+        """
+        Hashable key of the statement regardless of its parameters, when known without compiling it:
+        the text of a statement from the statement cache or the shape of the query, None otherwise.
+        """
+        if self.prepared is not None and len(self.prepared) > 1:
+            return self.prepared[0]
+
+        return getattr(self.sql, 'shape', None)
+
+    @property
+    def log_statement(self):
+        """
+        `statement` for a log record: the text of a prepared statement as is, statements still to be compiled
+        are only compiled when the record is emitted.
+        """
+        if self.prepared is None:
+            return self.sql
+
+        if len(self.prepared) > 1 or isinstance(self.prepared[0], str):
+            return self.prepared[0]
+
+        return _Lazy(lambda: self.statement)
+
+    @property
+    def fingerprint(self):
+        """
+        Short digest of `statement`, the same for every execution of a query regardless of its parameters.
+        """
+        return hashlib.sha1(self.statement.encode()).hexdigest()[:16]
+
+
+class QueryHook:
+    """
+    Base class of query hooks, override the callbacks of interest.
+
+    Callbacks run synchronously around `connection.execute()`, errors they raise are logged and ignored.
+    """
+
+    def before_execute(self, event: QueryEvent):
+        pass
+
+    def after_execute(self, event: QueryEvent):
+        pass
+
+    def on_error(self, event: QueryEvent, error: Exception):
+        pass
@@ -1,244 +1,1888 @@
 # -*- coding: utf-8 -*-
+import array
+import asyncio
+import base64
+import functools
 import collections
+import collections.abc
+import inspect
+import io
+import itertools
+import json
 import logging
+import operator
+import sys
+import time
+
+from sqlalchemy import ARRAY, and_, any_, cast, func, literal, or_, select, text, tuple_, union_all
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.declarative import DeclarativeMeta, declarative_base
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, ClauseElement
+from sqlalchemy.sql.expression import Executable
+from sqlalchemy.sql.selectable import SelectBase
+
+from .arrays import ArrayBuilder
+from .cache import LRUCache, SharedFutures
+from .copy import AsyncIterator, Psycopg2CopyConnection, get_copy_dsn, get_row_encoder
+from .hooks import QueryEvent
+from .pool import AcquireContextManager, AcquireTimeoutError, get_pool_stats, get_timeout_ms
+from .stats import QueryStatsRegistry
+
+
+try:
+    from psycopg2.extensions import QueryCanceledError
+except ImportError:  # pragma: no cover
+    QueryCanceledError = None
 
-from sqlalchemy.ext.declarative import DeclarativeMeta
 
+logger = logging.getLogger('aiosqlalchemy_miniorm')
+
+# the constructor `declarative_base()` gives to models without their own `__init__`, its module is private
+_declarative_constructor = declarative_base().__init__
+
+
+class StatementTimeoutError(asyncio.TimeoutError):
+    """
+    A query ran longer than its `timeout` (see `BaseModelManager.run_query()`).
+    """
+
+
+class classproperty(object):
+    def __init__(self, func):
+        self.func = func
+
+    def __get__(self, instance, instance_cls=None):
+        return self.func(instance_cls)
+
+
+OrderBy = collections.namedtuple('OrderBy', ['field', 'order'])
+
+_CompiledStatement = collections.namedtuple(
+    '_CompiledStatement', ['statement', 'compiled', 'bind_names', 'processors', 'result_columns']
+)
+
+# statement shape tokens are built from these attributes, all other element types are not cached
+_SHAPE_ATTRIBUTES = {
+    'binary': ('operator', 'negate'),
+    'bindparam': ('unique',),
+    'clauselist': ('operator', 'group', 'group_contents'),
+    'column': ('table', 'name', 'is_literal'),
+    'false': (),
+    'function': ('name', 'packagenames'),
+    'grouping': (),
+    'null': (),
+    'true': (),
+    'unary': ('operator', 'modifier'),
+}
+
+_NOT_CACHEABLE = object()
+
+
+def _shape_value(value):
+    if isinstance(value, list):
+        return tuple(value)
+
+    # custom operators are compared by their SQL, each `op()` call creates a new one
+    if isinstance(value, operators.custom_op):
+        return (
+            operators.custom_op, value.opstring, value.precedence, value.is_comparison,
+            value.natural_self_precedent, value.eager_grouping,
+        )
+
+    # quoting of a name is not part of its string value
+    if isinstance(value, str):
+        return value, getattr(value, 'quote', None)
+
+    return value
+
+
+def _type_shape(type_):
+    # bind processors of arrays depend on their item type
+    item_type = getattr(type_, 'item_type', None)
+
+    return type(type_) if item_type is None else (type(type_), _type_shape(item_type))
+
+
+def _clause_shape(clause):
+    """
+    Returns `(shape, binds)` of a where clause: a hashable structure that ignores bound values,
+    and the bind parameters in traversal order. Returns `(None, None)` for unsupported elements.
+    """
+    shape = []
+    binds = []
+    stack = collections.deque([clause])
+
+    while stack:
+        element = stack.popleft()
+        attributes = _SHAPE_ATTRIBUTES.get(getattr(element, '__visit_name__', None))
+
+        if attributes is None:
+            return None, None
+
+        children = element.get_children()
+        token = [type(element), len(children)]
+
+        for attr in attributes:
+            token.append(_shape_value(getattr(element, attr, None)))
+
+        if isinstance(element, BindParameter):
+            token.append(_type_shape(element.type))
+            # parameters that are not unique are rendered and shared by their name
+            token.append(None if element.unique else element.key)
+            binds.append(element)
+        elif element.__visit_name__ == 'binary' and element.modifiers:
+            token.append(tuple(sorted((key, _shape_value(value)) for key, value in element.modifiers.items())))
+
+        shape.append(tuple(token))
+        stack.extend(children)
+
+    return tuple(shape), binds
+
+
+def _compile_statement(sql, dialect, params):
+    compiled = sql.compile(dialect=dialect)
+    bind_names = []
+
+    for ref, _ in params:
+        name = compiled.bind_names.get(ref) if isinstance(ref, BindParameter) else ref
+
+        if not isinstance(name, str):
+            return _NOT_CACHEABLE
+
+        bind_names.append(name)
+
+    # rows of a plain string statement are neither keyed nor processed by the column types, see `_process_result()`
+    result_columns = {
+        name: (getattr(objects[0], 'key', None) or name if objects else name, type_)
+        for name, _, objects, type_ in compiled._result_columns
+    }
+
+    return _CompiledStatement(
+        str(compiled), compiled, tuple(bind_names), compiled._bind_processors, result_columns
+    )
+
+
+def _process_result(result_proxy, compiled_statement):
+    """
+    Returns the result of a cached statement with its rows keyed and processed like the ones of a compiled one.
+    """
+    description = getattr(getattr(result_proxy, 'cursor', None), 'description', None)
+
+    if not description or not compiled_statement.result_columns:
+        return result_proxy
+
+    dialect = compiled_statement.compiled.dialect
+    keys = []
+    processors = []
+
+    for name, type_code, *_ in description:
+        key, type_ = compiled_statement.result_columns.get(name, (name, None))
+        keys.append(key)
+        # processors may depend on the type of the result column, e.g. of numerics
+        processors.append(None if type_ is None else type_._cached_result_processor(dialect, type_code))
+
+    if not any(processors) and all(key == column[0] for key, column in zip(keys, description)):
+        return result_proxy
+
+    return _ProcessedResultProxy(result_proxy, keys, processors)
+
+
+async def _gather_bounded(coroutines, concurrency):
+    """
+    Runs coroutines with at most `concurrency` of them at a time, results are in input order.
+    When one fails the others are cancelled before the error is raised.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(coroutine):
+        try:
+            async with semaphore:
+                return await coroutine
+        finally:
+            # coroutines cancelled while waiting for the semaphore were never started
+            coroutine.close()
+
+    tasks = [asyncio.ensure_future(run(coroutine)) for coroutine in coroutines]
+
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def _cancel_task(task):
+    """
+    Cancels `task` and waits until it has finished its cleanup, its result or error is dropped.
+    """
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def _encode_page_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def _decode_page_cursor(cursor, num_values):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError('Invalid page cursor `{}`'.format(cursor))
+
+    if not isinstance(values, list) or len(values) != num_values:
+        raise ValueError('Invalid page cursor `{}`'.format(cursor))
+
+    return values
+
+
+def _rows_to_tuples(keys: list, rows: list):
+    if not keys:
+        return [() for _ in rows]
+
+    if len(keys) == 1:
+        return [(row[0],) for row in rows]
+
+    # rows are indexed by position, no intermediate dict is built
+    get_values = operator.itemgetter(*range(len(keys)))
+
+    return [get_values(row) for row in rows]
+
+
+@functools.lru_cache(maxsize=256)
+def _get_namedtuple_type(keys: tuple):
+    return collections.namedtuple('Row', keys, rename=True)
+
+
+def _rows_to_namedtuples(keys: list, rows: list):
+    make = _get_namedtuple_type(tuple(keys))._make
+
+    return [make(values) for values in _rows_to_tuples(keys, rows)]
+
+
+def _rows_to_columns(keys: list, rows: list):
+    columns = zip(*_rows_to_tuples(keys, rows)) if rows else [()] * len(keys)
+
+    return collections.OrderedDict((key, list(values)) for key, values in zip(keys, columns))
+
+
+def _to_array(values: list):
+    # only homogeneous int or float columns without NULLs fit into an array
+    if values and all(type(value) is int for value in values):
+        typecode = 'q'
+    elif values and all(type(value) is float for value in values):
+        typecode = 'd'
+    else:
+        return values
+
+    try:
+        return array.array(typecode, values)
+    except OverflowError:
+        return values
+
+
+def _rows_to_arrays(keys: list, rows: list):
+    columns = _rows_to_columns(keys, rows)
+
+    for key, values in columns.items():
+        columns[key] = _to_array(values)
+
+    return columns
+
+
+class _DeclareCursor(Executable, ClauseElement):
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+
+
+@compiles(_DeclareCursor)
+def _compile_declare_cursor(element, compiler, **kw):
+    return 'DECLARE {} NO SCROLL CURSOR FOR {}'.format(element.name, compiler.process(element.sql, **kw))
+
+
+class _Explain(Executable, ClauseElement):
+    def __init__(self, sql):
+        self.sql = sql
+
+
+@compiles(_Explain)
+def _compile_explain(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) {}'.format(compiler.process(element.sql, **kw))
+
+
+def _get_plan_rows(plan):
+    """
+    Returns the planner's row estimate from the output of `EXPLAIN (FORMAT JSON)`.
+    """
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class _ProcessedRow(collections.abc.Mapping):
+    """
+    Row of a cached statement, read by column key, position or attribute like the driver rows.
+    """
+    __slots__ = ('_keys', '_positions', '_values')
+
+    def __init__(self, keys: tuple, positions: dict, values: tuple):
+        self._keys = keys
+        self._positions = positions
+        self._values = values
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, slice)):
+            return self._values[key]
+
+        return self._values[self._positions[key]]
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._values)
+
+    __hash__ = None
+
+    def __eq__(self, other):
+        if isinstance(other, _ProcessedRow):
+            return self._values == other._values
+
+        if isinstance(other, collections.abc.Sequence):
+            return self._values == tuple(other)
+
+        return super().__eq__(other)
+
+    def as_tuple(self):
+        return self._values
+
+    def __repr__(self):
+        return repr(self._values)
+
+
+class _ProcessedResultProxy:
+    """
+    Result of a cached statement whose rows are keyed and processed by its result columns, see `_process_result()`.
+    """
+
+    def __init__(self, result_proxy, keys: list, processors: list):
+        self._result_proxy = result_proxy
+        self._keys = tuple(keys)
+        self._positions = {key: index for index, key in enumerate(self._keys)}
+        self._processors = processors
+
+    def __getattr__(self, item):
+        return getattr(self._result_proxy, item)
+
+    def keys(self):
+        return self._keys
+
+    def _process_row(self, row):
+        values = tuple(
+            value if processor is None else processor(value)
+            for processor, value in zip(self._processors, (row[index] for index in range(len(self._keys))))
+        )
+
+        return _ProcessedRow(self._keys, self._positions, values)
+
+    async def fetchall(self):
+        return [self._process_row(row) for row in await self._result_proxy.fetchall()]
+
+    async def fetchmany(self, *args):
+        return [self._process_row(row) for row in await self._result_proxy.fetchmany(*args)]
+
+    async def fetchone(self):
+        row = await self._result_proxy.fetchone()
+
+        return None if row is None else self._process_row(row)
+
+    async def first(self):
+        row = await self._result_proxy.first()
+
+        return None if row is None else self._process_row(row)
+
+    async def scalar(self):
+        row = await self.first()
+
+        return None if row is None else row[0]
+
+
+class Query:
+    """
+    Statement under construction for a single call.
+
+    Queries are immutable: every builder method returns a new query, so one model manager
+    can be shared by any number of concurrent coroutines.
+
+    Queries started with a `shape` track the structure of the statement and its bound values,
+    so the model manager can reuse the compiled statement for every query of the same shape.
+    """
+
+    def __init__(self, model_manager, sql, shape=None, params=(), timeout: float=None):
+        self.model_manager = model_manager
+        self.sql = sql
+        self.shape = shape
+        self.params = params
+        self.timeout = timeout
+
+    def __str__(self):
+        return str(self.sql)
+
+    def get_sql(self):
+        assert self.sql is not None, 'sql attribute is not defined'
+
+        return self.sql
+
+    def set_sql(self, sql, shape=None, params=()):
+        return type(self)(self.model_manager, sql, shape, params, self.timeout)
+
+    def with_timeout(self, timeout: float=None):
+        """
+        Limits the execution of the query to `timeout` seconds, see `BaseModelManager.run_query()`.
+        """
+        if timeout is None:
+            return self
+
+        return type(self)(self.model_manager, self.sql, self.shape, self.params, timeout)
+
+    def _extend(self, sql, shape=None, params=()):
+        if self.shape is None or shape is None:
+            return self.set_sql(sql)
+
+        return self.set_sql(sql, self.shape + (shape,), self.params + tuple(params))
+
+    def where(self, where_list: list=None):
+        if not where_list:
+            return self
+
+        query = self
+
+        for where in where_list:
+            sql = query.get_sql().where(where)
+
+            if query.shape is None:
+                query = query.set_sql(sql)
+                continue
+
+            shape, binds = _clause_shape(where)
+            query = query._extend(sql, shape, [(bind, bind.effective_value) for bind in binds or ()])
+
+        return query
+
+    def order_by(self, order_by: list=None):
+        if not order_by:
+            return self
+
+        model_manager = self.model_manager
+        sql = self.get_sql()
+
+        for item in order_by:
+            assert isinstance(item, OrderBy), 'Order items should be instances of OrderBy class'
+            assert item.order in model_manager.SORT_ORDERS, 'Unknown sort order `{}`'.format(item.order)
+            order_column = model_manager.table.columns[item.field]
+
+            if item.order == model_manager.SORT_DOWN:
+                order_column = order_column.desc()
+            else:
+                order_column = order_column.asc()
+
+            sql = sql.order_by(order_column)
+
+        return self._extend(sql, ('order_by',) + tuple(order_by))
+
+    def offset(self, offset: int=0):
+        if offset > 0:
+            sql = self.get_sql().offset(offset)
+
+            return self._extend(sql, ('offset',), [(getattr(sql, '_offset_clause', None), offset)])
+
+        return self
+
+    def limit(self, limit: int=None):
+        sql = self.get_sql().limit(limit)
+
+        if limit is None:
+            return self._extend(sql, ('limit', False))
+
+        return self._extend(sql, ('limit', True), [(getattr(sql, '_limit_clause', None), limit)])
+
+    def values(self, *args, **kwargs):
+        sql = self.get_sql().values(*args, **kwargs)
+
+        if args or any(isinstance(value, ClauseElement) for value in kwargs.values()):
+            return self.set_sql(sql)
+
+        return self._extend(sql, ('values',) + tuple(sorted(kwargs)), sorted(kwargs.items()))
+
+    def returning(self, *cols):
+        return self._extend(self.get_sql().returning(*cols), ('returning',) + cols)
+
+    async def fetchall(self):
+        return await self.model_manager.fetchall(self)
+
+    async def fetchone(self):
+        return await self.model_manager.fetchone(self)
+
+    async def scalar(self):
+        return await self.model_manager.scalar(self)
+
+    async def rowcount(self):
+        return await self.model_manager.rowcount(self)
+
+    async def fetch(self, fetch):
+        return await self.model_manager.run_query(sql=self, fetch=fetch)
+
+
+class BaseModelManager:
+    FETCH_ALL = 'fetchall'
+    FETCH_ONE = 'fetchone'
+    FETCH_ROW_COUNT = 'rowcount'
+    FETCH_SCALAR = 'scalar'
+    FETCH_TUPLES = 'tuples'
+    FETCH_NAMEDTUPLES = 'namedtuples'
+    FETCH_COLUMNS = 'columns'
+    FETCH_ARRAYS = 'arrays'
+
+    ROW_SHAPES = {
+        FETCH_TUPLES: _rows_to_tuples,
+        FETCH_NAMEDTUPLES: _rows_to_namedtuples,
+        FETCH_COLUMNS: _rows_to_columns,
+        FETCH_ARRAYS: _rows_to_arrays,
+    }
+
+    SORT_UP = 'asc'
+    SORT_DOWN = 'desc'
+
+    SORT_ORDERS = (SORT_UP, SORT_DOWN)
+
+    TOTAL_COUNT_LABEL = '_total_count'
+
+    # estimated counts below this are recounted exactly
+    count_estimate_threshold = 100000
+
+    query_class = Query
+    statement_cache = LRUCache(maxsize=1024)
+    pk_cache = None
+    count_cache = None
+    hooks = ()
+    acquire_timeout = None
+    statement_timeout = None
+    stats_registry = None
+
+    bulk_max_params = 10000
+    bulk_concurrency = 4
+    gather_concurrency = 4
+
+    load_batch_size = 1000
+    load_window = 0
+
+    coalesce_reads = False
+
+    copy_dsn = None
+
+    table = None
+    row_class = None
+
+    def __init__(self, table, row_class):
+        self.row_class = row_class
+        self.table = table
+        self.transaction_connection = None
+        self.identity_map = None
+        self._pk_cache_invalidations = set()
+        self._count_cache_invalidated = False
+        self._loads = SharedFutures()
+        self._pending_loads = collections.OrderedDict()
+        self._load_handle = None
+        self._inflight_reads = SharedFutures()
+
+    @property
+    def engine(self):
+        return self.table.bind
+
+    @classmethod
+    async def fetch_from_result_proxy(cls, result_proxy, fetch):
+        """
+        Besides `ResultProxy` attributes, `fetch` may be one of the `ROW_SHAPES`: `FETCH_TUPLES` and
+        `FETCH_NAMEDTUPLES` return a list of tuples or namedtuples (the type is cached per set of columns),
+        `FETCH_COLUMNS` returns an ordered dict of column lists, and `FETCH_ARRAYS` turns its int and
+        float columns without NULLs into `array.array`.
+        """
+        if fetch in cls.ROW_SHAPES:
+            rows = await result_proxy.fetchall()
+
+            return cls.ROW_SHAPES[fetch](result_proxy.keys(), rows)
+
+        if not hasattr(result_proxy, fetch):
+            raise AttributeError('ResultProxy has no attribute {}'.format(fetch))
+
+        result = getattr(result_proxy, fetch)
+
+        if callable(result):
+            result = await result()
+
+        return result
+
+    def transaction(self, identity_map=False):
+        """
+        Usage:
+            async with SomeModel.objects.transaction() as some_model_objects:
+                await some_model_objects.do_some_stuff()
+                await some_model_objects.do_another_stuff()
+
+        With `identity_map` set, instances are kept in an identity map until the transaction ends (see `session()`).
+
+        Note: Transactions are not cross-models.
+        """
+        return _TransactionContextManager(self.new_instance(), identity_map=identity_map)
+
+    def session(self):
+        """
+        Usage:
+            async with SomeModel.objects.session() as some_model_objects:
+                obj = await some_model_objects.get_instance([SomeModel.c.id == 1])
+                assert obj is await some_model_objects.get_instance([SomeModel.c.id == 1])
+
+        Instances loaded or inserted through the session manager are kept in its identity map by primary key:
+        a row loaded again refreshes and returns the same instance, and `get_instance()` by primary key
+        returns it without a query. Columns assigned but not saved yet are not refreshed.
+        Instances are bound to the session manager, their `update()` and `delete()` keep the identity map up to date.
+        """
+        return _SessionContextManager(self.new_instance())
+
+    def _get_materializer(self, keys: tuple):
+        if isinstance(self.row_class, type) and issubclass(self.row_class, RowModel):
+            return self.row_class._get_materializer(keys)
+
+        return None
+
+    def _make_instance(self, values: dict):
+        materializer = self._get_materializer(tuple(values))
+
+        if materializer is not None:
+            return materializer(tuple(values.values()))
+
+        instance = self.row_class(**values)
+
+        if isinstance(instance, RowModel):
+            instance._mark_clean()
+
+        return instance
+
+    def _build_instance(self, row):
+        values = dict(row)
+
+        if self.identity_map is None or values.get(self._pk_column.key) is None:
+            return self._make_instance(values)
+
+        key = (self.row_class, values[self._pk_column.key])
+        instance = self.identity_map.get(key)
+
+        if instance is None:
+            instance = self._make_instance(values)
+            instance.model_manager = self
+            self.identity_map[key] = instance
+        else:
+            # columns assigned but not saved yet keep their value, they are still to be saved
+            changed_keys = instance._changed_keys
+            values = {key: value for key, value in values.items() if key not in changed_keys}
+            instance._set_values(values)
+            instance._mark_clean(values)
+
+        return instance
+
+    def _get_lookup_pk(self, where_list: list=None):
+        """
+        Returns the primary key value if `where_list` is a lone `pk_column == value` condition, else None.
+        """
+        if not where_list or len(where_list) != 1:
+            return None
+
+        clause = where_list[0]
+
+        if not isinstance(clause, BinaryExpression) or clause.operator is not operators.eq:
+            return None
+
+        if clause.left is not self._pk_column or not isinstance(clause.right, BindParameter):
+            return None
+
+        return clause.right.effective_value
+
+    def _materialize(self, rows: list, keys: tuple=None):
+        """
+        Builds `row_class` instances from result rows, mappings or sequences ordered as `keys`.
+
+        Declarative models are built by their precompiled materializer (see `RowModel._get_materializer()`),
+        other row classes and identity-mapped managers go through `_build_instance()` row by row.
+        """
+        if not rows:
+            return []
+
+        is_mapping = isinstance(rows[0], collections.abc.Mapping)
+        materializer = None
+
+        if self.identity_map is None:
+            materializer = self._get_materializer(tuple(rows[0]) if is_mapping else keys)
+
+        if materializer is None:
+            return [self._build_instance(row if is_mapping else zip(keys, row)) for row in rows]
+
+        if not is_mapping:
+            return [materializer(row) for row in rows]
+
+        keys = tuple(rows[0])
+
+        if len(keys) == 1:
+            return [materializer((row[keys[0]],)) for row in rows]
+
+        get_values = operator.itemgetter(*keys)
+
+        return [materializer(get_values(row)) for row in rows]
+
+    def _identity_map_get(self, where_list: list=None):
+        if self.identity_map is None:
+            return None
+
+        return self.identity_map.get((self.row_class, self._get_lookup_pk(where_list)))
+
+    def _identity_map_update(self, pk, values: dict):
+        if self.identity_map is None:
+            return
+
+        instance = self.identity_map.pop((self.row_class, pk), None)
+
+        if instance is not None:
+            instance._set_values(values)
+            instance._mark_clean(values)
+            self.identity_map[(self.row_class, instance._pk_value)] = instance
+
+    def _identity_map_discard(self, pk):
+        if self.identity_map is not None:
+            self.identity_map.pop((self.row_class, pk), None)
+
+    def _invalidate_pk_cache(self, where_list: list=None, pk=None):
+        """
+        Drops the cached row of `pk` (or of the primary key looked up by `where_list`),
+        or all the cached rows of the table if neither is known.
+        """
+        if self.pk_cache is None:
+            return
+
+        if pk is None:
+            pk = self._get_lookup_pk(where_list)
+
+        if pk is None:
+            self.pk_cache.discard_group(self.table)
+        else:
+            self.pk_cache.pop((self.table, pk))
+
+        # until the transaction ends concurrent readers may cache the old row again
+        if self.transaction_connection:
+            self._pk_cache_invalidations.add(pk)
+
+    def _invalidate_count_cache(self):
+        """
+        Drops all the cached counts of the table.
+        """
+        if self.count_cache is None:
+            return
+
+        self.count_cache.discard_group(self.table)
+
+        if self.transaction_connection:
+            self._count_cache_invalidated = True
+
+    def _flush_cache_invalidations(self):
+        pks, self._pk_cache_invalidations = self._pk_cache_invalidations, set()
+
+        for pk in pks:
+            self._invalidate_pk_cache(pk=pk)
+
+        if self._count_cache_invalidated:
+            self._count_cache_invalidated = False
+            self._invalidate_count_cache()
+
+    async def run_query(self, sql, fetch=FETCH_ALL, timeout: float=None):
+        """
+        With `coalesce_reads` set, identical selects running at the same time outside of a transaction
+        are executed once and share their result, which should then be treated as read-only.
+        Only queries with a shape and hashable values are coalesced (see `_get_query_key()`).
+
+        `timeout` (the one of the query, see `Query.with_timeout()`, or `statement_timeout` by default) limits
+        the query to that many seconds, connection acquire included, see `_run_timed_query()`.
+        `StatementTimeoutError` is raised when it is exceeded.
+        """
+        if timeout is None:
+            timeout = sql.timeout if isinstance(sql, Query) else None
+
+        if timeout is None:
+            timeout = self.statement_timeout
+
+        if timeout is not None:
+            return await self._run_query_with_timeout(sql, fetch, timeout)
+
+        if self.transaction_connection:
+            return await self.run_query_with_connection(self.transaction_connection, sql, fetch)
+
+        if self.coalesce_reads:
+            fingerprint = self._get_read_fingerprint(sql, fetch)
+
+            if fingerprint is not None:
+                return await self._run_coalesced_query(fingerprint, sql, fetch)
+
+        return await self._run_pooled_query(sql, fetch)
+
+    def _get_query_key(self, sql):
+        """
+        Returns a key of a query and its bound values, None for statements without a shape
+        or with unhashable values (e.g. lists or arrays).
+
+        Queries of the same shape share their statement (see `prepare_statement()`), so nothing is compiled.
+        Values are compared along with their types, e.g. `1` and `True` give different keys.
+        """
+        if not isinstance(sql, Query) or sql.shape is None:
+            return None
+
+        values = tuple((type(value), value) for _, value in sql.params)
+
+        try:
+            hash(values)
+        except TypeError:
+            return None
+
+        return sql.shape, values
+
+    def _get_read_fingerprint(self, sql, fetch):
+        """
+        Returns the key of a select (see `_get_query_key()`) with its fetch mode, None for other statements.
+        """
+        if fetch == self.FETCH_ROW_COUNT or not isinstance(sql, Query) or not isinstance(sql.sql, SelectBase):
+            return None
+
+        key = self._get_query_key(sql)
+
+        return None if key is None else (fetch,) + key
+
+    async def _run_query_with_timeout(self, sql, fetch, timeout: float):
+        if self.transaction_connection:
+            run = self._run_timed_query(self.transaction_connection, sql, fetch, timeout)
+        else:
+            fingerprint = self._get_read_fingerprint(sql, fetch) if self.coalesce_reads else None
+
+            if fingerprint is not None:
+                run = self._run_coalesced_query(fingerprint + (timeout,), sql, fetch, timeout)
+            else:
+                run = self._run_pooled_query(sql, fetch, timeout)
+
+        # unlike `asyncio.wait_for()` before Python 3.7, the cancelled query is awaited so the connection
+        # is reset or closed before the error is raised
+        task = asyncio.ensure_future(run)
+
+        try:
+            await asyncio.wait((task,), timeout=timeout)
+        except asyncio.CancelledError:
+            await _cancel_task(task)
+            raise
+
+        if not task.done():
+            await _cancel_task(task)
+            raise StatementTimeoutError('Query did not complete within {}s'.format(timeout))
+
+        try:
+            return task.result()
+        except AcquireTimeoutError:
+            raise
+        except asyncio.TimeoutError:
+            raise StatementTimeoutError('Query did not complete within {}s'.format(timeout))
+
+    async def _run_timed_query(self, connection, sql, fetch, timeout: float, acquire_wait: float=None):
+        """
+        Runs the query with `statement_timeout` set on the server: by `SET LOCAL` inside a transaction,
+        on pooled connections it is already set by `acquire()`.
+
+        A query cancelled by the client deadline is also cancelled on the server by the driver.
+        """
+        in_transaction = connection is self.transaction_connection
+
+        try:
+            if in_transaction:
+                await connection.execute('SET LOCAL statement_timeout = {:d}'.format(get_timeout_ms(timeout)))
+
+            result = await self.run_query_with_connection(connection, sql, fetch, acquire_wait=acquire_wait)
+        except asyncio.CancelledError as e:
+            # aiopg turns the server-side cancellation into CancelledError
+            if QueryCanceledError is not None and isinstance(e.__context__, QueryCanceledError):
+                raise StatementTimeoutError('Query did not complete within {}s'.format(timeout))
+            raise
+        except Exception as e:
+            if QueryCanceledError is not None and isinstance(e, QueryCanceledError):
+                raise StatementTimeoutError('Query did not complete within {}s'.format(timeout))
+            raise
+
+        # a failed query aborts the transaction, otherwise later queries of the transaction get the default back
+        if in_transaction:
+            await connection.execute('SET LOCAL statement_timeout = DEFAULT')
+
+        return result
+
+    async def _run_coalesced_query(self, fingerprint, sql, fetch, timeout: float=None):
+        future, _ = self._inflight_reads.get_or_start(fingerprint, lambda: self._run_pooled_query(sql, fetch, timeout))
+
+        return await SharedFutures.wait(future)
+
+    async def _run_pooled_query(self, sql, fetch, timeout: float=None):
+        acquire_cm = self.acquire(statement_timeout=timeout)
+
+        async with acquire_cm as connection:
+            if timeout is None:
+                return await self.run_query_with_connection(connection, sql, fetch, acquire_wait=acquire_cm.wait)
+
+            return await self._run_timed_query(connection, sql, fetch, timeout, acquire_wait=acquire_cm.wait)
+
+    def acquire(self, statement_timeout: float=None):
+        """
+        Acquires a pooled connection, recording its wait in `pool_stats()`.
+
+        With `acquire_timeout` set, `AcquireTimeoutError` is raised when no connection is released in time.
+
+        The connection has `statement_timeout` (in seconds) set on its session unless it is None,
+        it is reset to the default before the connection is released to the pool.
+        """
+        return AcquireContextManager(self.engine, self.acquire_timeout, statement_timeout)
+
+    def pool_stats(self):
+        """
+        Returns the pool gauges (`size`, `maxsize`, `free`, `in_use`, `waiting`) and the acquire counters
+        and wait times of the engine, shared by all the managers of its tables.
+        """
+        engine = self.engine
+
+        return get_pool_stats(engine).as_dict(engine)
+
+    def prepare_statement(self, sql):
+        """
+        Returns arguments for `connection.execute()`.
+
+        Queries with a known shape are compiled once per shape and cached in `statement_cache`,
+        later queries of the same shape only bind their own parameters. Their result rows are still
+        processed by the column types when run by the manager, e.g. into `Decimal` or `UUID`.
+        """
+        return self._prepare(sql)[0]
+
+    def _get_compiled_statement(self, sql):
+        """
+        Returns the cached `_CompiledStatement` of a query, None for statements compiled on every execution.
+        """
+        if not isinstance(sql, Query) or sql.shape is None or self.statement_cache is None:
+            return None
+
+        statement_cache = self.statement_cache
+        dialect = self.engine.dialect
+        key = (dialect, sql.shape)
+        compiled_statement = statement_cache.get(key)
+
+        if compiled_statement is None:
+            compiled_statement = _compile_statement(sql.get_sql(), dialect, sql.params)
+            statement_cache.set(key, compiled_statement)
+        elif compiled_statement is _NOT_CACHEABLE:
+            # the shape is known, but its statements are still compiled on every execution
+            statement_cache.hits -= 1
+            statement_cache.misses += 1
+
+        if compiled_statement is _NOT_CACHEABLE:
+            return None
+
+        return compiled_statement
+
+    def _prepare(self, sql):
+        """
+        Returns the arguments for `connection.execute()` and the cached `_CompiledStatement` of `sql` or None.
+        """
+        compiled_statement = self._get_compiled_statement(sql)
+
+        if compiled_statement is None:
+            return ((sql.get_sql() if isinstance(sql, Query) else sql),), None
+
+        params = compiled_statement.compiled.construct_params(
+            dict(zip(compiled_statement.bind_names, (value for _, value in sql.params)))
+        )
+        processors = compiled_statement.processors
+
+        for key in processors.keys() & params.keys():
+            params[key] = processors[key](params[key])
+
+        return (compiled_statement.statement, params), compiled_statement
+
+    async def run_query_with_connection(self, connection, sql, fetch=FETCH_ALL, acquire_wait: float=None):
+        if self.hooks:
+            return await self._run_hooked_query(connection, sql, fetch, acquire_wait)
+
+        prepared = None
+
+        try:
+            prepared, compiled_statement = self._prepare(sql)
+            result_proxy = await connection.execute(*prepared)
+
+            if compiled_statement is not None:
+                result_proxy = _process_result(result_proxy, compiled_statement)
+
+            return await self.fetch_from_result_proxy(result_proxy, fetch)
+        except Exception as e:
+            event = QueryEvent(self, sql, fetch, acquire_wait)
+            event.prepared = prepared
+            logger.error('Execution of "%s" sql fails with "%s".', event.log_statement, e)
+            raise
+
+    async def _run_hooked_query(self, connection, sql, fetch, acquire_wait: float=None):
+        event = QueryEvent(self, sql, fetch, acquire_wait)
+        started_at = None
+
+        try:
+            event.prepared, compiled_statement = self._prepare(sql)
+            self._call_hooks('before_execute', event)
+            started_at = time.monotonic()
+            result_proxy = await connection.execute(*event.prepared)
+
+            if compiled_statement is not None:
+                result_proxy = _process_result(result_proxy, compiled_statement)
+
+            result = await self.fetch_from_result_proxy(result_proxy, fetch)
+        except Exception as e:
+            if started_at is not None:
+                event.execution_time = time.monotonic() - started_at
+
+            # the statement compiled for the log is shared with the hooks
+            logger.error('Execution of "%s" sql fails with "%s".', event.log_statement, e)
+            self._call_hooks('on_error', event, e)
+            raise
+
+        event.execution_time = time.monotonic() - started_at
+        event.rowcount = result_proxy.rowcount
+        self._call_hooks('after_execute', event)
+
+        return result
+
+    def _call_hooks(self, name: str, *args):
+        for hook in self.hooks:
+            try:
+                getattr(hook, name)(*args)
+            except Exception:
+                logger.exception('Query hook %r fails in %s().', hook, name)
+
+    @classmethod
+    def add_hook(cls, hook):
+        """
+        Registers a `QueryHook` called around every query of the managers of this class and its subclasses,
+        e.g. `BaseModelManager.add_hook(MetricsHook())` for all the models.
+        """
+        cls._own_hooks = cls.__dict__.get('_own_hooks', ()) + (hook,)
+        cls._update_hooks()
+
+    @classmethod
+    def remove_hook(cls, hook):
+        cls._own_hooks = tuple(item for item in cls.__dict__.get('_own_hooks', ()) if item is not hook)
+        cls._update_hooks()
+
+    @classmethod
+    def enable_stats(cls, registry: QueryStatsRegistry=None):
+        """
+        Starts collecting the stats of the queries of this class and its subclasses (see `stats()`),
+        returns the registry, e.g. for `registry.to_prometheus()`.
+        """
+        if cls.stats_registry is not None:
+            cls.remove_hook(cls.stats_registry)
+
+        cls.stats_registry = registry if registry is not None else QueryStatsRegistry()
+        cls.add_hook(cls.stats_registry)
+
+        return cls.stats_registry
+
+    def stats(self):
+        """
+        Returns the stats of the queries of the model by descending total time, e.g. `SomeModel.objects.stats()`.
+        """
+        if self.stats_registry is None:
+            return []
+
+        return self.stats_registry.get_stats(model=self.row_class)
+
+    @classmethod
+    def _update_hooks(cls):
+        # `hooks` is kept resolved on every class so running a query only checks a tuple
+        classes = [cls]
+
+        while classes:
+            manager_class = classes.pop()
+            manager_class.hooks = tuple(
+                hook for base in reversed(manager_class.__mro__) for hook in base.__dict__.get('_own_hooks', ())
+            )
+            classes.extend(manager_class.__subclasses__())
+
+    async def fetchall(self, sql):
+        return await self.run_query(sql=sql, fetch=self.FETCH_ALL)
+
+    async def fetchone(self, sql):
+        return await self.run_query(sql=sql, fetch=self.FETCH_ONE)
+
+    async def scalar(self, sql):
+        return await self.run_query(sql=sql, fetch=self.FETCH_SCALAR)
+
+    async def rowcount(self, sql):
+        return await self.run_query(sql=sql, fetch=self.FETCH_ROW_COUNT)
+
+    @property
+    def _pk_column(self):
+        return self.table.primary_key.columns.values()[0]
+
+    def set_sql(self, sql, shape=None):
+        """
+        Starts a new query, e.g. `SomeModel.objects.set_sql(SomeModel.table.select()).limit(10).fetchall()`.
+
+        `shape` identifies the base statement for the statement cache, queries without it are compiled
+        on every execution.
+        """
+        return self.query_class(self, sql, shape)
+
+    async def get_item(self, where_list: list=None, timeout: float=None):
+        """
+        With `pk_cache` set, rows looked up by primary key outside of a transaction are read through the cache.
+        """
+        query = self.set_sql(self.table.select(), shape=(self.table, 'select'))\
+            .where(where_list)\
+            .with_timeout(timeout)
+
+        if self.pk_cache is None or self.transaction_connection:
+            return await query.fetchone()
+
+        pk = self._get_lookup_pk(where_list)
+
+        if pk is None:
+            return await query.fetchone()
+
+        return await self.pk_cache.get_or_load((self.table, pk), query.fetchone)
+
+    async def get_instance(self, where_list: list=None, timeout: float=None):
+        instance = self._identity_map_get(where_list)
+
+        if instance is not None:
+            return instance
+
+        row_proxy = await self.get_item(where_list, timeout=timeout)
+
+        if row_proxy:
+            return self._build_instance(row_proxy)
+
+        return None
+
+    def _split_chunks(self, values: list, max_params: int=None):
+        chunk_size = max(1, (max_params or self.bulk_max_params) // len(values[0]))
+
+        return [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+
+    async def gather(self, *coroutines_or_queries, concurrency: int=None):
+        """
+        Usage:
+            items, total = await SomeModel.objects.gather(
+                SomeModel.objects.get_items(limit=10),
+                SomeModel.objects.count(),
+            )
+
+        Runs independent coroutines and queries (`Query` objects and statements, fetched with `fetchall()`)
+        in parallel, each on its own pooled connection, with at most `concurrency` (`gather_concurrency`
+        by default) at a time so a single caller can't drain the pool. Returns their results in order.
+
+        When one fails the others are cancelled before the error is raised. Inside `transaction()`
+        they run one after another on the transaction connection.
+        """
+        coroutines = []
+
+        for item in coroutines_or_queries:
+            if isinstance(item, Query):
+                coroutines.append(item.fetchall())
+            elif isinstance(item, ClauseElement):
+                coroutines.append(self.fetchall(item))
+            elif inspect.iscoroutine(item):
+                coroutines.append(item)
+            else:
+                for coroutine in itertools.chain(coroutines, filter(inspect.iscoroutine, coroutines_or_queries)):
+                    coroutine.close()
+
+                raise TypeError('Expected a coroutine, a Query or a statement, got {!r}'.format(item))
+
+        if self.transaction_connection:
+            concurrency = 1
+
+        return await _gather_bounded(coroutines, concurrency or self.gather_concurrency)
+
+    async def _run_chunks(self, run_chunk, chunks: list, concurrency: int=None):
+        if len(chunks) > 1 and not self.transaction_connection:
+            return await _gather_bounded(
+                [run_chunk(chunk) for chunk in chunks],
+                concurrency or self.bulk_concurrency
+            )
+
+        results = []
+
+        for chunk in chunks:
+            results.append(await run_chunk(chunk))
+
+        return results
+
+    async def _insert_chunk(self, values: list, fetch=True):
+        query = self.set_sql(self.table.insert())\
+            .values(values)
+
+        if not fetch:
+            return await query.rowcount()
+        else:
+            rows = await query.returning(*self.table.columns).fetchall()
+
+            return self._materialize(rows)
+
+    async def bulk_insert(self, values: list, fetch=True, max_params: int=None, concurrency: int=None, atomic=True):
+        """
+        Inserts rows by chunks of at most `max_params` bound parameters (`bulk_max_params` by default).
+
+        Chunks run one after another within a single transaction, so either all the rows are inserted or none.
+        Unless inside `transaction()`, non-`atomic` chunks run concurrently on up to `concurrency` pooled
+        connections (`bulk_concurrency` by default) instead: the chunks inserted before a failing one stay committed.
+
+        Returns `row_class` instances in input order, or the number of inserted rows if `fetch` is False.
+        """
+        if not values:
+            return [] if fetch else 0
+
+        chunks = self._split_chunks(values, max_params)
+
+        # a single statement is atomic on its own
+        if atomic and len(chunks) > 1 and not self.transaction_connection:
+            async with self.transaction() as model_mgr:
+                return await model_mgr.bulk_insert(values, fetch=fetch, max_params=max_params)
+
+        results = await self._run_chunks(lambda chunk: self._insert_chunk(chunk, fetch), chunks, concurrency)
+        self._invalidate_count_cache()
+
+        if not fetch:
+            return sum(results)
+
+        return list(itertools.chain.from_iterable(results))
+
+    async def _upsert_chunk(self, values: list, conflict_columns: list, update_columns: list, fetch=True):
+        sql = postgresql.insert(self.table).values(values)
+
+        if update_columns:
+            sql = sql.on_conflict_do_update(
+                index_elements=conflict_columns,
+                set_={key: sql.excluded[key] for key in update_columns}
+            )
+        else:
+            sql = sql.on_conflict_do_nothing(index_elements=conflict_columns)
+
+        query = self.set_sql(sql)
+
+        if not fetch:
+            return await query.rowcount()
+        else:
+            rows = await query.returning(*self.table.columns).fetchall()
+
+            return self._materialize(rows)
+
+    async def bulk_upsert(self, values: list, conflict_columns: list=None, update_columns: list=None, fetch=True,
+                          max_params: int=None, concurrency: int=None, atomic=True):
+        """
+        Inserts rows or updates the existing ones with `INSERT ... ON CONFLICT`, one statement per chunk
+        (see `bulk_insert()` for chunking and `atomic`).
+
+        `conflict_columns` are the keys of a unique index, the primary key by default. `update_columns` are
+        overwritten on conflict, all the other columns of the first row by default; with no columns left
+        conflicting rows are skipped. Rows of one chunk should not conflict with each other.
+
+        Returns inserted and updated `row_class` instances, or their number if `fetch` is False.
+        """
+        if not values:
+            return [] if fetch else 0
+
+        if conflict_columns is None:
+            conflict_columns = [column.key for column in self.table.primary_key.columns]
+
+        if update_columns is None:
+            update_columns = [key for key in values[0] if key not in conflict_columns]
+
+        chunks = self._split_chunks(values, max_params)
+
+        if atomic and len(chunks) > 1 and not self.transaction_connection:
+            async with self.transaction() as model_mgr:
+                return await model_mgr.bulk_upsert(values, conflict_columns=conflict_columns,
+                                                   update_columns=update_columns, fetch=fetch, max_params=max_params)
+
+        results = await self._run_chunks(
+            lambda chunk: self._upsert_chunk(chunk, conflict_columns, update_columns, fetch),
+            chunks,
+            concurrency
+        )
+        self._invalidate_pk_cache()
+        self._invalidate_count_cache()
+
+        if not fetch:
+            return sum(results)
+
+        return list(itertools.chain.from_iterable(results))
+
+    def _get_update_source(self, rows: list, keys: list):
+        types = [self.table.columns[key].type for key in keys]
+
+        if any(isinstance(type_, ARRAY) for type_ in types):
+            # arrays can't be nested and unnest would flatten them, rows are sent one select each
+            return union_all(*[
+                select([cast(literal(row[key], type_), type_).label(key) for key, type_ in zip(keys, types)])
+                for row in rows
+            ])
+
+        # every column is sent as a single typed array and zipped back into rows by unnest
+        columns = []
+
+        for key, type_ in zip(keys, types):
+            array_type = postgresql.ARRAY(type_)
+            array = cast(literal([row[key] for row in rows], array_type), array_type)
+            columns.append(func.unnest(array).label(key))
+
+        return select(columns)
+
+    async def _update_chunk(self, rows: list, keys: list, fetch=False):
+        source = self._get_update_source(rows, keys).alias('bulk_update_values')
+        query = self.set_sql(self.table.update())\
+            .where([self.table.columns[keys[0]] == source.columns[keys[0]]])\
+            .values({key: source.columns[key] for key in keys[1:]})
+
+        if not fetch:
+            return await query.rowcount()
+        else:
+            rows = await query.returning(*self.table.columns).fetchall()
+
+            return self._materialize(rows)
+
+    async def bulk_update(self, rows: list, key: str=None, fetch=False, max_params: int=None,
+                          concurrency: int=None, atomic=True):
+        """
+        Updates rows matched by `key` (the primary key by default) with their own values,
+        one `UPDATE ... FROM (SELECT unnest(...))` statement per chunk (see `bulk_insert()` for chunking and `atomic`).
+        With ARRAY columns the rows are sent as `SELECT ... UNION ALL SELECT ...` instead.
+
+        All rows should have the same keys, `key` included.
+
+        Returns the number of updated rows, or updated `row_class` instances if `fetch` is True.
+        """
+        if not rows:
+            return [] if fetch else 0
+
+        if key is None:
+            key = self._pk_column.key
+
+        keys = set(rows[0])
+
+        if key not in keys or any(set(row) != keys for row in rows):
+            raise ValueError('All rows should have the same keys including "{}".'.format(key))
+
+        keys = [key] + sorted(keys - {key})
+
+        if len(keys) == 1:
+            return [] if fetch else 0
+
+        chunks = self._split_chunks(rows, max_params)
+
+        if atomic and len(chunks) > 1 and not self.transaction_connection:
+            async with self.transaction() as model_mgr:
+                return await model_mgr.bulk_update(rows, key=key, fetch=fetch, max_params=max_params)
+
+        results = await self._run_chunks(
+            lambda chunk: self._update_chunk(chunk, keys, fetch),
+            chunks,
+            concurrency
+        )
+        self._invalidate_pk_cache()
+        self._invalidate_count_cache()
+
+        if not fetch:
+            return sum(results)
+
+        return list(itertools.chain.from_iterable(results))
+
+    def copy_connection(self):
+        """
+        Returns an async context manager of the connection `copy_stream()` sends COPY data through:
+        a dedicated psycopg2 connection to `copy_dsn`, or to the database of the engine if it is None
+        (psycopg2 masks the password of the engine dsn, it is then read from PGPASSWORD or the password file).
+
+        The asynchronous connections of aiopg can't run COPY, so loads are not part of `transaction()`.
+        """
+        if self.transaction_connection:
+            raise RuntimeError('COPY runs on a dedicated connection, it can not be part of transaction()')
+
+        return Psycopg2CopyConnection(self.copy_dsn or get_copy_dsn(self.engine.dsn))
+
+    async def copy_stream(self, connection, statement: str, stream):
+        """
+        Sends `stream`, a binary file-like object with COPY data, to the server through `connection`.
+
+        Override it along with `copy_connection()` to use the COPY API of another driver.
+        """
+        await connection.copy_expert(statement, stream)
+
+    async def copy_in(self, rows, columns: list=None, batch_size: int=10000):
+        """
+        Loads rows with `COPY ... FROM STDIN` in text format, within one transaction of the connection
+        returned by `copy_connection()`: either all the rows are loaded or none.
+
+        `rows` is an iterable or an async iterable of dicts, or of sequences ordered as `columns`
+        (column keys, all columns except the autoincrement one by default). Values are encoded from
+        the column types and sent by batches of `batch_size` rows, so loads never have to fit in memory.
+
+        Returns the number of copied rows.
+        """
+        if columns is None:
+            autoincrement_column = self.table._autoincrement_column
+            copy_columns = [column for column in self.table.columns if column is not autoincrement_column]
+        else:
+            copy_columns = [self.table.columns[key] for key in columns]
+
+        preparer = self.engine.dialect.identifier_preparer
+        statement = 'COPY {} ({}) FROM STDIN'.format(
+            preparer.format_table(self.table),
+            ', '.join(preparer.format_column(column) for column in copy_columns)
+        )
+        encode_row = get_row_encoder(copy_columns)
 
-logger = logging.getLogger('aiosqlalchemy_miniorm')
+        if not hasattr(rows, '__aiter__'):
+            rows = AsyncIterator(rows)
 
+        num_rows = 0
+        lines = []
 
-class classproperty(object):
-    def __init__(self, func):
-        self.func = func
+        async with self.copy_connection() as connection:
+            async for row in rows:
+                lines.append(encode_row(row))
 
-    def __get__(self, instance, instance_cls=None):
-        return self.func(instance_cls)
+                if len(lines) >= batch_size:
+                    await self.copy_stream(connection, statement, io.BytesIO(''.join(lines).encode()))
+                    num_rows += len(lines)
+                    lines = []
 
+            if lines:
+                await self.copy_stream(connection, statement, io.BytesIO(''.join(lines).encode()))
+                num_rows += len(lines)
 
-OrderBy = collections.namedtuple('OrderBy', ['field', 'order'])
+        self._invalidate_count_cache()
 
+        return num_rows
 
-class BaseModelManager:
-    FETCH_ALL = 'fetchall'
-    FETCH_ONE = 'fetchone'
-    FETCH_ROW_COUNT = 'rowcount'
-    FETCH_SCALAR = 'scalar'
+    async def load(self, pk):
+        """
+        Returns the `row_class` instance of the primary key `pk`, or None.
 
-    SORT_UP = 'asc'
-    SORT_DOWN = 'desc'
+        Keys requested by concurrent coroutines within one event loop iteration (or `load_window` seconds)
+        are loaded by a single `WHERE pk = ANY(...)` query of at most `load_batch_size` keys.
+        Coroutines loading the same key while it is pending share the same instance.
+        """
+        future, started = self._loads.get_or_start(pk, asyncio.get_event_loop().create_future)
 
-    SORT_ORDERS = (SORT_UP, SORT_DOWN)
+        if started:
+            self._pending_loads[pk] = future
 
-    table = None
-    row_class = None
+            if len(self._pending_loads) >= self.load_batch_size:
+                self._flush_loads()
+            elif self._load_handle is None:
+                loop = asyncio.get_event_loop()
 
-    def __init__(self, table, row_class):
-        self.row_class = row_class
-        self.sql = None
-        self.table = table
-        self.transaction_connection = None
+                if self.load_window:
+                    self._load_handle = loop.call_later(self.load_window, self._flush_loads)
+                else:
+                    self._load_handle = loop.call_soon(self._flush_loads)
 
-    @property
-    def engine(self):
-        return self.table.bind
+        return await SharedFutures.wait(future)
 
-    @staticmethod
-    async def fetch_from_result_proxy(result_proxy, fetch):
-        if not hasattr(result_proxy, fetch):
-            raise AttributeError('ResultProxy has no attribute {}'.format(fetch))
+    async def load_many(self, pks: list):
+        """
+        Same as `load()` for several keys, returns instances (or None) in the order of `pks`.
+        """
+        return await asyncio.gather(*[self.load(pk) for pk in pks])
 
-        result = getattr(result_proxy, fetch)
+    def _flush_loads(self):
+        if self._load_handle is not None:
+            self._load_handle.cancel()
+            self._load_handle = None
 
-        if callable(result):
-            result = await result()
+        futures, self._pending_loads = self._pending_loads, collections.OrderedDict()
 
-        return result
+        if futures:
+            asyncio.ensure_future(self._load_batch(futures))
 
-    def transaction(self):
-        """
-        Usage:
-            async with SomeModel.objects.transaction() as some_model_objects:
-                await some_model_objects.do_some_stuff()
-                await some_model_objects.do_another_stuff()
+    async def _load_batch(self, futures: dict):
+        pk_column = self._pk_column
+        array_type = postgresql.ARRAY(pk_column.type)
+        where = pk_column == any_(cast(literal(list(futures), array_type), array_type))
 
-        Note: Transactions are not cross-models.
-        """
-        return _TransactionContextManager(self.new_instance())
+        try:
+            rows = await self.get_items(where_list=[where])
+        except asyncio.CancelledError:
+            for future in futures.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
 
-    async def run_query(self, sql=None, fetch=FETCH_ALL):
-        if sql is None:
-            sql = self.get_sql()
+        instances = {row[pk_column.key]: instance for row, instance in zip(rows, self._materialize(rows))}
 
-        if self.transaction_connection:
-            return await self.run_query_with_connection(self.transaction_connection, sql, fetch)
+        for pk, future in futures.items():
+            if not future.done():
+                future.set_result(instances.get(pk))
+
+    async def insert(self, fetch=True, timeout: float=None, **values):
+        query = self.set_sql(self.table.insert(), shape=(self.table, 'insert')) \
+            .values(**values) \
+            .with_timeout(timeout)
+
+        if fetch:
+            row = await query.returning(*self.table.columns).fetchone()
+            self._invalidate_inserted_pk(dict(row))
+            self._invalidate_count_cache()
+
+            return self._build_instance(row)
         else:
-            async with self.engine.acquire() as connection:
-                return await self.run_query_with_connection(connection, sql, fetch)
+            result = await query.scalar()
+            self._invalidate_inserted_pk(values)
+            self._invalidate_count_cache()
 
-    async def run_query_with_connection(self, connection, sql=None, fetch=FETCH_ALL):
-        try:
-            result_proxy = await connection.execute(sql)
-            self.set_sql(None)
+            return result
 
-            return await self.fetch_from_result_proxy(result_proxy, fetch)
-        except Exception as e:
-            logger.error('Execution of "%s" sql fails with "%s".', sql, e)
-            raise
+    def _invalidate_inserted_pk(self, values: dict):
+        if self.pk_cache is not None and values.get(self._pk_column.key) is not None:
+            self._invalidate_pk_cache(pk=values[self._pk_column.key])
 
-    async def fetchall(self, sql=None):
-        return await self.run_query(sql=sql, fetch=self.FETCH_ALL)
+    async def update(self, where_list: list=None, fetch=False, timeout: float=None, **values):
+        query = self.set_sql(self.table.update(), shape=(self.table, 'update')) \
+            .where(where_list) \
+            .values(**values) \
+            .with_timeout(timeout)
 
-    async def fetchone(self, sql=None):
-        return await self.run_query(sql=sql, fetch=self.FETCH_ONE)
+        if fetch:
+            rows = await query.returning(*self.table.columns).fetchall()
+            self._invalidate_pk_cache(where_list)
+            self._invalidate_count_cache()
 
-    async def scalar(self, sql=None):
-        return await self.run_query(sql=sql, fetch=self.FETCH_SCALAR)
+            return self._materialize(rows)
+        else:
+            row_count = await query.rowcount()
+            self._invalidate_pk_cache(where_list)
+            self._invalidate_count_cache()
 
-    async def rowcount(self, sql=None):
-        return await self.run_query(sql=sql, fetch=self.FETCH_ROW_COUNT)
+            return row_count
 
-    @property
-    def _pk_column(self):
-        return self.table.primary_key.columns.values()[0]
+    async def delete(self, where_list: list=None, timeout: float=None):
+        row_count = await self.set_sql(self.table.delete(), shape=(self.table, 'delete'))\
+            .where(where_list)\
+            .with_timeout(timeout)\
+            .rowcount()
+        self._invalidate_pk_cache(where_list)
+        self._invalidate_count_cache()
 
-    def get_sql(self):
-        assert self.sql is not None, 'sql attribute is not defined'
+        return row_count
 
-        return self.sql
+    async def get_items(self, query=None, where_list: list=None, limit: int=None, offset: int=0, order_by: list=None,
+                        fetch: str=FETCH_ALL, timeout: float=None):
+        """
+        `fetch` may be one of the `ROW_SHAPES` (see `fetch_from_result_proxy()`) for cheaper results on large reads.
 
-    def set_sql(self, sql):
-        self.sql = sql
+        `timeout` limits the query to that many seconds (see `run_query()`), like in the other high-level methods.
+        """
+        if query is None:
+            base_query = self.set_sql(self.table.select(), shape=(self.table, 'select'))
+        else:
+            base_query = self.set_sql(query)
 
-        return self
+        query = base_query \
+            .where(where_list) \
+            .order_by(order_by) \
+            .offset(offset) \
+            .limit(limit) \
+            .with_timeout(timeout)
 
-    def where(self, where_list: list=None):
-        if where_list:
-            for where in where_list:
-                self.sql = self.get_sql().where(where)
+        if fetch == self.FETCH_ALL:
+            return await query.fetchall()
 
-        return self
+        return await query.fetch(fetch)
 
-    def order_by(self, order_by: list=None):
-        if order_by:
-            for item in order_by:
-                assert isinstance(item, OrderBy), 'Order items should be instances of OrderBy class'
-                assert item.order in self.SORT_ORDERS, 'Unknown sort order `{}`'.format(item.order)
-                order_column = self.table.columns[item.field]
-
-                if item.order == self.SORT_DOWN:
-                    order_column = order_column.desc()
-                else:
-                    order_column = order_column.asc()
+    async def get_instances(self, where_list: list=None, limit: int=None, offset: int=0, order_by: list=None,
+                            fetch: str=None, timeout: float=None):
+        """
+        With `fetch` set to one of the `ROW_SHAPES`, rows are returned in that shape instead of `row_class` instances.
+        """
+        if fetch is not None:
+            return await self.get_items(where_list=where_list, limit=limit, offset=offset, order_by=order_by,
+                                        fetch=fetch, timeout=timeout)
 
-                self.sql = self.get_sql().order_by(order_column)
+        rows = await self.get_items(where_list=where_list, limit=limit, offset=offset, order_by=order_by,
+                                    timeout=timeout)
 
-        return self
+        return self._materialize(rows)
 
-    def offset(self, offset: int=0):
-        if offset > 0:
-            self.sql = self.get_sql().offset(offset)
+    def _keyset_order_by(self, order_by: list=None):
+        order_by = list(order_by or [])
+        pk_key = self._pk_column.key
 
-        return self
+        # the primary key makes the sort order total, so no row is skipped or repeated between pages
+        if all(item.field != pk_key for item in order_by):
+            order = order_by[-1].order if order_by else self.SORT_UP
+            order_by.append(OrderBy(field=pk_key, order=order))
 
-    def limit(self, limit: int=None):
-        self.sql = self.get_sql().limit(limit)
+        return order_by
 
-        return self
+    def _keyset_after(self, column, order: str, bound):
+        """
+        Returns the condition of the rows sorted after `bound` by `column`, None if there are none.
 
-    def values(self, *args, **kwargs):
-        self.set_sql(self.get_sql().values(*args, **kwargs))
-        return self
+        PostgreSQL sorts NULLs last in ascending order and first in descending order.
+        """
+        if order == self.SORT_DOWN:
+            return column.isnot(None) if bound is None else column < bound
 
-    def returning(self, *cols):
-        self.set_sql(self.get_sql().returning(*cols))
-        return self
+        if bound is None:
+            return None
 
-    async def get_item(self, where_list: list=None):
-        self.set_sql(self.table.select())\
-            .where(where_list)
+        return or_(column > bound, column.is_(None)) if column.nullable else column > bound
 
-        return await self.fetchone()
+    def _keyset_where(self, order_by: list, values: list):
+        columns = [self.table.columns[item.field] for item in order_by]
+        bounds = [
+            None if value is None else literal(value, type_=column.type) for column, value in zip(columns, values)
+        ]
+        orders = {item.order for item in order_by}
 
-    async def get_instance(self, where_list: list=None):
-        row_proxy = await self.get_item(where_list)
+        # rows are compared as a whole only if none of their values can be NULL
+        if all(not column.nullable for column in columns) and None not in values:
+            if orders == {self.SORT_UP}:
+                return tuple_(*columns) > tuple_(*bounds)
 
-        if row_proxy:
-            return self.row_class(**dict(row_proxy))
+            if orders == {self.SORT_DOWN}:
+                return tuple_(*columns) < tuple_(*bounds)
 
-        return None
+        clauses = []
 
-    async def bulk_insert(self, values: list, fetch=True):
-        self.set_sql(self.table.insert())\
-            .values(values)
+        for index, item in enumerate(order_by):
+            after = self._keyset_after(columns[index], item.order, bounds[index])
 
-        if fetch:
-            self.returning(*self.table.columns)
+            if after is None:
+                continue
 
-        if not fetch:
-            return await self.rowcount()
-        else:
-            rows = await self.fetchall()
+            equals = [
+                column.is_(None) if bound is None else column == bound
+                for column, bound in zip(columns[:index], bounds[:index])
+            ]
+            clauses.append(and_(*equals + [after]))
 
-            return [self.row_class(**dict(row)) for row in rows]
+        return or_(*clauses)
 
-    async def insert(self, fetch=True, **values):
-        self.set_sql(self.table.insert()) \
-            .values(**values)
+    async def get_items_page(self, limit: int, order_by: list=None, cursor: str=None, where_list: list=None):
+        """
+        Keyset pagination: instead of `OFFSET` the next page starts right after the sort values of the last row,
+        so every page costs the same regardless of depth.
 
-        if fetch:
-            self.returning(*self.table.columns)
-            row = await self.fetchone()
+        The primary key is appended to `order_by` when missing. Returns `(rows, next_cursor)`,
+        `next_cursor` is an opaque string for the next call and None on the last page.
+        Rows with NULL sort values are paged in the PostgreSQL order: last ascending, first descending.
 
-            return self.row_class(**dict(row))
-        else:
-            return await self.scalar()
+        Usage:
+            rows, cursor = await SomeModel.objects.get_items_page(20, order_by=[OrderBy('created_at', 'desc')])
+            rows, cursor = await SomeModel.objects.get_items_page(20, order_by=[...], cursor=cursor)
+        """
+        order_by = self._keyset_order_by(order_by)
+        where_list = list(where_list or [])
+
+        if cursor is not None:
+            where_list.append(self._keyset_where(order_by, _decode_page_cursor(cursor, len(order_by))))
+
+        rows = await self.get_items(where_list=where_list, order_by=order_by, limit=limit + 1)
+        next_cursor = None
+
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_page_cursor([rows[-1][item.field] for item in order_by])
+
+        return rows, next_cursor
+
+    async def get_instances_page(self, limit: int, order_by: list=None, cursor: str=None, where_list: list=None):
+        rows, next_cursor = await self.get_items_page(limit, order_by=order_by, cursor=cursor, where_list=where_list)
+
+        return self._materialize(rows), next_cursor
+
+    async def get_items_with_total(self, where_list: list=None, limit: int=None, offset: int=0,
+                                   order_by: list=None, timeout: float=None):
+        """
+        Returns `(rows, total)`: a page of rows and the number of rows matching `where_list` regardless of
+        `limit` and `offset`, both read by a single query with `count(*) OVER ()`.
+
+        Rows are returned as dicts without the count column. A page past the last row carries no count,
+        it is then read by a separate `count()` query.
+        """
+        label = self.TOTAL_COUNT_LABEL
+        base_query = self.set_sql(
+            select([self.table, func.count().over().label(label)]),
+            shape=(self.table, 'select_with_total'),
+        )
 
-    async def update(self, where_list: list=None, fetch=False, **values):
-        self.set_sql(self.table.update()) \
+        rows = await base_query \
             .where(where_list) \
-            .values(**values)
+            .order_by(order_by) \
+            .offset(offset) \
+            .limit(limit) \
+            .with_timeout(timeout) \
+            .fetchall()
 
-        if fetch:
-            self.returning(*self.table.columns)
-            rows = await self.fetchall()
+        if not rows:
+            total = await self.count(where_list=where_list, timeout=timeout) if offset > 0 else 0
 
-            return [self.row_class(**dict(row)) for row in rows] if rows else []
-        else:
-            return await self.rowcount()
+            return [], total
+
+        total = rows[0][label]
+        keys = [key for key in rows[0].keys() if key != label]
 
-    async def delete(self, where_list: list=None):
-        self.set_sql(self.table.delete())\
-            .where(where_list)
+        return [{key: row[key] for key in keys} for row in rows], total
 
-        return await self.rowcount()
+    async def get_instances_with_total(self, where_list: list=None, limit: int=None, offset: int=0,
+                                       order_by: list=None, timeout: float=None):
+        rows, total = await self.get_items_with_total(where_list=where_list, limit=limit, offset=offset,
+                                                      order_by=order_by, timeout=timeout)
 
-    async def get_items(self, query=None, where_list: list=None, limit: int=None, offset: int=0, order_by: list=None):
+        return self._materialize(rows), total
+
+    def iterate_items(self, query=None, where_list: list=None, order_by: list=None, batch_size: int=1000):
+        """
+        Iterates over rows fetched by batches from a server-side cursor, so memory usage
+        does not depend on the number of rows.
+
+        Usage:
+            async with SomeModel.objects.iterate_items(where_list=[...]) as rows:
+                async for row in rows:
+                    await do_some_stuff(row)
+
+        Plain `async for` works as well, but leaving the loop early keeps the connection
+        until the iterator is closed with `await rows.close()`.
+        Inside `transaction()` the cursor is declared on the transaction connection.
+        """
         base_query = query if query is not None else self.table.select()
-        self.set_sql(base_query) \
+        sql = self.set_sql(base_query) \
             .where(where_list) \
             .order_by(order_by) \
-            .offset(offset) \
-            .limit(limit)
+            .get_sql()
+
+        return _CursorIterator(self, sql, batch_size)
 
-        return await self.fetchall()
+    async def fetch_numpy(self, query=None, dtype_overrides: dict=None, structured=False, batch_size: int=10000):
+        """
+        Reads the rows of `query` (a select of the whole table by default) from a server-side cursor
+        straight into NumPy arrays, batch by batch.
+
+        Dtypes follow the SQLAlchemy types of the selected columns (see `arrays.get_dtype()`),
+        `dtype_overrides` maps column keys to other dtypes.
 
-    async def get_instances(self, where_list: list=None, limit: int=None, offset: int=0, order_by: list=None):
-        result = []
-        rows = await self.get_items(where_list=where_list, limit=limit, offset=offset, order_by=order_by)
+        Returns a dict of arrays by column key, or a structured array if `structured` is set. Requires NumPy.
+        """
+        if isinstance(query, Query):
+            query = query.get_sql()
 
-        for row in rows:
-            result.append(self.row_class(**dict(row)))
+        sql = self.table.select() if query is None else query
+        builder = ArrayBuilder(list(sql.columns), dtype_overrides, capacity=batch_size)
 
-        return result
+        async with _CursorIterator(self, sql, batch_size) as cursor:
+            rows = await cursor.next_batch()
+
+            while rows:
+                builder.append(_rows_to_tuples(builder.dtype.names, rows))
+                rows = await cursor.next_batch()
+
+        return builder.get_array() if structured else builder.get_columns()
+
+    def iterate_instances(self, where_list: list=None, order_by: list=None, batch_size: int=1000):
+        """
+        Same as `iterate_items()`, but yields `row_class` instances.
+        """
+        sql = self.set_sql(self.table.select()) \
+            .where(where_list) \
+            .order_by(order_by) \
+            .get_sql()
+
+        return _CursorIterator(self, sql, batch_size, materialize=True)
+
+    async def count(self, query=None, where_list: list=None, estimate: bool=False, timeout: float=None):
+        """
+        With `estimate`, the count is taken from the statistics instead of scanning the table:
+        `pg_class.reltuples` without `where_list`, the planner's row estimate otherwise.
+        Estimates below `count_estimate_threshold` are replaced by an exact count.
+
+        With `count_cache` set, exact counts without `query` are read through the cache outside of a transaction,
+        keyed by the shape and the values of the filter (see `_get_query_key()`, other filters are not cached).
+        Writes through the manager of the table drop its cached counts.
+        """
+        if estimate:
+            if query is not None:
+                raise ValueError('Estimated counts are not supported for custom queries')
 
-    async def count(self, query=None, where_list: list=None):
-        base_query = query if query is not None else self.table.count()
+            estimated_count = await self.estimate_count(where_list=where_list, timeout=timeout)
 
-        self.set_sql(base_query)\
-            .where(where_list)
+            if estimated_count >= self.count_estimate_threshold:
+                return estimated_count
 
-        return await self.scalar()
+        cached = self.count_cache is not None and query is None and not self.transaction_connection
+
+        if query is None:
+            base_query = self.set_sql(self.table.count(), shape=(self.table, 'count'))
+        else:
+            base_query = self.set_sql(query)
+
+        query = base_query\
+            .where(where_list)\
+            .with_timeout(timeout)
+
+        key = self._get_query_key(query) if cached else None
+
+        if key is None:
+            return await query.scalar()
+
+        return await self.count_cache.get_or_load((self.table,) + key, query.scalar)
+
+    async def estimate_count(self, where_list: list=None, timeout: float=None):
+        """
+        Returns the estimated number of rows, as of the last `ANALYZE` of the table.
+
+        The estimate is negative for a table that has never been analyzed on PostgreSQL 14+.
+        """
+        if not where_list:
+            table_name = self.engine.dialect.identifier_preparer.format_table(self.table)
+            sql = text('SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table_name AS regclass)')\
+                .bindparams(table_name=table_name)
+
+            return await self.set_sql(sql).with_timeout(timeout).scalar()
+
+        sql = self.set_sql(self.table.select())\
+            .where(where_list)\
+            .get_sql()
+        plan = await self.set_sql(_Explain(sql)).with_timeout(timeout).scalar()
+
+        return _get_plan_rows(plan)
 
     def new_instance(self):
         return type(self)(table=self.table, row_class=self.row_class)
@@ -264,6 +1908,17 @@ class RowModel:
             cls.model_manager = cls.__model_manager_class__(table=cls.__table__, row_class=cls)
         return super().__new__(cls)
 
+    def __getattr__(self, item):
+        # instances built by a materializer get their SQLAlchemy state on first use, e.g. by `check()`
+        if item != '_sa_instance_state' or '_lazy_state' not in self.__dict__:
+            raise AttributeError(item)
+
+        class_manager = type(self)._sa_class_manager
+        state = class_manager._state_constructor(self, class_manager)
+        self.__dict__[item] = state
+
+        return state
+
     def __iter__(self):
         for col in self.columns:
             yield col.key, getattr(self, col.key)
@@ -287,6 +1942,57 @@ class RowModel:
     def pk_column(cls):
         return list(cls.table.primary_key)[0]
 
+    @classmethod
+    def _get_column_keys(cls):
+        column_keys = cls.__dict__.get('_column_keys')
+
+        if column_keys is None:
+            column_keys = frozenset(column.key for column in cls.columns)
+            type.__setattr__(cls, '_column_keys', column_keys)
+
+        return column_keys
+
+    @classmethod
+    def _get_materializer(cls, keys: tuple):
+        """
+        Returns a function building an instance from a sequence of values ordered as column `keys`.
+
+        Values go straight to the instance `__dict__`: the declarative constructor is skipped and
+        the SQLAlchemy instance state is only created when needed. Returns None for models with
+        their own `__init__`, which has to run.
+        """
+        materializers = cls.__dict__.get('_materializers')
+
+        if materializers is None:
+            class_manager = getattr(cls, '_sa_class_manager', None)
+
+            if class_manager is None or class_manager.original_init is not _declarative_constructor:
+                return None
+
+            # instances built by the declarative constructor would configure the mappers on their own
+            configure_mappers()
+            materializers = {}
+            type.__setattr__(cls, '_materializers', materializers)
+
+        materializer = materializers.get(keys)
+
+        if materializer is None:
+            new = cls.__new__
+
+            def materializer(values):
+                instance = new(cls)
+                instance_dict = instance.__dict__
+                clean_values = dict(zip(keys, values))
+                instance_dict.update(clean_values)
+                instance_dict['_clean_values'] = clean_values
+                instance_dict['_lazy_state'] = True
+
+                return instance
+
+            materializers[keys] = materializer
+
+        return materializer
+
     @property
     def _pk_value(self):
         return getattr(self, self.pk_column.key)
@@ -308,6 +2014,58 @@ class RowModel:
             if col.key in values and values[col.key] != self._get_value(col.key):
                 setattr(self, col.key, values[col.key])
 
+    @property
+    def _changed_keys(self):
+        """
+        Columns assigned since the instance was loaded, inserted or saved (see `_mark_clean()`), or marked
+        with `mark_changed()`. For an instance created with the constructor, these are the columns it was given.
+
+        Values are compared by identity with the saved ones, so assignments cost nothing to track.
+        """
+        instance_dict = self.__dict__
+        clean_values = instance_dict.get('_clean_values', {})
+        changed_keys = {
+            key for key in self._get_column_keys()
+            if key in instance_dict and (key not in clean_values or instance_dict[key] is not clean_values[key])
+        }
+        changed_keys.update(instance_dict.get('_marked_keys', ()))
+
+        return changed_keys
+
+    def _mark_clean(self, keys=None):
+        """
+        Marks `keys` (all the columns by default) as saved in the database.
+        """
+        instance_dict = self.__dict__
+
+        if keys is None:
+            keys = self._get_column_keys()
+            instance_dict['_clean_values'] = {}
+
+        clean_values = instance_dict.setdefault('_clean_values', {})
+        marked_keys = instance_dict.get('_marked_keys', set())
+
+        for key in keys:
+            if key in instance_dict:
+                clean_values[key] = instance_dict[key]
+
+            marked_keys.discard(key)
+
+    def mark_changed(self, *keys):
+        """
+        Marks columns changed in place, e.g. `obj.data['key'] = 1` on a JSON column, to be updated by `save()`.
+        """
+        self.__dict__.setdefault('_marked_keys', set()).update(keys)
+
+    def _get_changed_values(self):
+        changed_keys = self._changed_keys
+        pk_key = self.pk_column.key
+
+        return {
+            col.key: getattr(self, col.key) for col in self.columns
+            if col.key != pk_key and col.key in changed_keys
+        }
+
     def check(self):
         if self._sa_instance_state._deleted:
             raise Exception("You can't save or update deleted row")
@@ -315,16 +2073,49 @@ class RowModel:
     async def insert(self):
         res = await self.model_manager.insert(**self._get_values())
         self._set_values(dict(res))
+        self._mark_clean()
 
         return self
 
     async def update(self, **kwargs):
         self.check()
-        where = (self.pk_column == self._pk_value)
+        pk_value = self._pk_value
+        where = (self.pk_column == pk_value)
         row_count = await self.model_manager.update(where_list=[where], fetch=False, **kwargs)
 
         if row_count:
             self._set_values(kwargs)
+            self._mark_clean(kwargs)
+            self.model_manager._identity_map_update(pk_value, kwargs)
+
+        return self
+
+    async def save(self):
+        """
+        Updates only the columns changed since the instance was loaded, inserted or saved,
+        does nothing if none changed. For an instance created with the constructor, these are
+        the columns it was given, e.g. `SomeModel(id=1, name='foo').save()` only updates `name`.
+
+        Only assignments are tracked: values changed in place, like a key of a JSON column or an item of
+        an ARRAY column, are saved once the column is reassigned or marked with `mark_changed()`.
+
+        Raises ValueError for an instance without a primary key value, or whose primary key was changed:
+        the row to update is matched by it.
+        """
+        pk_key = self.pk_column.key
+        pk_value = self._pk_value
+        clean_values = self.__dict__.get('_clean_values', {})
+
+        if pk_value is None:
+            raise ValueError("Can't save an instance without a primary key value, insert it instead")
+
+        if pk_key in clean_values and pk_value != clean_values[pk_key]:
+            raise ValueError("Can't save a changed primary key, update the row through the model manager instead")
+
+        values = self._get_changed_values()
+
+        if values:
+            await self.update(**values)
 
         return self
 
@@ -333,25 +2124,156 @@ class RowModel:
         where = (self.pk_column == self._pk_value)
         rowcount = await self.model_manager.delete([where])
         self._sa_instance_state._deleted = True
+        self.model_manager._identity_map_discard(self._pk_value)
 
         return rowcount
 
 
 class _TransactionContextManager:
-    def __init__(self, model_mgr):
+    def __init__(self, model_mgr, identity_map=False):
         self._model_mgr = model_mgr
+        self._identity_map = identity_map
         self._engine_acquire_cm = None
         self._transaction_cm = None
 
     async def __aenter__(self):
-        self._engine_acquire_cm = self._model_mgr.engine.acquire()
+        self._engine_acquire_cm = self._model_mgr.acquire()
         self._model_mgr.transaction_connection = await self._engine_acquire_cm.__aenter__()
         self._transaction_cm = self._model_mgr.transaction_connection.begin()
         await self._transaction_cm.__aenter__()
 
+        if self._identity_map:
+            self._model_mgr.identity_map = {}
+
         return self._model_mgr
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self._identity_map:
+            self._model_mgr.identity_map = None
+
         await self._transaction_cm.__aexit__(exc_type, exc_val, exc_tb)
         await self._engine_acquire_cm.__aexit__(exc_type, exc_val, exc_tb)
         self._model_mgr.transaction_connection = None
+        self._model_mgr._flush_cache_invalidations()
+
+
+class _SessionContextManager:
+    def __init__(self, model_mgr):
+        self._model_mgr = model_mgr
+
+    async def __aenter__(self):
+        self._model_mgr.identity_map = {}
+
+        return self._model_mgr
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._model_mgr.identity_map = None
+
+
+class _CursorIterator:
+    _cursor_ids = itertools.count(1)
+
+    def __init__(self, model_mgr, sql, batch_size, materialize=False):
+        assert batch_size > 0, 'batch_size should be positive'
+
+        self._model_mgr = model_mgr
+        self._sql = sql
+        self._batch_size = batch_size
+        self._materialize = materialize
+        self._cursor_name = 'miniorm_cursor_{}'.format(next(self._cursor_ids))
+        self._rows = collections.deque()
+        self._exhausted = False
+        self._connection = None
+        self._engine_acquire_cm = None
+        self._transaction_cm = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._rows and not self._exhausted:
+            await self._fetch_batch()
+
+        if not self._rows:
+            raise StopAsyncIteration
+
+        return self._rows.popleft()
+
+    async def __aenter__(self):
+        return self
+
+    async def next_batch(self):
+        """
+        Returns the rows left of the current batch, or of the next one; an empty list once exhausted.
+        """
+        if not self._rows and not self._exhausted:
+            await self._fetch_batch()
+
+        rows = list(self._rows)
+        self._rows.clear()
+
+        return rows
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close(exc_type, exc_val, exc_tb)
+
+    async def _open(self):
+        model_mgr = self._model_mgr
+
+        if model_mgr.transaction_connection:
+            self._connection = model_mgr.transaction_connection
+        else:
+            engine_acquire_cm = model_mgr.acquire()
+            self._connection = await engine_acquire_cm.__aenter__()
+            self._engine_acquire_cm = engine_acquire_cm
+
+            # cursors without HOLD live until the end of the transaction
+            transaction_cm = self._connection.begin()
+            await transaction_cm.__aenter__()
+            self._transaction_cm = transaction_cm
+
+        await model_mgr.run_query_with_connection(
+            self._connection, _DeclareCursor(self._cursor_name, self._sql), model_mgr.FETCH_ROW_COUNT
+        )
+
+    async def _fetch_batch(self):
+        fetch_sql = text('FETCH FORWARD {} FROM {}'.format(self._batch_size, self._cursor_name))\
+            .columns(*self._sql.columns)
+
+        try:
+            if self._connection is None:
+                await self._open()
+
+            rows = await self._model_mgr.run_query_with_connection(
+                self._connection, fetch_sql, self._model_mgr.FETCH_ALL
+            )
+        except BaseException:
+            await self.close(*sys.exc_info())
+            raise
+
+        # instances are built by batch, like the ones of `get_instances()`
+        self._rows.extend(self._model_mgr._materialize(rows) if self._materialize else rows)
+
+        if len(rows) < self._batch_size:
+            await self.close()
+
+    async def close(self, exc_type=None, exc_val=None, exc_tb=None):
+        self._exhausted = True
+        connection, self._connection = self._connection, None
+
+        if connection is None:
+            return
+
+        try:
+            # own transactions close the cursor on commit or rollback
+            if self._transaction_cm is None and exc_type is None:
+                await self._model_mgr.run_query_with_connection(
+                    connection, text('CLOSE {}'.format(self._cursor_name)), self._model_mgr.FETCH_ROW_COUNT
+                )
+        finally:
+            try:
+                if self._transaction_cm is not None:
+                    await self._transaction_cm.__aexit__(exc_type, exc_val, exc_tb)
+            finally:
+                if self._engine_acquire_cm is not None:
+                    await self._engine_acquire_cm.__aexit__(exc_type, exc_val, exc_tb)
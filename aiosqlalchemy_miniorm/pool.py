@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Timing and saturation metrics of connection pools, see `BaseModelManager.pool_stats()`.
+"""
+import asyncio
+import inspect
+import logging
+import math
+import sys
+import time
+import weakref
+
+from .stats import DEFAULT_BUCKETS, LatencyHistogram
+
+
+logger = logging.getLogger('aiosqlalchemy_miniorm')
+
+
+class AcquireTimeoutError(asyncio.TimeoutError):
+    """
+    No pooled connection was released within `BaseModelManager.acquire_timeout`.
+    """
+
+
+class PoolStats:
+    """
+    Acquire counters and wait times of a single engine, the pool gauges are read from the engine.
+    """
+
+    def __init__(self, buckets: tuple=DEFAULT_BUCKETS):
+        self.acquires = 0
+        self.timeouts = 0
+        self.waiting = 0
+        self.wait_histogram = LatencyHistogram(buckets)
+
+    def as_dict(self, engine=None):
+        histogram = self.wait_histogram
+        size = getattr(engine, 'size', None)
+        freesize = getattr(engine, 'freesize', None)
+
+        return {
+            'size': size,
+            'maxsize': getattr(engine, 'maxsize', None),
+            'free': freesize,
+            'in_use': size - freesize if size is not None and freesize is not None else None,
+            'waiting': self.waiting,
+            'acquires': self.acquires,
+            'timeouts': self.timeouts,
+            'wait_total': histogram.sum,
+            'wait_max': histogram.max,
+            'wait_p50': histogram.percentile(0.5),
+            'wait_p95': histogram.percentile(0.95),
+            'wait_p99': histogram.percentile(0.99),
+        }
+
+
+_pool_stats = weakref.WeakKeyDictionary()
+
+
+def get_pool_stats(engine):
+    """
+    Returns the `PoolStats` of `engine`, shared by every manager of its tables.
+    """
+    stats = _pool_stats.get(engine)
+
+    if stats is None:
+        stats = _pool_stats[engine] = PoolStats()
+
+    return stats
+
+
+def get_timeout_ms(timeout: float):
+    return max(1, int(math.ceil(timeout * 1000)))
+
+
+async def set_statement_timeout(connection, timeout: float=None):
+    """
+    Sets `statement_timeout` on the session of `connection`, None resets it to the default.
+
+    A connection whose setting is not known, e.g. because the statement failed or was cancelled,
+    is closed so the pool drops it.
+    """
+    try:
+        if timeout is None:
+            await connection.execute('RESET statement_timeout')
+        else:
+            await connection.execute('SET statement_timeout = {:d}'.format(get_timeout_ms(timeout)))
+    except BaseException:
+        logger.warning('Closing connection, statement_timeout could not be set.')
+        closed = connection.connection.close()
+
+        if inspect.isawaitable(closed):
+            await closed
+        raise
+
+
+class AcquireContextManager:
+    """
+    `engine.acquire()` that records its wait time (also kept as `wait`) and gives up after `timeout` seconds.
+
+    The connection is handed out with `statement_timeout` set on its session unless it is None, the setting is
+    reset before the connection is released so the pool only holds connections at the default
+    (see `set_statement_timeout()`).
+    """
+
+    def __init__(self, engine, timeout: float=None, statement_timeout: float=None):
+        self.wait = None
+        self._engine = engine
+        self._timeout = timeout
+        self._statement_timeout = statement_timeout
+        self._stats = get_pool_stats(engine)
+        self._engine_acquire_cm = None
+        self._connection = None
+
+    async def __aenter__(self):
+        stats = self._stats
+        started_at = time.monotonic()
+        engine_acquire_cm = self._engine.acquire()
+        stats.waiting += 1
+
+        try:
+            if self._timeout is None:
+                connection = await engine_acquire_cm.__aenter__()
+            else:
+                connection = await asyncio.wait_for(engine_acquire_cm.__aenter__(), self._timeout)
+        except asyncio.TimeoutError:
+            if self._timeout is None:
+                raise
+
+            stats.timeouts += 1
+            raise AcquireTimeoutError('No connection acquired within {}s'.format(self._timeout))
+        finally:
+            stats.waiting -= 1
+
+        self.wait = time.monotonic() - started_at
+        self._engine_acquire_cm = engine_acquire_cm
+        stats.acquires += 1
+        stats.wait_histogram.observe(self.wait)
+
+        if self._statement_timeout is not None:
+            try:
+                await set_statement_timeout(connection, self._statement_timeout)
+            except BaseException:
+                await engine_acquire_cm.__aexit__(*sys.exc_info())
+                raise
+
+            self._connection = connection
+
+        return connection
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if self._connection is not None:
+                await set_statement_timeout(self._connection)
+        except Exception:
+            # the connection is closed and dropped by the pool, the result of the block is kept
+            pass
+        finally:
+            self._connection = None
+            await self._engine_acquire_cm.__aexit__(exc_type, exc_val, exc_tb)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Logging of slow queries, see `SlowQueryLog`.
+"""
+import logging
+import time
+
+from .hooks import QueryEvent, QueryHook, _Lazy
+
+
+logger = logging.getLogger('aiosqlalchemy_miniorm.slow_queries')
+
+
+def redact_value(key, value):
+    """
+    Default redaction of parameters: values are replaced by their type, NULLs and booleans are kept.
+    """
+    if value is None or isinstance(value, bool):
+        return value
+
+    return '<{}>'.format(type(value).__name__)
+
+
+class SlowQueryLog(QueryHook):
+    """
+    Query hook logging queries that ran for `threshold` seconds or longer, with their fingerprint, duration,
+    row count, SQL and parameters passed through `redact` (`redact_value()` by default).
+
+    At most `rate_limit` records are logged every `interval` seconds, the number of queries left out
+    is reported by the next record.
+
+    Usage:
+        BaseModelManager.add_hook(SlowQueryLog(threshold=0.5))
+    """
+
+    def __init__(self, threshold: float=1.0, rate_limit: int=10, interval: float=60, redact=redact_value,
+                 logger: logging.Logger=logger, timer=time.monotonic):
+        self.threshold = threshold
+        self.rate_limit = rate_limit
+        self.interval = interval
+        self.redact = redact
+        self.logger = logger
+        self.timer = timer
+        self.suppressed = 0
+        self._window_started_at = None
+        self._window_records = 0
+
+    def _acquire(self):
+        now = self.timer()
+
+        if self._window_started_at is None or now - self._window_started_at >= self.interval:
+            self._window_started_at = now
+            self._window_records = 0
+
+        if self._window_records >= self.rate_limit:
+            self.suppressed += 1
+            return False
+
+        self._window_records += 1
+
+        return True
+
+    def _redact_params(self, event: QueryEvent):
+        params = event.params
+
+        if not params or self.redact is None:
+            return params
+
+        if isinstance(params, dict):
+            return {key: self.redact(key, value) for key, value in params.items()}
+
+        return [self.redact(index, value) for index, value in enumerate(params)]
+
+    def after_execute(self, event: QueryEvent):
+        if event.execution_time < self.threshold or not self.logger.isEnabledFor(logging.WARNING):
+            return
+
+        if not self._acquire():
+            return
+
+        suppressed, self.suppressed = self.suppressed, 0
+
+        self.logger.warning(
+            'Slow query %s took %.3fs, %s rows (%s slow queries not logged): %s with %s',
+            _Lazy(lambda: event.fingerprint), event.execution_time, event.rowcount, suppressed,
+            _Lazy(lambda: event.statement), _Lazy(lambda: self._redact_params(event)),
+        )
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+In-process query statistics, see `BaseModelManager.enable_stats()`.
+"""
+import bisect
+import collections
+
+from .cache import LRUCache
+from .hooks import QueryEvent, QueryHook
+
+
+# upper bounds in seconds, from 0.1ms doubling up to about 52s
+DEFAULT_BUCKETS = tuple(0.0001 * 2 ** i for i in range(20))
+
+
+class LatencyHistogram:
+    """
+    Counts of observed durations by bucket, its memory does not grow with the number of observations.
+
+    Percentiles are interpolated within their bucket, so their precision is that of the bucket bounds.
+    """
+
+    def __init__(self, buckets: tuple=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # the last count is of the durations above every bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float):
+        """
+        Returns the estimated duration below which `q` (between 0 and 1) of the observations fall.
+        """
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+
+        for index, count in enumerate(self.counts):
+            if not count or seen + count < rank:
+                seen += count
+                continue
+
+            if index == len(self.buckets):
+                return self.max
+
+            lower = self.buckets[index - 1] if index else 0.0
+            upper = min(self.buckets[index], self.max)
+
+            return lower + (upper - lower) * max(rank - seen, 0) / count
+
+        return self.max
+
+    def cumulative_counts(self):
+        """
+        Returns `(upper_bound, count of observations below it)` pairs, as Prometheus histogram buckets.
+        """
+        result = []
+        total = 0
+
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+
+class QueryStats:
+    def __init__(self, statement: str, buckets: tuple=DEFAULT_BUCKETS):
+        self.statement = statement
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.histogram = LatencyHistogram(buckets)
+
+    def record(self, execution_time: float=None, rowcount: int=None, error=False):
+        self.calls += 1
+
+        if error:
+            self.errors += 1
+
+        if execution_time is not None:
+            self.histogram.observe(execution_time)
+
+        if rowcount is not None and rowcount > 0:
+            self.rows += rowcount
+
+    def as_dict(self):
+        histogram = self.histogram
+
+        return {
+            'statement': self.statement,
+            'calls': self.calls,
+            'errors': self.errors,
+            'rows': self.rows,
+            'total_time': histogram.sum,
+            'max_time': histogram.max,
+            'mean_time': histogram.sum / histogram.count if histogram.count else None,
+            'p50': histogram.percentile(0.5),
+            'p95': histogram.percentile(0.95),
+            'p99': histogram.percentile(0.99),
+        }
+
+
+def _get_model_name(model):
+    return getattr(model, '__name__', None) or str(model)
+
+
+def _escape_label(value: str):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: collections.OrderedDict):
+    return '{' + ','.join('{}="{}"'.format(key, _escape_label(str(value))) for key, value in labels.items()) + '}'
+
+
+class QueryStatsRegistry(QueryHook):
+    """
+    Query hook accumulating `QueryStats` by `(model, statement fingerprint, fetch mode)`.
+
+    At most `max_entries` query shapes are tracked, queries of other shapes are only counted as `dropped`.
+
+    Fingerprints are kept by statement shape (see `QueryEvent.shape`), so statements from the statement cache
+    and queries of a known shape are neither compiled again nor hashed on every execution.
+    """
+
+    def __init__(self, max_entries: int=1000, buckets: tuple=DEFAULT_BUCKETS):
+        self.max_entries = max_entries
+        self.buckets = buckets
+        self.dropped = 0
+        self._entries = {}
+        self._fingerprints = LRUCache(maxsize=max(1, max_entries))
+
+    def _get_fingerprint(self, event: QueryEvent):
+        key = event.shape
+
+        if key is None:
+            key = event.statement
+
+        fingerprint = self._fingerprints.get(key)
+
+        if fingerprint is None:
+            fingerprint = event.fingerprint
+            self._fingerprints.set(key, fingerprint)
+
+        return fingerprint
+
+    def _get_entry(self, event: QueryEvent):
+        key = (event.model, self._get_fingerprint(event), event.fetch)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            if len(self._entries) >= self.max_entries:
+                self.dropped += 1
+                return None
+
+            entry = self._entries[key] = QueryStats(event.statement, self.buckets)
+
+        return entry
+
+    def after_execute(self, event: QueryEvent):
+        entry = self._get_entry(event)
+
+        if entry is not None:
+            entry.record(event.execution_time, event.rowcount)
+
+    def on_error(self, event: QueryEvent, error: Exception):
+        entry = self._get_entry(event)
+
+        if entry is not None:
+            entry.record(event.execution_time, error=True)
+
+    def get_stats(self, model=None):
+        """
+        Returns the stats of every query shape (of `model` only if given), by descending total time.
+        """
+        result = []
+
+        for (entry_model, fingerprint, fetch), entry in self._entries.items():
+            if model is not None and entry_model is not model:
+                continue
+
+            stats = entry.as_dict()
+            stats.update(model=_get_model_name(entry_model), fingerprint=fingerprint, fetch=fetch)
+            result.append(stats)
+
+        return sorted(result, key=lambda stats: stats['total_time'], reverse=True)
+
+    def clear(self):
+        self._entries.clear()
+        self._fingerprints.clear()
+        self.dropped = 0
+
+    def to_prometheus(self, prefix: str='miniorm_query'):
+        """
+        Returns the stats in the Prometheus text exposition format.
+        """
+        calls = []
+        errors = []
+        rows = []
+        max_times = []
+        durations = []
+
+        for (model, fingerprint, fetch), entry in self._entries.items():
+            labels = collections.OrderedDict([
+                ('model', _get_model_name(model)), ('fingerprint', fingerprint), ('fetch', fetch),
+            ])
+            formatted_labels = _format_labels(labels)
+
+            calls.append('{}_calls_total{} {}'.format(prefix, formatted_labels, entry.calls))
+            errors.append('{}_errors_total{} {}'.format(prefix, formatted_labels, entry.errors))
+            rows.append('{}_rows_total{} {}'.format(prefix, formatted_labels, entry.rows))
+            max_times.append('{}_duration_seconds_max{} {!r}'.format(prefix, formatted_labels, entry.histogram.max))
+
+            for bound, count in entry.histogram.cumulative_counts():
+                bucket_labels = collections.OrderedDict(labels)
+                bucket_labels['le'] = '+Inf' if bound == float('inf') else repr(bound)
+                durations.append('{}_duration_seconds_bucket{} {}'.format(prefix, _format_labels(bucket_labels), count))
+
+            durations.append('{}_duration_seconds_sum{} {!r}'.format(prefix, formatted_labels, entry.histogram.sum))
+            durations.append('{}_duration_seconds_count{} {}'.format(prefix, formatted_labels, entry.histogram.count))
+
+        lines = []
+
+        for name, type_, help_, samples in (
+            ('calls_total', 'counter', 'Executed queries.', calls),
+            ('errors_total', 'counter', 'Failed queries.', errors),
+            ('rows_total', 'counter', 'Rows returned or affected.', rows),
+            ('duration_seconds_max', 'gauge', 'Longest execution time.', max_times),
+            ('duration_seconds', 'histogram', 'Execution time.', durations),
+        ):
+            lines.append('# HELP {}_{} {}'.format(prefix, name, help_))
+            lines.append('# TYPE {}_{} {}'.format(prefix, name, type_))
+            lines.extend(samples)
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Rows per second of building model instances from result rows.
+
+Usage: python benchmarks/materialize.py [num_rows]
+"""
+import sys
+import time
+
+from sqlalchemy import Column, DateTime, Integer, Numeric, String, Text
+from sqlalchemy.ext.declarative import declarative_base
+
+from aiosqlalchemy_miniorm import RowModel, RowModelDeclarativeMeta
+
+
+BaseModel = declarative_base(cls=RowModel, metaclass=RowModelDeclarativeMeta)
+
+
+class BenchmarkEntity(BaseModel):
+    __tablename__ = 'benchmark_entity'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    description = Column(Text)
+    price = Column(Numeric)
+    num_products = Column(Integer)
+    created_at = Column(DateTime)
+
+
+def measure(build, rows):
+    started_at = time.perf_counter()
+    build(rows)
+
+    return len(rows) / (time.perf_counter() - started_at)
+
+
+def main(num_rows):
+    rows = [
+        {
+            'id': num,
+            'name': 'name {}'.format(num),
+            'description': 'description',
+            'price': num * 10,
+            'num_products': num % 7,
+            'created_at': None,
+        }
+        for num in range(num_rows)
+    ]
+    model_manager = BenchmarkEntity.objects
+
+    before = measure(lambda rows: [BenchmarkEntity(**dict(row)) for row in rows], rows)
+    after = measure(model_manager._materialize, rows)
+
+    print('row_class(**dict(row)): {:>12,.0f} rows/s'.format(before))
+    print('_materialize(rows):     {:>12,.0f} rows/s ({:.1f}x)'.format(after, after / before))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
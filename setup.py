@@ -36,6 +36,9 @@ setup(
     install_requires=[
         'sqlalchemy',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     classifiers=[
         'Programming Language :: Python',
         'Programming Language :: Python :: 3.5',
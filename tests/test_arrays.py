@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+
+import pytest
+import sqlalchemy as sa
+
+from aiosqlalchemy_miniorm.arrays import ArrayBuilder, get_dtype
+
+
+numpy = pytest.importorskip('numpy')
+
+
+class TestGetDtype:
+    @pytest.mark.parametrize('type_,expected_dtype', [
+        (sa.Boolean(), '?'),
+        (sa.Integer(), 'i8'),
+        (sa.BigInteger(), 'i8'),
+        (sa.Float(), 'f8'),
+        (sa.Numeric(), 'f8'),
+        (sa.DateTime(), 'datetime64[us]'),
+        (sa.Date(), 'datetime64[D]'),
+        (sa.Interval(), 'timedelta64[us]'),
+        (sa.String(), 'O'),
+    ])
+    def test_ok(self, type_, expected_dtype):
+        assert get_dtype(type_) == expected_dtype
+
+
+class TestArrayBuilder:
+    @staticmethod
+    @pytest.fixture
+    def fake_columns():
+        return [
+            sa.Column('id', sa.Integer),
+            sa.Column('price', sa.Float),
+            sa.Column('created_at', sa.DateTime),
+        ]
+
+    def test_ok(self, fake_columns):
+        builder = ArrayBuilder(fake_columns, capacity=2)
+        fake_date = datetime.datetime(2017, 5, 1, 12)
+
+        builder.append([(1, 1.5, fake_date), (2, None, None)])
+        builder.append([(3, 3.5, fake_date)])
+        builder.append([])
+
+        compared_columns = builder.get_columns()
+
+        assert builder.size == 3
+        assert compared_columns['id'].tolist() == [1, 2, 3]
+        assert compared_columns['id'].dtype == numpy.dtype('i8')
+        assert numpy.isnan(compared_columns['price'][1])
+        assert compared_columns['created_at'][0] == numpy.datetime64(fake_date)
+        assert numpy.isnat(compared_columns['created_at'][1])
+
+    def test_ok_structured(self, fake_columns):
+        builder = ArrayBuilder(fake_columns, dtype_overrides={'id': 'i4'})
+        builder.append([(1, 1.5, None)])
+
+        compared_array = builder.get_array()
+
+        assert compared_array.dtype.names == ('id', 'price', 'created_at')
+        assert compared_array.dtype['id'] == numpy.dtype('i4')
+        assert compared_array['price'].tolist() == [1.5]
+
+    def test_error_null_integer(self, fake_columns):
+        builder = ArrayBuilder(fake_columns)
+
+        with pytest.raises(ValueError):
+            builder.append([(None, 1.5, None)])
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+from aiosqlalchemy_miniorm.cache import LRUCache, SharedFutures, TTLCache
+
+
+class TestSharedFutures:
+    @pytest.mark.asyncio
+    async def test_ok(self):
+        futures = SharedFutures()
+        done = []
+
+        async def start():
+            await asyncio.sleep(0.01)
+            return 'bar'
+
+        first, first_started = futures.get_or_start('foo', start, lambda key, future: done.append(key))
+        second, second_started = futures.get_or_start('foo', start)
+
+        assert second is first
+        assert (first_started, second_started) == (True, False)
+        assert await asyncio.gather(SharedFutures.wait(first), SharedFutures.wait(second)) == ['bar', 'bar']
+        assert done == ['foo']
+        assert len(futures) == 0
+
+    @pytest.mark.asyncio
+    async def test_ok_cancelled_caller(self):
+        futures = SharedFutures()
+        future, _ = futures.get_or_start('foo', asyncio.get_event_loop().create_future)
+        cancelled = asyncio.ensure_future(SharedFutures.wait(future))
+        waiting = asyncio.ensure_future(SharedFutures.wait(future))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        future.set_result('bar')
+
+        assert await waiting == 'bar'
+
+    @pytest.mark.asyncio
+    async def test_ok_discarded(self):
+        futures = SharedFutures()
+        done = []
+        future, _ = futures.get_or_start('foo', asyncio.get_event_loop().create_future, lambda *args: done.append(1))
+
+        futures.discard_if(lambda key: key == 'foo')
+        other, started = futures.get_or_start('foo', asyncio.get_event_loop().create_future)
+        future.set_exception(ValueError('fake'))
+        await asyncio.sleep(0)
+
+        assert started and other is not future
+        assert done == []
+        assert len(futures) == 1
+
+
+class TestLRUCacheInit:
+    def test_ok(self):
+        cache = LRUCache(maxsize=10)
+
+        assert cache.maxsize == 10
+        assert len(cache) == 0
+
+    def test_error(self):
+        with pytest.raises(AssertionError):
+            LRUCache(maxsize=0)
+
+
+class TestLRUCacheGet:
+    def test_ok_hit(self):
+        cache = LRUCache()
+        cache.set('foo', 'bar')
+
+        compared_value = cache.get('foo')
+
+        assert compared_value == 'bar'
+        assert cache.hits == 1
+        assert cache.misses == 0
+
+    def test_ok_miss(self):
+        cache = LRUCache()
+
+        compared_value = cache.get('foo', 'default')
+
+        assert compared_value == 'default'
+        assert cache.hits == 0
+        assert cache.misses == 1
+
+
+class TestLRUCacheSet:
+    def test_ok_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('foo', 1)
+        cache.set('bar', 2)
+        cache.get('foo')
+
+        cache.set('baz', 3)
+
+        assert 'foo' in cache
+        assert 'bar' not in cache
+        assert 'baz' in cache
+        assert cache.evictions == 1
+
+    def test_ok_overwrite(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('foo', 1)
+
+        cache.set('foo', 2)
+
+        assert len(cache) == 1
+        assert cache.get('foo') == 2
+
+
+class TestLRUCachePop:
+    def test_ok(self):
+        cache = LRUCache()
+        cache.set('foo', 1)
+
+        assert cache.pop('foo') == 1
+        assert cache.pop('foo') is None
+        assert 'foo' not in cache
+
+
+class TestLRUCacheDiscardIf:
+    def test_ok(self):
+        cache = LRUCache()
+        cache.set(('foo', 1), 1)
+        cache.set(('foo', 2), 2)
+        cache.set(('bar', 1), 3)
+
+        compared_count = cache.discard_if(lambda key: key[0] == 'foo')
+
+        assert compared_count == 2
+        assert len(cache) == 1
+        assert ('bar', 1) in cache
+
+
+class TestLRUCacheDiscardGroup:
+    def test_ok(self):
+        cache = LRUCache()
+        cache.set(('foo', 1), 1)
+        cache.set(('foo', 2), 2)
+        cache.set(('bar', 1), 3)
+        cache.set('foo', 4)
+
+        compared_count = cache.discard_group('foo')
+
+        assert compared_count == 2
+        assert len(cache) == 2
+        assert ('bar', 1) in cache
+        assert 'foo' in cache
+        assert cache.discard_group('foo') == 0
+
+    def test_ok_popped_and_evicted(self):
+        cache = LRUCache(maxsize=2)
+        cache.set(('foo', 1), 1)
+        cache.set(('foo', 2), 2)
+        cache.set(('bar', 1), 3)
+        cache.pop(('foo', 2))
+
+        assert cache.discard_group('foo') == 0
+        assert cache._groups == {'bar': {('bar', 1)}}
+
+
+class TestLRUCacheClear:
+    def test_ok(self):
+        cache = LRUCache()
+        cache.set('foo', 1)
+
+        cache.clear()
+
+        assert len(cache) == 0
+
+
+class TestLRUCacheStats:
+    def test_ok(self):
+        cache = LRUCache(maxsize=1)
+        cache.set('foo', 1)
+        cache.set('bar', 2)
+        cache.get('bar')
+        cache.get('foo')
+
+        compared_stats = cache.stats()
+        expected_stats = {'size': 1, 'maxsize': 1, 'hits': 1, 'misses': 1, 'evictions': 1}
+
+        assert compared_stats == expected_stats
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCacheGet:
+    def test_ok_expired(self):
+        timer = FakeTimer()
+        cache = TTLCache(ttl=10, timer=timer)
+        cache.set('foo', 'bar')
+
+        timer.now = 9
+        assert cache.get('foo') == 'bar'
+
+        timer.now = 10
+        assert cache.get('foo') is None
+        assert 'foo' not in cache
+        assert cache.stats() == {
+            'size': 0, 'maxsize': 1024, 'hits': 1, 'misses': 1, 'evictions': 0, 'ttl': 10, 'expirations': 1,
+            'shared_loads': 0,
+        }
+
+    def test_ok_no_ttl(self):
+        timer = FakeTimer()
+        cache = TTLCache(timer=timer)
+        cache.set('foo', 'bar')
+
+        timer.now = 10 ** 9
+
+        assert cache.get('foo') == 'bar'
+
+
+class TestTTLCachePop:
+    def test_ok(self):
+        cache = TTLCache()
+        cache.set('foo', 1)
+
+        assert cache.pop('foo') == 1
+        assert cache.pop('foo', 'default') == 'default'
+
+
+class TestTTLCacheGetOrLoad:
+    @pytest.mark.asyncio
+    async def test_ok_deduplicated(self):
+        cache = TTLCache()
+        loads = []
+
+        async def load():
+            loads.append(1)
+            await asyncio.sleep(0.01)
+            return 'bar'
+
+        compared_values = await asyncio.gather(*[cache.get_or_load('foo', load) for _ in range(10)])
+
+        assert compared_values == ['bar'] * 10
+        assert len(loads) == 1
+        assert cache.stats()['shared_loads'] == 9
+        assert await cache.get_or_load('foo', load) == 'bar'
+        assert len(loads) == 1
+
+    @pytest.mark.asyncio
+    async def test_ok_none_not_cached(self):
+        cache = TTLCache()
+
+        async def load():
+            return None
+
+        assert await cache.get_or_load('foo', load) is None
+        assert 'foo' not in cache
+
+    @pytest.mark.asyncio
+    async def test_ok_invalidated_while_loading(self):
+        cache = TTLCache()
+
+        async def load():
+            await asyncio.sleep(0.01)
+            return 'stale'
+
+        future = asyncio.ensure_future(cache.get_or_load('foo', load))
+        await asyncio.sleep(0)
+        cache.discard_if(lambda key: key == 'foo')
+
+        assert await future == 'stale'
+        assert 'foo' not in cache
+
+    @pytest.mark.asyncio
+    async def test_error(self):
+        cache = TTLCache()
+
+        async def load():
+            raise ValueError('fake')
+
+        with pytest.raises(ValueError):
+            await cache.get_or_load('foo', load)
+
+        assert 'foo' not in cache
+        assert len(cache._loads) == 0
+
+
+class TestTTLCacheDiscardGroup:
+    @pytest.mark.asyncio
+    async def test_ok(self):
+        timer = FakeTimer()
+        cache = TTLCache(ttl=10, timer=timer)
+        cache.set(('foo', 1), 1)
+        cache.set(('foo', 2), 2)
+        timer.now = 20
+        cache.get(('foo', 2))
+
+        async def load():
+            await asyncio.sleep(0.01)
+            return 'stale'
+
+        future = asyncio.ensure_future(cache.get_or_load(('foo', 3), load))
+        await asyncio.sleep(0)
+
+        assert cache.discard_group('foo') == 1
+        assert await future == 'stale'
+        assert len(cache) == 0
+        assert cache._groups == {}
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import enum
+
+import pytest
+import sqlalchemy as sa
+from pytest_mock import MockFixture
+from sqlalchemy.dialects import postgresql
+
+from aiosqlalchemy_miniorm.copy import (
+    AsyncIterator,
+    Psycopg2CopyConnection,
+    get_copy_dsn,
+    get_row_encoder,
+    get_value_encoder,
+)
+
+
+class FakeColor(enum.Enum):
+    red = 1
+
+
+class TestGetValueEncoder:
+    @pytest.mark.parametrize("type_,value,expected_value", [
+        (sa.String(), 'foo', 'foo'),
+        (sa.String(), 'a\\b\tc\nd\re', 'a\\\\b\\tc\\nd\\re'),
+        (sa.Integer(), 10, '10'),
+        (sa.Boolean(), True, 't'),
+        (sa.Boolean(), False, 'f'),
+        (sa.DateTime(), datetime.datetime(2017, 1, 2, 3, 4, 5), '2017-01-02T03:04:05'),
+        (sa.Date(), datetime.date(2017, 1, 2), '2017-01-02'),
+        (sa.LargeBinary(), b'\x00\xff', '\\\\x00ff'),
+        (postgresql.JSONB(), {'foo': 'a\nb'}, '{"foo": "a\\\\nb"}'),
+        (postgresql.ARRAY(sa.String), ['a', None, 'b"c'], '{"a",NULL,"b\\\\"c"}'),
+        (sa.Interval(), datetime.timedelta(days=1, seconds=2, microseconds=3), '1 days 2.000003 seconds'),
+        (sa.Interval(), datetime.timedelta(seconds=-1), '-1 days 86399.000000 seconds'),
+        (postgresql.INTERVAL(), datetime.timedelta(minutes=1), '0 days 60.000000 seconds'),
+        (sa.Enum(FakeColor), FakeColor.red, 'red'),
+        (sa.Enum(FakeColor), 'red', 'red'),
+        (sa.Enum('foo', 'bar'), 'foo', 'foo'),
+    ])
+    def test_ok(self, type_, value, expected_value):
+        compared_value = get_value_encoder(type_)(value)
+
+        assert compared_value == expected_value
+
+
+class TestGetRowEncoder:
+    @staticmethod
+    @pytest.fixture
+    def fake_columns():
+        return [sa.Column('foo', sa.Integer), sa.Column('bar', sa.String), sa.Column('baz', sa.Boolean)]
+
+    def test_ok_dict(self, fake_columns):
+        encode = get_row_encoder(fake_columns)
+
+        compared_line = encode({'foo': 1, 'baz': True})
+
+        assert compared_line == '1\t\\N\tt\n'
+
+    def test_ok_sequence(self, fake_columns):
+        encode = get_row_encoder(fake_columns)
+
+        compared_line = encode((1, 'x\ty', None))
+
+        assert compared_line == '1\tx\\ty\t\\N\n'
+
+
+class TestAsyncIterator:
+    @pytest.mark.asyncio
+    async def test_ok(self):
+        compared_items = []
+
+        async for item in AsyncIterator(range(3)):
+            compared_items.append(item)
+
+        assert compared_items == [0, 1, 2]
+
+
+class TestGetCopyDsn:
+    @pytest.mark.parametrize("dsn,expected_dsn", [
+        ('host=localhost dbname=foo password=xxx', 'host=localhost dbname=foo'),
+        ('host=localhost dbname=foo password=bar', 'host=localhost dbname=foo password=bar'),
+    ])
+    def test_ok(self, dsn, expected_dsn):
+        assert sorted(get_copy_dsn(dsn).split()) == sorted(expected_dsn.split())
+
+
+class TestPsycopg2CopyConnection:
+    @pytest.mark.asyncio
+    async def test_ok(self, mocker: MockFixture):
+        mocked_connect = mocker.patch('aiosqlalchemy_miniorm.copy.psycopg2.connect')
+        fake_connection = mocked_connect.return_value
+        fake_cursor = fake_connection.cursor.return_value.__enter__.return_value
+        fake_stream = mocker.Mock()
+
+        async with Psycopg2CopyConnection('dbname=foo') as connection:
+            await connection.copy_expert('COPY foo FROM STDIN', fake_stream)
+
+        mocked_connect.assert_called_once_with('dbname=foo')
+        fake_cursor.copy_expert.assert_called_once_with('COPY foo FROM STDIN', fake_stream)
+        fake_connection.commit.assert_called_once_with()
+        fake_connection.close.assert_called_once_with()
+
+    @pytest.mark.asyncio
+    async def test_error(self, mocker: MockFixture):
+        mocked_connect = mocker.patch('aiosqlalchemy_miniorm.copy.psycopg2.connect')
+        fake_connection = mocked_connect.return_value
+        fake_cursor = fake_connection.cursor.return_value.__enter__.return_value
+        fake_cursor.copy_expert.side_effect = ValueError
+
+        with pytest.raises(ValueError):
+            async with Psycopg2CopyConnection('dbname=foo') as connection:
+                await connection.copy_expert('COPY foo FROM STDIN', mocker.Mock())
+
+        fake_connection.commit.assert_not_called()
+        fake_connection.close.assert_called_once_with()
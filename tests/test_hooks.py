@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import sqlalchemy as sa
+from pytest_mock import MockFixture
+from sqlalchemy.dialects import postgresql
+
+from aiosqlalchemy_miniorm.hooks import QueryEvent
+
+
+def fake_model_manager(mocker: MockFixture):
+    return mocker.Mock(row_class=dict, **{'engine.dialect': postgresql.dialect()})
+
+
+class TestQueryEvent:
+    def test_ok_prepared(self, mocker: MockFixture):
+        event = QueryEvent(fake_model_manager(mocker), mocker.Mock(), 'fetchall', acquire_wait=0.5)
+        event.prepared = ('SELECT 1 WHERE id = %(id)s', {'id': 1})
+
+        assert event.model is dict
+        assert event.statement == 'SELECT 1 WHERE id = %(id)s'
+        assert event.param_count == 1
+        assert event.acquire_wait == 0.5
+        assert event.execution_time is None
+
+    def test_ok_compiled(self, mocker: MockFixture):
+        table = sa.Table('fake_table', sa.MetaData(), sa.Column('id', sa.Integer))
+        event = QueryEvent(fake_model_manager(mocker), table.select().where(table.c.id == 1), 'fetchall')
+
+        assert event.statement == 'SELECT fake_table.id \nFROM fake_table \nWHERE fake_table.id = %(id_1)s'
+        assert event.params == {'id_1': 1}
+        assert event.param_count == 1
+
+    def test_ok_fingerprint(self, mocker: MockFixture):
+        model_manager = fake_model_manager(mocker)
+        compared_event = QueryEvent(model_manager, None, 'fetchall')
+        compared_event.prepared = ('SELECT 1 WHERE id = %(id)s', {'id': 1})
+        expected_event = QueryEvent(model_manager, None, 'fetchone')
+        expected_event.prepared = ('SELECT 1 WHERE id = %(id)s', {'id': 2})
+
+        assert compared_event.fingerprint == expected_event.fingerprint
+        assert len(compared_event.fingerprint) == 16
+
+    def test_ok_shape(self, mocker: MockFixture):
+        model_manager = fake_model_manager(mocker)
+        prepared_event = QueryEvent(model_manager, mocker.Mock(shape=('fake_table', 'select')), 'fetchall')
+        prepared_event.prepared = ('SELECT 1 WHERE id = %(id)s', {'id': 1})
+        query_event = QueryEvent(model_manager, mocker.Mock(shape=('fake_table', 'select')), 'fetchall')
+        query_event.prepared = (query_event.sql,)
+        statement_event = QueryEvent(model_manager, sa.select([sa.literal(1)]), 'fetchall')
+
+        assert prepared_event.shape == 'SELECT 1 WHERE id = %(id)s'
+        assert query_event.shape == ('fake_table', 'select')
+        assert statement_event.shape is None
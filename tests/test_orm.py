@@ -1,8 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import array
+import asyncio
+import datetime
+import decimal
+import random
+
 import pytest
+import sqlalchemy as sa
 from asynctest import CoroutineMock
 from pytest_mock import MockFixture
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.declarative import declarative_base
 
 from aiosqlalchemy_miniorm.orm import (
     BaseModelManager,
@@ -10,7 +19,45 @@ from aiosqlalchemy_miniorm.orm import (
     RowModelDeclarativeMeta,
     _TransactionContextManager,
     OrderBy,
+    Query,
+    _clause_shape,
+    _decode_page_cursor,
+    _encode_page_cursor,
+    _gather_bounded,
+    StatementTimeoutError,
 )
+from aiosqlalchemy_miniorm.cache import LRUCache, TTLCache
+from aiosqlalchemy_miniorm.copy import AsyncIterator, Psycopg2CopyConnection
+from aiosqlalchemy_miniorm.hooks import QueryHook
+from aiosqlalchemy_miniorm.pool import AcquireTimeoutError
+from aiosqlalchemy_miniorm.stats import QueryStatsRegistry
+
+
+FakeBaseModel = declarative_base(cls=RowModel, metaclass=RowModelDeclarativeMeta)
+
+
+class FakeDeclarativeModel(FakeBaseModel):
+    __tablename__ = 'fake_declarative_model'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
+
+
+class FakeDeclarativeEntity(FakeBaseModel):
+    __tablename__ = 'fake_declarative_entity'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
+    num = sa.Column(sa.Integer, nullable=False)
+
+
+class FakeDeclarativeModelWithInit(FakeBaseModel):
+    __tablename__ = 'fake_declarative_model_with_init'
+
+    id = sa.Column(sa.Integer, primary_key=True)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
 
 
 def async_context_mock(return_value):
@@ -35,6 +82,15 @@ class AsyncContextManager:
         pass
 
 
+async def collect(async_iterator):
+    result = []
+
+    async for item in async_iterator:
+        result.append(item)
+
+    return result
+
+
 @pytest.fixture
 def async_context_manager():
     return AsyncContextManager
@@ -98,6 +154,81 @@ class TestBaseModelFetchFromResultProxy:
             await model_manager.fetch_from_result_proxy(fake_proxy_result, 'fake_fetch')
 
 
+class TestBaseModelFetchRowShapes:
+    @staticmethod
+    @pytest.fixture
+    def fake_proxy_result(mocker: MockFixture):
+        fake_rows = [(1, 'foo', 1.5), (2, 'bar', None)]
+
+        return mocker.Mock(
+            fetchall=CoroutineMock(return_value=fake_rows),
+            keys=mocker.Mock(return_value=['id', 'name', 'price'])
+        )
+
+    @pytest.mark.asyncio
+    async def test_ok_tuples(self, fake_proxy_result, model_manager: BaseModelManager):
+        compared_result = await model_manager.fetch_from_result_proxy(fake_proxy_result, model_manager.FETCH_TUPLES)
+
+        assert compared_result == [(1, 'foo', 1.5), (2, 'bar', None)]
+
+    @pytest.mark.asyncio
+    async def test_ok_namedtuples(self, fake_proxy_result, model_manager: BaseModelManager):
+        compared_result = await model_manager.fetch_from_result_proxy(
+            fake_proxy_result, model_manager.FETCH_NAMEDTUPLES
+        )
+        other_result = await model_manager.fetch_from_result_proxy(
+            fake_proxy_result, model_manager.FETCH_NAMEDTUPLES
+        )
+
+        assert compared_result[0].name == 'foo'
+        assert compared_result[1]._asdict() == {'id': 2, 'name': 'bar', 'price': None}
+        assert isinstance(other_result[0], type(compared_result[0]))
+
+    @pytest.mark.asyncio
+    async def test_ok_columns(self, fake_proxy_result, model_manager: BaseModelManager):
+        compared_result = await model_manager.fetch_from_result_proxy(fake_proxy_result, model_manager.FETCH_COLUMNS)
+
+        assert list(compared_result.items()) == [('id', [1, 2]), ('name', ['foo', 'bar']), ('price', [1.5, None])]
+
+    @pytest.mark.asyncio
+    async def test_ok_arrays(self, fake_proxy_result, model_manager: BaseModelManager):
+        compared_result = await model_manager.fetch_from_result_proxy(fake_proxy_result, model_manager.FETCH_ARRAYS)
+
+        assert compared_result['id'] == array.array('q', [1, 2])
+        assert compared_result['name'] == ['foo', 'bar']
+        assert compared_result['price'] == [1.5, None]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('fake_values,expected_typecode', [
+        ([1.5, 2.0], 'd'),
+        ([1, 2 ** 64], None),
+        ([1, True], None),
+        ([], None),
+    ])
+    async def test_ok_array_typecodes(self, fake_values, expected_typecode, model_manager: BaseModelManager,
+                                      mocker: MockFixture):
+        fake_proxy_result = mocker.Mock(
+            fetchall=CoroutineMock(return_value=[(value,) for value in fake_values]),
+            keys=mocker.Mock(return_value=['value'])
+        )
+
+        compared_result = await model_manager.fetch_from_result_proxy(fake_proxy_result, model_manager.FETCH_ARRAYS)
+
+        assert getattr(compared_result['value'], 'typecode', None) == expected_typecode
+        assert list(compared_result['value']) == fake_values
+
+    @pytest.mark.asyncio
+    async def test_ok_empty(self, model_manager: BaseModelManager, mocker: MockFixture):
+        fake_proxy_result = mocker.Mock(
+            fetchall=CoroutineMock(return_value=[]),
+            keys=mocker.Mock(return_value=['id', 'name'])
+        )
+
+        compared_result = await model_manager.fetch_from_result_proxy(fake_proxy_result, model_manager.FETCH_COLUMNS)
+
+        assert compared_result == {'id': [], 'name': []}
+
+
 class TestBaseModelFetch:
     @pytest.mark.parametrize("test_method,test_constant", [
         ('fetchall', 'FETCH_ALL'),
@@ -156,34 +287,245 @@ class TestBaseModelManagerRunQuery:
 
         await model_manager.run_query(fake_sql, fake_fetch)
 
-        mocked_run_query_with_connection.assert_called_once_with(mocked_connection, fake_sql, fake_fetch)
+        mocked_run_query_with_connection.assert_called_once_with(
+            mocked_connection, fake_sql, fake_fetch, acquire_wait=mocker.ANY
+        )
 
+
+class TestBaseModelManagerPool:
     @pytest.mark.asyncio
-    async def test_ok_wo_sql(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_fetch = mocker.Mock()
-        mocked_get_sql = mocker.patch.object(model_manager, 'get_sql')
-        mocked_connection = CoroutineMock()
-        mocker.patch.object(model_manager, 'sql')
+    async def test_ok(self, sa_model_manager: BaseModelManager, fake_table):
+        before = sa_model_manager.pool_stats()['acquires']
+
+        await sa_model_manager.get_items()
+
+        compared_stats = sa_model_manager.pool_stats()
+
+        assert compared_stats['acquires'] == before + 1
+        assert compared_stats['in_use'] is None
+
+    @pytest.mark.asyncio
+    async def test_error_acquire_timeout(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        class AcquireForever:
+            async def __aenter__(self):
+                await asyncio.sleep(1)
+
+            async def __aexit__(self, *args):
+                pass
+
+        fake_engine = mocker.Mock(spec=['acquire'], acquire=AcquireForever)
+        mocker.patch.object(BaseModelManager, 'engine', mocker.PropertyMock(return_value=fake_engine))
+        mocker.patch.object(sa_model_manager, 'acquire_timeout', 0.01)
+
+        with pytest.raises(AcquireTimeoutError):
+            await sa_model_manager.get_items()
+
+        assert sa_model_manager.pool_stats()['timeouts'] == 1
+
+
+class FakeRawConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeTimedConnection:
+    def __init__(self, delay=0, error=None, reset_error=None, setting_delay=0):
+        self.statements = []
+        self.delay = delay
+        self.error = error
+        self.reset_error = reset_error
+        self.setting_delay = setting_delay
+        self.connection = FakeRawConnection()
+
+    async def execute(self, sql, *multiparams):
+        is_setting = isinstance(sql, str) and sql.startswith(('SET ', 'RESET '))
+        self.statements.append(sql if is_setting else 'query')
+
+        if sql == 'RESET statement_timeout' and self.reset_error is not None:
+            raise self.reset_error
+
+        if is_setting and self.setting_delay:
+            await asyncio.sleep(self.setting_delay)
+
+        if not is_setting:
+            await asyncio.sleep(self.delay)
+
+            if self.error is not None:
+                raise self.error
+
+        return FakeResultProxy({'id': 1})
+
+
+class FakeTimedEngine:
+    def __init__(self, connection):
+        self.dialect = postgresql.dialect()
+        self.connection = connection
+
+    def acquire(self):
+        return AsyncContextManager(self.connection)
+
+
+class TestBaseModelManagerTimeout:
+    def test_query_with_timeout(self, sa_model_manager: BaseModelManager, fake_table):
+        query = sa_model_manager.set_sql(fake_table.select(), shape=(fake_table, 'select'))
+
+        assert query.with_timeout(None) is query
+        assert query.with_timeout(5).where([fake_table.c.id == 1]).limit(1).timeout == 5
+        assert query.timeout is None
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("fake_default, fake_timeout, expected_timeout", [
+        (None, None, None), (10, None, 10), (10, 2, 2), (None, 2, 2),
+    ])
+    async def test_ok_resolved_timeout(self, sa_model_manager: BaseModelManager, fake_table, mocker: MockFixture,
+                                       fake_default, fake_timeout, expected_timeout):
+        mocker.patch.object(sa_model_manager, 'statement_timeout', fake_default)
+        mocked_run_pooled_query = mocker.patch.object(sa_model_manager, '_run_pooled_query', CoroutineMock())
+
+        await sa_model_manager.get_items(timeout=fake_timeout)
+
+        if expected_timeout is None:
+            mocked_run_pooled_query.assert_called_once_with(mocker.ANY, sa_model_manager.FETCH_ALL)
+        else:
+            mocked_run_pooled_query.assert_called_once_with(mocker.ANY, sa_model_manager.FETCH_ALL, expected_timeout)
+
+    @pytest.mark.asyncio
+    async def test_ok_pooled(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_connection = FakeTimedConnection()
         mocker.patch.object(
-            BaseModelManager,
-            'engine',
-            mocker.PropertyMock(
-                return_value=mocker.Mock(
-                    acquire=async_context_mock(return_value=mocked_connection)
-                )
-            )
+            BaseModelManager, 'engine', mocker.PropertyMock(return_value=FakeTimedEngine(fake_connection))
         )
-        mocked_run_query_with_connection = mocker.patch.object(
-            model_manager, 'run_query_with_connection', CoroutineMock()
+
+        compared_rows = await sa_model_manager.get_items(timeout=1.5)
+
+        assert compared_rows == [{'id': 1}]
+        assert fake_connection.statements == ['SET statement_timeout = 1500', 'query', 'RESET statement_timeout']
+
+        # the connection is released at the default, queries without timeout send no setting
+        await sa_model_manager.get_items()
+
+        assert fake_connection.statements == [
+            'SET statement_timeout = 1500', 'query', 'RESET statement_timeout', 'query'
+        ]
+
+    @pytest.mark.asyncio
+    async def test_ok_pooled_default(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_connection = FakeTimedConnection()
+        mocker.patch.object(
+            BaseModelManager, 'engine', mocker.PropertyMock(return_value=FakeTimedEngine(fake_connection))
         )
+        mocker.patch.object(sa_model_manager, 'statement_timeout', 2)
 
-        compared_return = await model_manager.run_query(fetch=fake_fetch)
+        for _ in range(3):
+            await sa_model_manager.get_items()
 
-        mocked_get_sql.assert_called_once_with()
-        assert compared_return == mocked_run_query_with_connection.return_value
-        mocked_run_query_with_connection.assert_called_once_with(
-            mocked_connection, mocked_get_sql.return_value, fake_fetch
+        assert fake_connection.statements == ['SET statement_timeout = 2000', 'query', 'RESET statement_timeout'] * 3
+
+    @pytest.mark.asyncio
+    async def test_ok_transaction(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_connection = FakeTimedConnection()
+        sa_model_manager.transaction_connection = fake_connection
+
+        await sa_model_manager.delete(timeout=0.0001)
+
+        assert fake_connection.statements == [
+            'SET LOCAL statement_timeout = 1', 'query', 'SET LOCAL statement_timeout = DEFAULT'
+        ]
+
+    @pytest.mark.asyncio
+    async def test_error_client_deadline(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_connection = FakeTimedConnection(delay=1)
+        mocker.patch.object(
+            BaseModelManager, 'engine', mocker.PropertyMock(return_value=FakeTimedEngine(fake_connection))
+        )
+
+        with pytest.raises(StatementTimeoutError):
+            await sa_model_manager.delete(timeout=0.01)
+
+        assert fake_connection.statements == ['SET statement_timeout = 10', 'query', 'RESET statement_timeout']
+        assert not fake_connection.connection.closed
+
+    @pytest.mark.asyncio
+    async def test_error_server_timeout(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        psycopg2_extensions = pytest.importorskip('psycopg2.extensions')
+
+        try:
+            try:
+                raise psycopg2_extensions.QueryCanceledError()
+            except psycopg2_extensions.QueryCanceledError:
+                raise asyncio.CancelledError
+        except asyncio.CancelledError as e:
+            fake_error = e
+
+        fake_connection = FakeTimedConnection(error=fake_error)
+        mocker.patch.object(
+            BaseModelManager, 'engine', mocker.PropertyMock(return_value=FakeTimedEngine(fake_connection))
+        )
+
+        with pytest.raises(StatementTimeoutError):
+            await sa_model_manager.get_items(timeout=5)
+
+        assert fake_connection.statements == ['SET statement_timeout = 5000', 'query', 'RESET statement_timeout']
+
+    @pytest.mark.asyncio
+    async def test_error_cancelled(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_connection = FakeTimedConnection(error=asyncio.CancelledError())
+        mocker.patch.object(
+            BaseModelManager, 'engine', mocker.PropertyMock(return_value=FakeTimedEngine(fake_connection))
+        )
+
+        with pytest.raises(asyncio.CancelledError):
+            await sa_model_manager.get_items(timeout=5)
+
+    @pytest.mark.asyncio
+    async def test_error_caller_cancelled(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_connection = FakeTimedConnection(delay=1)
+        mocker.patch.object(
+            BaseModelManager, 'engine', mocker.PropertyMock(return_value=FakeTimedEngine(fake_connection))
+        )
+
+        future = asyncio.ensure_future(sa_model_manager.get_items(timeout=5))
+        await asyncio.sleep(0.01)
+        future.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await future
+
+        # the query is cancelled and the connection reset before the caller gets the error
+        assert fake_connection.statements == ['SET statement_timeout = 5000', 'query', 'RESET statement_timeout']
+
+    @pytest.mark.asyncio
+    async def test_error_reset(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_connection = FakeTimedConnection(reset_error=Exception('connection lost'))
+        mocker.patch.object(
+            BaseModelManager, 'engine', mocker.PropertyMock(return_value=FakeTimedEngine(fake_connection))
+        )
+        mocker.patch('aiosqlalchemy_miniorm.pool.logger')
+
+        compared_rows = await sa_model_manager.get_items(timeout=5)
+
+        # the result is kept, the connection is closed instead of being released with the setting
+        assert compared_rows == [{'id': 1}]
+        assert fake_connection.connection.closed
+        assert fake_connection.statements == ['SET statement_timeout = 5000', 'query', 'RESET statement_timeout']
+
+    @pytest.mark.asyncio
+    async def test_error_cancelled_setting(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_connection = FakeTimedConnection(setting_delay=1)
+        mocker.patch.object(
+            BaseModelManager, 'engine', mocker.PropertyMock(return_value=FakeTimedEngine(fake_connection))
         )
+        mocker.patch('aiosqlalchemy_miniorm.pool.logger')
+
+        with pytest.raises(StatementTimeoutError):
+            await sa_model_manager.get_items(timeout=0.01)
+
+        # the server may have applied the setting, the connection is not handed out again
+        assert fake_connection.statements == ['SET statement_timeout = 10']
+        assert fake_connection.connection.closed
 
 
 class TestBaseModelManagerRunQueryWithConnection:
@@ -212,308 +554,721 @@ class TestBaseModelManagerRunQueryWithConnection:
         with pytest.raises(Exception):
             await model_manager.run_query_with_connection(fake_connection, fake_sql)
 
-        mocked_logger.error.assert_called_once_with(mocker.ANY, fake_sql, mocker.ANY)
+        mocked_logger.error.assert_called_once_with(mocker.ANY, mocker.ANY, mocker.ANY)
         fake_connection.execute.assert_called_once_with(fake_sql)
 
+        # the statement is only compiled when the record is emitted
+        logged_statement = mocked_logger.error.call_args[0][1]
+        fake_sql.compile.assert_not_called()
 
-class TestBaseModelManagerPkColumn:
-    def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_pk = mocker.Mock()
+        assert str(logged_statement) == str(fake_sql.compile.return_value)
+        fake_sql.compile.assert_called_once_with(dialect=model_manager.engine.dialect)
 
-        mocker.patch.object(model_manager, 'table', **{'primary_key.columns.values.return_value': [fake_pk]})
-        compared_pk_column = model_manager._pk_column
+    @pytest.mark.asyncio
+    async def test_error_cached_statement(self, sa_model_manager: BaseModelManager, fake_table, mocker: MockFixture):
+        fake_connection = mocker.Mock(execute=CoroutineMock(side_effect=Exception))
+        mocked_logger = mocker.patch('aiosqlalchemy_miniorm.orm.logger')
+        query = sa_model_manager.set_sql(fake_table.delete(), shape=(fake_table, 'delete'))
 
-        assert compared_pk_column == fake_pk
+        with pytest.raises(Exception):
+            await sa_model_manager.run_query_with_connection(fake_connection, query)
 
+        statement, params = fake_connection.execute.call_args[0]
+        mocked_logger.error.assert_called_once_with(mocker.ANY, statement, mocker.ANY)
+        assert isinstance(statement, str)
 
-class TestBaseModelManagerGetSql:
-    def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_sql = mocker.patch.object(model_manager, 'sql')
+    @pytest.mark.asyncio
+    async def test_ok_cached_statement_processed(self, sa_model_manager: BaseModelManager, fake_table,
+                                                 mocker: MockFixture):
+        # float8 results of a numeric column are converted to Decimal by the column type
+        fake_result_proxy = mocker.Mock(
+            cursor=mocker.Mock(description=[('id', 23), ('price', 701)]),
+            fetchall=CoroutineMock(return_value=[(1, 1.5), (2, None)]),
+        )
+        fake_connection = mocker.Mock(execute=CoroutineMock(return_value=fake_result_proxy))
+        query = sa_model_manager.set_sql(
+            sa.select([fake_table.c.id, fake_table.c.price]), shape=(fake_table, 'select', 'id', 'price')
+        )
 
-        compared_sql = model_manager.get_sql()
+        compared_rows = await sa_model_manager.run_query_with_connection(fake_connection, query)
 
-        assert compared_sql == fake_sql
+        assert compared_rows == [(1, decimal.Decimal('1.5')), (2, None)]
+        assert isinstance(compared_rows[0]['price'], decimal.Decimal)
+        assert compared_rows[0].id == 1
+        assert dict(compared_rows[0]) == {'id': 1, 'price': decimal.Decimal('1.5')}
+        assert isinstance(fake_connection.execute.call_args[0][0], str)
 
-    def test_error(self, model_manager: BaseModelManager, mocker: MockFixture):
-        mocker.patch.object(model_manager, 'sql', None)
+    @pytest.mark.asyncio
+    async def test_ok_cached_statement_column_keys(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        table = sa.Table('fake_keyed_table', sa.MetaData(), sa.Column('user_name', sa.String, key='name'))
+        fake_result_proxy = mocker.Mock(
+            cursor=mocker.Mock(description=[('user_name', 25)]),
+            fetchone=CoroutineMock(return_value=('foo',)),
+        )
+        fake_connection = mocker.Mock(execute=CoroutineMock(return_value=fake_result_proxy))
+        query = sa_model_manager.set_sql(table.select(), shape=(table, 'select'))
 
-        with pytest.raises(AssertionError):
-            model_manager.get_sql()
+        compared_row = await sa_model_manager.run_query_with_connection(
+            fake_connection, query, sa_model_manager.FETCH_ONE
+        )
 
+        assert dict(compared_row) == {'name': 'foo'}
 
-class TestBaseModelManagerSetSql:
-    def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_sql = mocker.Mock()
+    @pytest.mark.asyncio
+    async def test_ok_cached_statement_unprocessed(self, sa_model_manager: BaseModelManager, fake_table,
+                                                   mocker: MockFixture):
+        fake_result_proxy = mocker.Mock(
+            cursor=mocker.Mock(description=[('id', 23), ('name', 25)]),
+            fetchall=CoroutineMock(return_value=[(1, 'foo')]),
+        )
+        fake_connection = mocker.Mock(execute=CoroutineMock(return_value=fake_result_proxy))
+        query = sa_model_manager.set_sql(
+            sa.select([fake_table.c.id, fake_table.c.name]), shape=(fake_table, 'select', 'id', 'name')
+        )
 
-        model_manager.set_sql(fake_sql)
+        compared_rows = await sa_model_manager.run_query_with_connection(fake_connection, query)
 
-        assert model_manager.sql == fake_sql
+        assert compared_rows is fake_result_proxy.fetchall.return_value
 
 
-class TestBaseModelManagerWhere:
-    def test_ok_with_where_list(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_where_list = ['foo', 'bar']
-        mocked_get_sql = mocker.Mock()
+class RecordingHook(QueryHook):
+    def __init__(self):
+        self.calls = []
 
-        mocker.patch.object(model_manager, 'get_sql', mocked_get_sql)
-        mocker.patch.object(model_manager, 'sql')
+    def before_execute(self, event):
+        self.calls.append(('before_execute', event))
 
-        model_manager.where(fake_where_list)
+    def after_execute(self, event):
+        self.calls.append(('after_execute', event))
 
-        compared_sql = model_manager.sql
-        expected_sql = mocked_get_sql.return_value.where.return_value
+    def on_error(self, event, error):
+        self.calls.append(('on_error', event, error))
 
-        calls = [mocker.call(where) for where in fake_where_list]
-        mocked_get_sql.return_value.where.assert_has_calls(calls)
 
-        assert compared_sql == expected_sql
+class TestBaseModelManagerHooks:
+    @staticmethod
+    @pytest.fixture
+    def manager_class():
+        class FakeModelManager(BaseModelManager):
+            pass
 
-    def test_ok_wo_where_list(self, model_manager: BaseModelManager, mocker: MockFixture):
-        mocked_get_sql = mocker.Mock()
+        return FakeModelManager
 
-        mocker.patch.object(model_manager, 'get_sql', mocked_get_sql)
+    @pytest.mark.asyncio
+    async def test_ok(self, manager_class, fake_table, mocker: MockFixture):
+        hook = RecordingHook()
+        manager_class.add_hook(hook)
+        model_manager = manager_class(fake_table, dict)
+        mocker.patch.object(model_manager, 'statement_cache', LRUCache())
+
+        await model_manager.get_items(where_list=[fake_table.c.id == 1])
+
+        assert [call[0] for call in hook.calls] == ['before_execute', 'after_execute']
+        event = hook.calls[0][1]
+        assert event is hook.calls[1][1]
+        assert event.model is dict
+        assert event.fetch == model_manager.FETCH_ALL
+        assert event.param_count == 1
+        assert event.rowcount == {'id_1': 1}
+        assert event.acquire_wait >= 0
+        assert event.execution_time >= 0
+        assert event.statement.startswith('SELECT fake_table.id')
 
-        model_manager.where()
+    @pytest.mark.asyncio
+    async def test_error(self, manager_class, mocker: MockFixture):
+        hook = RecordingHook()
+        manager_class.add_hook(hook)
+        model_manager = manager_class(mocker.Mock(), dict)
+        fake_error = Exception('foo')
+        fake_sql = mocker.Mock()
+        fake_connection = mocker.Mock(execute=CoroutineMock(side_effect=fake_error))
+        mocked_logger = mocker.patch('aiosqlalchemy_miniorm.orm.logger')
 
-        mocked_get_sql.return_value.where.assert_not_called()
+        with pytest.raises(Exception):
+            await model_manager.run_query_with_connection(fake_connection, fake_sql)
 
+        assert [call[0] for call in hook.calls] == ['before_execute', 'on_error']
+        assert hook.calls[1][2] is fake_error
+        assert hook.calls[1][1].acquire_wait is None
+        assert hook.calls[1][1].execution_time >= 0
+        mocked_logger.error.assert_called_once_with(mocker.ANY, mocker.ANY, fake_error)
 
-class TestBaseModelManagerOrderBy:
-    def test_ok_with_order_by_asc(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_column_name = 'foo'
-        fake_order_by = [OrderBy(field=fake_column_name, order='asc')]
-        fake_column = mocker.Mock(asc=mocker.Mock())
-        mocked_get_sql = mocker.patch.object(model_manager, 'get_sql')
+        # the log record and the hooks share one compilation of the statement
+        assert str(mocked_logger.error.call_args[0][1]) == hook.calls[1][1].statement
+        assert fake_sql.compile.call_count == 1
 
-        mocker.patch.object(model_manager, 'table', columns={fake_column_name: fake_column})
+    @pytest.mark.asyncio
+    async def test_ok_failing_hook(self, manager_class, mocker: MockFixture):
+        hook = mocker.Mock(before_execute=mocker.Mock(side_effect=Exception))
+        manager_class.add_hook(hook)
+        model_manager = manager_class(mocker.Mock(), dict)
+        fake_connection = mocker.Mock(execute=CoroutineMock(return_value=mocker.Mock(rowcount=3)))
+        mocker.patch.object(model_manager, 'fetch_from_result_proxy', CoroutineMock(return_value=3))
+        mocked_logger = mocker.patch('aiosqlalchemy_miniorm.orm.logger')
 
-        model_manager.order_by(fake_order_by)
+        compared_result = await model_manager.run_query_with_connection(fake_connection, mocker.Mock())
 
-        mocked_get_sql.assert_called_once_with()
-        assert model_manager.sql == mocked_get_sql.return_value.order_by.return_value
-        mocked_get_sql.return_value.order_by.assert_called_once_with(fake_column.asc.return_value)
+        assert compared_result == 3
+        assert mocked_logger.exception.call_count == 1
+        assert hook.after_execute.call_count == 1
 
-    def test_ok_with_order_by_desc(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_column_name = 'foo'
-        fake_order_by = [OrderBy(field=fake_column_name, order='desc')]
-        fake_column = mocker.Mock(desc=mocker.Mock())
-        mocked_get_sql = mocker.patch.object(model_manager, 'get_sql')
+    def test_ok_registration(self, manager_class, mocker: MockFixture):
+        class FakeChildModelManager(manager_class):
+            pass
 
-        mocker.patch.object(model_manager, 'table', columns={fake_column_name: fake_column})
+        parent_hook = mocker.Mock()
+        child_hook = mocker.Mock()
 
-        model_manager.order_by(fake_order_by)
+        FakeChildModelManager.add_hook(child_hook)
+        manager_class.add_hook(parent_hook)
 
-        mocked_get_sql.assert_called_once_with()
-        assert model_manager.sql == mocked_get_sql.return_value.order_by.return_value
-        mocked_get_sql.return_value.order_by.assert_called_once_with(fake_column.desc.return_value)
+        assert manager_class.hooks == (parent_hook,)
+        assert FakeChildModelManager.hooks == (parent_hook, child_hook)
+        assert BaseModelManager.hooks == ()
 
-    def test_ok_wo_order_by(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_sql = mocker.patch.object(model_manager, 'sql')
-        mocked_get_sql = mocker.patch.object(model_manager, 'get_sql')
+        manager_class.remove_hook(parent_hook)
 
-        model_manager.order_by()
+        assert manager_class.hooks == ()
+        assert FakeChildModelManager.hooks == (child_hook,)
 
-        mocked_get_sql.assert_not_called()
+    @pytest.mark.asyncio
+    async def test_ok_no_hooks(self, model_manager: BaseModelManager, mocker: MockFixture):
+        mocked_run_hooked_query = mocker.patch.object(model_manager, '_run_hooked_query', CoroutineMock())
+        mocker.patch.object(model_manager, 'fetch_from_result_proxy', CoroutineMock())
+        fake_connection = mocker.Mock(execute=CoroutineMock())
 
-        compared_sql = model_manager.sql
+        await model_manager.run_query_with_connection(fake_connection, mocker.Mock())
 
-        assert compared_sql == fake_sql
+        assert mocked_run_hooked_query.call_count == 0
 
 
-class TestBaseModelManagerOffset:
-    def test_ok_with_offset(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_offset = 10
-        mocked_get_sql = mocker.patch.object(model_manager, 'get_sql')
+class TestBaseModelManagerStats:
+    @pytest.mark.asyncio
+    async def test_ok(self, fake_table, mocker: MockFixture):
+        class FakeModelManager(BaseModelManager):
+            pass
 
-        model_manager.offset(fake_offset)
+        class FakeModel:
+            def __init__(self, **values):
+                pass
 
-        mocked_get_sql.return_value.offset.assert_called_once_with(fake_offset)
+        registry = FakeModelManager.enable_stats()
+        model_manager = FakeModelManager(fake_table, FakeModel)
+        other_model_manager = FakeModelManager(fake_table, dict)
+        mocker.patch.object(FakeModelManager, 'statement_cache', LRUCache())
 
-        compared_sql = model_manager.sql
-        expected_sql = mocked_get_sql.return_value.offset.return_value
+        await model_manager.get_items(where_list=[fake_table.c.id == 1])
+        await model_manager.get_items(where_list=[fake_table.c.id == 2])
+        await other_model_manager.get_items()
 
-        assert compared_sql == expected_sql
+        compared_stats = model_manager.stats()
 
-    def test_ok_wo_offset(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_sql = mocker.patch.object(model_manager, 'sql')
-        mocked_get_sql = mocker.patch.object(model_manager, 'get_sql')
+        assert FakeModelManager.hooks == (registry,)
+        assert len(compared_stats) == 1
+        assert compared_stats[0]['model'] == 'FakeModel'
+        assert compared_stats[0]['calls'] == 2
+        assert compared_stats[0]['statement'].startswith('SELECT fake_table.id')
+        assert len(registry.get_stats()) == 2
+        assert 'miniorm_query_calls_total{model="FakeModel"' in registry.to_prometheus()
 
-        model_manager.offset()
+        other_registry = FakeModelManager.enable_stats(QueryStatsRegistry())
 
-        mocked_get_sql.assert_not_called()
+        assert FakeModelManager.hooks == (other_registry,)
+        assert model_manager.stats() == []
 
-        compared_sql = model_manager.sql
+    def test_ok_disabled(self, sa_model_manager: BaseModelManager):
+        assert sa_model_manager.stats() == []
 
-        assert compared_sql == fake_sql
 
+class TestBaseModelManagerPkColumn:
+    def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
+        fake_pk = mocker.Mock()
 
-class TestBaseModelManagerLimit:
-    def test_ok_with_limit(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_limit = 30
-        mocked_get_sql = mocker.patch.object(model_manager, 'get_sql')
+        mocker.patch.object(model_manager, 'table', **{'primary_key.columns.values.return_value': [fake_pk]})
+        compared_pk_column = model_manager._pk_column
 
-        model_manager.limit(fake_limit)
+        assert compared_pk_column == fake_pk
 
-        mocked_get_sql.return_value.limit.assert_called_once_with(fake_limit)
 
-        compared_sql = model_manager.sql
-        expected_sql = mocked_get_sql.return_value.limit.return_value
+class TestBaseModelManagerSetSql:
+    def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
+        fake_sql = mocker.Mock()
 
-        assert compared_sql == expected_sql
+        compared_query = model_manager.set_sql(fake_sql)
 
-    def test_ok_wo_offset(self, model_manager: BaseModelManager, mocker: MockFixture):
-        mocked_get_sql = mocker.patch.object(model_manager, 'get_sql')
+        assert isinstance(compared_query, Query)
+        assert compared_query.model_manager == model_manager
+        assert compared_query.sql == fake_sql
 
-        model_manager.limit()
+    def test_ok_query_class(self, model_manager: BaseModelManager, mocker: MockFixture):
+        fake_sql = mocker.Mock()
+        mocked_query_class = mocker.patch.object(model_manager, 'query_class')
 
-        mocked_get_sql.return_value.limit.assert_called_once_with(None)
+        compared_query = model_manager.set_sql(fake_sql)
 
-        compared_sql = model_manager.sql
-        expected_sql = mocked_get_sql.return_value.limit.return_value
+        mocked_query_class.assert_called_once_with(model_manager, fake_sql, None)
+        assert compared_query == mocked_query_class.return_value
 
-        assert compared_sql == expected_sql
 
+@pytest.fixture
+def query(model_manager: BaseModelManager, mocker: MockFixture):
+    return Query(model_manager, mocker.Mock())
 
-class TestBaseModelManagerValues:
-    def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_values = {'foo': 'bar'}
-        mocked_get_sql = mocker.patch.object(model_manager, 'get_sql')
 
-        model_manager.values(**fake_values)
+class TestQueryGetSql:
+    def test_ok(self, query: Query):
+        compared_sql = query.get_sql()
 
-        mocked_get_sql.return_value.values.assert_called_once_with(**fake_values)
+        assert compared_sql == query.sql
 
-        compared_sql = model_manager.sql
-        expected_sql = mocked_get_sql.return_value.values.return_value
+    def test_error(self, model_manager: BaseModelManager):
+        query = Query(model_manager, None)
 
-        assert compared_sql == expected_sql
+        with pytest.raises(AssertionError):
+            query.get_sql()
 
 
-class TestBaseModelManagerGetItem:
-    @pytest.mark.asyncio
-    async def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_where_list = mocker.Mock()
-        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=model_manager)
-        mocked_where = mocker.patch.object(model_manager, 'where', return_value=model_manager)
-        mocked_fetchone = mocker.patch.object(model_manager, 'fetchone', CoroutineMock())
-        mocked_table = mocker.patch.object(model_manager, 'table')
+class TestQuerySetSql:
+    def test_ok(self, query: Query, mocker: MockFixture):
+        fake_sql = mocker.Mock()
+        original_sql = query.sql
 
-        compared_result = await model_manager.get_item(fake_where_list)
-        expected_result = mocked_fetchone.return_value
+        compared_query = query.set_sql(fake_sql)
 
-        mocked_set_sql.assert_called_once_with(mocked_table.select.return_value)
-        mocked_table.select.assert_called_once_with()
-        mocked_where.assert_called_once_with(fake_where_list)
-        mocked_fetchone.assert_called_once_with()
+        assert compared_query is not query
+        assert compared_query.model_manager == query.model_manager
+        assert compared_query.sql == fake_sql
+        assert query.sql == original_sql
 
-        assert compared_result == expected_result
 
+class TestQueryWhere:
+    def test_ok_with_where_list(self, query: Query, mocker: MockFixture):
+        fake_where_list = ['foo', 'bar']
+        original_sql = query.sql
 
-class TestBaseModelManagerGetInstance:
-    @pytest.mark.asyncio
-    async def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_where_list = mocker.Mock()
-        mocked_get_item = mocker.patch.object(
-            model_manager,
-            'get_item',
-            CoroutineMock(return_value={'foo': 'bar'})
-        )
-        mocked_row_class = mocker.patch.object(model_manager, 'row_class')
+        compared_query = query.where(fake_where_list)
 
-        compared_result = await model_manager.get_instance(fake_where_list)
-        expected_result = mocked_row_class.return_value
+        original_sql.where.assert_called_once_with('foo')
+        original_sql.where.return_value.where.assert_called_once_with('bar')
+        assert compared_query.sql == original_sql.where.return_value.where.return_value
+        assert query.sql == original_sql
 
-        mocked_get_item.assert_called_once_with(fake_where_list)
-        mocked_row_class.assert_called_once_with(**dict(mocked_get_item.return_value))
+    def test_ok_wo_where_list(self, query: Query):
+        compared_query = query.where()
 
-        assert compared_result == expected_result
+        query.sql.where.assert_not_called()
+        assert compared_query is query
 
-    @pytest.mark.asyncio
-    async def test_ok_no_results(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_where_list = mocker.Mock()
-        mocked_get_item = mocker.patch.object(model_manager, 'get_item', CoroutineMock(return_value=None))
-        mocked_row_class = mocker.patch.object(model_manager, 'row_class')
 
-        compared_result = await model_manager.get_instance(fake_where_list)
-        expected_result = None
+class TestQueryOrderBy:
+    def test_ok_with_order_by_asc(self, query: Query, mocker: MockFixture):
+        fake_column_name = 'foo'
+        fake_order_by = [OrderBy(field=fake_column_name, order='asc')]
+        fake_column = mocker.Mock(asc=mocker.Mock())
+        mocker.patch.object(query.model_manager, 'table', columns={fake_column_name: fake_column})
 
-        mocked_get_item.assert_called_once_with(fake_where_list)
-        mocked_row_class.assert_not_called()
+        compared_query = query.order_by(fake_order_by)
 
-        assert compared_result == expected_result
+        assert compared_query.sql == query.sql.order_by.return_value
+        query.sql.order_by.assert_called_once_with(fake_column.asc.return_value)
 
+    def test_ok_with_order_by_desc(self, query: Query, mocker: MockFixture):
+        fake_column_name = 'foo'
+        fake_order_by = [OrderBy(field=fake_column_name, order='desc')]
+        fake_column = mocker.Mock(desc=mocker.Mock())
+        mocker.patch.object(query.model_manager, 'table', columns={fake_column_name: fake_column})
 
-class TestBaseModelManagerInsert:
-    @pytest.mark.asyncio
-    async def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_values = {'foo': 'bar'}
-        fake_fetchedone = {'foo': 'bar'}
-        mocked_table = mocker.patch.object(model_manager, 'table', mocker.Mock(columns=[mocker.Mock(), mocker.Mock()]))
-        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=model_manager)
-        mocked_row_class = mocker.patch.object(model_manager, 'row_class')
-        mocked_values = mocker.patch.object(model_manager, 'values', return_value=model_manager)
-        mocked_returning = mocker.patch.object(model_manager, 'returning', return_value=model_manager)
-        mocked_fetchone = mocker.patch.object(
-            model_manager,
-            'fetchone',
-            CoroutineMock(return_value=fake_fetchedone)
-        )
+        compared_query = query.order_by(fake_order_by)
 
-        compared_result = await model_manager.insert(**fake_values)
-        expected_result = mocked_row_class.return_value
+        assert compared_query.sql == query.sql.order_by.return_value
+        query.sql.order_by.assert_called_once_with(fake_column.desc.return_value)
 
-        mocked_set_sql.assert_called_once_with(mocked_table.insert.return_value)
-        mocked_table.insert.assert_called_once_with()
-        mocked_values.assert_called_once_with(**fake_values)
-        mocked_returning.assert_called_once_with(*mocked_table.columns)
-        mocked_fetchone.assert_called_once_with()
-        mocked_row_class.assert_called_once_with(**fake_fetchedone)
+    def test_ok_wo_order_by(self, query: Query):
+        compared_query = query.order_by()
+
+        query.sql.order_by.assert_not_called()
+        assert compared_query is query
+
+    def test_error_unknown_order(self, query: Query):
+        with pytest.raises(AssertionError):
+            query.order_by([OrderBy(field='foo', order='up')])
+
+
+class TestQueryOffset:
+    def test_ok_with_offset(self, query: Query):
+        fake_offset = 10
+
+        compared_query = query.offset(fake_offset)
+
+        query.sql.offset.assert_called_once_with(fake_offset)
+        assert compared_query.sql == query.sql.offset.return_value
+
+    def test_ok_wo_offset(self, query: Query):
+        compared_query = query.offset()
+
+        query.sql.offset.assert_not_called()
+        assert compared_query is query
+
+
+class TestQueryLimit:
+    def test_ok_with_limit(self, query: Query):
+        fake_limit = 30
+
+        compared_query = query.limit(fake_limit)
+
+        query.sql.limit.assert_called_once_with(fake_limit)
+        assert compared_query.sql == query.sql.limit.return_value
+
+    def test_ok_wo_limit(self, query: Query):
+        compared_query = query.limit()
+
+        query.sql.limit.assert_called_once_with(None)
+        assert compared_query.sql == query.sql.limit.return_value
+
+
+class TestQueryValues:
+    def test_ok(self, query: Query):
+        fake_values = {'foo': 'bar'}
+
+        compared_query = query.values(**fake_values)
+
+        query.sql.values.assert_called_once_with(**fake_values)
+        assert compared_query.sql == query.sql.values.return_value
+
+
+class TestQueryReturning:
+    def test_ok(self, query: Query, mocker: MockFixture):
+        fake_columns = [mocker.Mock(), mocker.Mock()]
+
+        compared_query = query.returning(*fake_columns)
+
+        query.sql.returning.assert_called_once_with(*fake_columns)
+        assert compared_query.sql == query.sql.returning.return_value
+
+
+class TestQueryFetch:
+    @pytest.mark.parametrize("test_method", ['fetchall', 'fetchone', 'scalar', 'rowcount'])
+    @pytest.mark.asyncio
+    async def test_ok(self, test_method, query: Query, mocker: MockFixture):
+        mocked_fetch = mocker.patch.object(query.model_manager, test_method, CoroutineMock())
+
+        compared_result = await getattr(query, test_method)()
+        expected_result = mocked_fetch.return_value
 
         assert compared_result == expected_result
+        mocked_fetch.assert_called_once_with(query)
+
+
+@pytest.fixture
+def fake_table():
+    return sa.Table(
+        'fake_table', sa.MetaData(bind=FakeEngine()),
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('name', sa.String),
+        sa.Column('price', sa.Numeric),
+    )
+
+
+@pytest.fixture
+def sa_model_manager(fake_table, mocker: MockFixture):
+    model_manager = BaseModelManager(fake_table, dict)
+    mocker.patch.object(model_manager, 'statement_cache', LRUCache())
+
+    return model_manager
+
+
+class TestClauseShape:
+    def test_ok_same_structure(self, fake_table):
+        compared_shape, compared_binds = _clause_shape(fake_table.c.id == 1)
+        expected_shape, expected_binds = _clause_shape(fake_table.c.id == 2)
+
+        assert compared_shape == expected_shape
+        assert [bind.value for bind in compared_binds] == [1]
+        assert [bind.value for bind in expected_binds] == [2]
+
+    @pytest.mark.parametrize("other_clause", [
+        lambda table: table.c.id != 1,
+        lambda table: table.c.name == 'foo',
+        lambda table: table.c.id == None,  # noqa: E711
+        lambda table: table.c.id.in_([1, 2]),
+        lambda table: sa.and_(table.c.id == 1, table.c.name == 'foo'),
+    ])
+    def test_ok_different_structure(self, other_clause, fake_table):
+        compared_shape, _ = _clause_shape(fake_table.c.id == 1)
+        expected_shape, _ = _clause_shape(other_clause(fake_table))
+
+        assert compared_shape != expected_shape
+
+    def test_ok_literal_column(self):
+        compared_shape, _ = _clause_shape(sa.literal_column('Name') == 'foo')
+        expected_shape, _ = _clause_shape(sa.column('Name') == 'foo')
+
+        assert compared_shape != expected_shape
+
+    def test_ok_custom_operator(self, fake_table):
+        compared_shape, _ = _clause_shape(fake_table.c.name.op('~*')('foo'))
+        expected_shape, _ = _clause_shape(fake_table.c.name.op('~*')('bar'))
+        other_shape, _ = _clause_shape(fake_table.c.name.op('~')('bar'))
+
+        assert compared_shape == expected_shape
+        assert compared_shape != other_shape
+
+    def test_ok_named_bindparam(self, fake_table):
+        compared_shape, _ = _clause_shape(fake_table.c.id == sa.bindparam('foo', 1))
+        expected_shape, _ = _clause_shape(fake_table.c.id == sa.bindparam('bar', 1))
+
+        assert compared_shape != expected_shape
+
+    def test_ok_not_cacheable(self, fake_table):
+        compared_shape, compared_binds = _clause_shape(fake_table.c.id == sa.cast('1', sa.Integer))
+
+        assert compared_shape is None
+        assert compared_binds is None
+
+
+class TestQueryShape:
+    def test_ok(self, sa_model_manager: BaseModelManager, fake_table):
+        query = sa_model_manager.set_sql(fake_table.select(), shape=(fake_table, 'select'))\
+            .where([fake_table.c.id == 10])\
+            .order_by([OrderBy(field='id', order='asc')])\
+            .offset(20)\
+            .limit(30)
+
+        assert query.shape[:2] == (fake_table, 'select')
+        assert [value for _, value in query.params] == [10, 20, 30]
+
+    def test_ok_values(self, sa_model_manager: BaseModelManager, fake_table):
+        query = sa_model_manager.set_sql(fake_table.update(), shape=(fake_table, 'update'))\
+            .values(name='foo', id=1)
+
+        assert query.shape == (fake_table, 'update', ('values', 'id', 'name'))
+        assert query.params == (('id', 1), ('name', 'foo'))
+
+    def test_ok_wo_shape(self, sa_model_manager: BaseModelManager, fake_table):
+        query = sa_model_manager.set_sql(fake_table.select())\
+            .where([fake_table.c.id == 10])\
+            .limit(30)
+
+        assert query.shape is None
+        assert query.params == ()
+
+    @pytest.mark.parametrize("build", [
+        lambda query, table: query.where([table.c.id == sa.cast('1', sa.Integer)]),
+        lambda query, table: query.values(id=table.c.id + 1),
+        lambda query, table: query.values({'id': 1}),
+    ])
+    def test_ok_not_cacheable(self, build, sa_model_manager: BaseModelManager, fake_table):
+        query = sa_model_manager.set_sql(fake_table.update(), shape=(fake_table, 'update'))
+
+        assert build(query, fake_table).shape is None
+
+
+class TestBaseModelManagerPrepareStatement:
+    def test_ok_sql(self, model_manager: BaseModelManager, mocker: MockFixture):
+        fake_sql = mocker.Mock()
+
+        compared_args = model_manager.prepare_statement(fake_sql)
+
+        assert compared_args == (fake_sql,)
+
+    def test_ok_query_wo_shape(self, query: Query):
+        compared_args = query.model_manager.prepare_statement(query)
+
+        assert compared_args == (query.sql,)
+
+    def test_ok_cached(self, sa_model_manager: BaseModelManager, fake_table):
+        def build_query(num):
+            sql = sa.select([fake_table.c.id, fake_table.c.name])
+
+            return sa_model_manager.set_sql(sql, shape=(fake_table, 'select', 'id', 'name'))\
+                .where([fake_table.c.id == num])\
+                .limit(num + 1)
+
+        first_statement, first_params = sa_model_manager.prepare_statement(build_query(1))
+        second_statement, second_params = sa_model_manager.prepare_statement(build_query(2))
+
+        assert first_statement == second_statement == str(build_query(2).sql.compile(dialect=postgresql.dialect()))
+        assert first_params == {'id_1': 1, 'param_1': 2}
+        assert second_params == {'id_1': 2, 'param_1': 3}
+        assert sa_model_manager.statement_cache.hits == 1
+        assert sa_model_manager.statement_cache.misses == 1
+
+    def test_ok_literal_column(self, sa_model_manager: BaseModelManager, fake_table):
+        def build_query(column):
+            return sa_model_manager.set_sql(sa.select([fake_table.c.id]), shape=(fake_table, 'select', 'id'))\
+                .where([column == 'foo'])
+
+        first_statement, _ = sa_model_manager.prepare_statement(build_query(sa.literal_column('Name')))
+        second_statement, _ = sa_model_manager.prepare_statement(build_query(sa.column('Name')))
+
+        assert 'WHERE Name = ' in first_statement
+        assert 'WHERE "Name" = ' in second_statement
+
+    def test_ok_custom_operator(self, sa_model_manager: BaseModelManager, fake_table):
+        for num in range(3):
+            query = sa_model_manager.set_sql(sa.select([fake_table.c.id]), shape=(fake_table, 'select', 'id'))\
+                .where([fake_table.c.name.op('~*')('foo{}'.format(num))])
+            sa_model_manager.prepare_statement(query)
+
+        assert sa_model_manager.statement_cache.misses == 1
+        assert len(sa_model_manager.statement_cache) == 1
+
+    def test_ok_processed_columns(self, sa_model_manager: BaseModelManager, fake_table):
+        # numeric results are processed after the fetch, see `_process_result()`
+        query = sa_model_manager.set_sql(fake_table.select(), shape=(fake_table, 'select'))
+
+        first_statement, _ = sa_model_manager.prepare_statement(query)
+        second_statement, _ = sa_model_manager.prepare_statement(query)
+
+        assert first_statement == second_statement == str(query.sql.compile(dialect=postgresql.dialect()))
+        assert sa_model_manager.statement_cache.hits == 1
+        assert sa_model_manager.statement_cache.misses == 1
 
+    def test_ok_not_cacheable(self, sa_model_manager: BaseModelManager, fake_table):
+        # a bound value of a parameter missing from the statement can't be bound by name
+        query = Query(
+            sa_model_manager, fake_table.select(), shape=(fake_table, 'select'), params=((sa.bindparam('foo'), 1),)
+        )
+
+        assert sa_model_manager.prepare_statement(query) == (query.sql,)
+        assert sa_model_manager.prepare_statement(query) == (query.sql,)
+        assert sa_model_manager.statement_cache.hits == 0
+        assert sa_model_manager.statement_cache.misses == 2
+
+    def test_ok_wo_cache(self, sa_model_manager: BaseModelManager, fake_table, mocker: MockFixture):
+        mocker.patch.object(sa_model_manager, 'statement_cache', None)
+        query = sa_model_manager.set_sql(fake_table.delete(), shape=(fake_table, 'delete'))
+
+        assert sa_model_manager.prepare_statement(query) == (query.sql,)
+
+
+class TestBaseModelManagerGetItem:
+    @pytest.mark.asyncio
+    async def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
+        fake_where_list = mocker.Mock()
+        fake_query = mocker.Mock(**{'where.return_value.with_timeout.return_value.fetchone': CoroutineMock()})
+        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=fake_query)
+        mocked_table = mocker.patch.object(model_manager, 'table')
+
+        compared_result = await model_manager.get_item(fake_where_list)
+        expected_result = fake_query.where.return_value.with_timeout.return_value.fetchone.return_value
+
+        mocked_set_sql.assert_called_once_with(mocked_table.select.return_value, shape=(mocked_table, 'select'))
+        mocked_table.select.assert_called_once_with()
+        fake_query.where.assert_called_once_with(fake_where_list)
+        fake_query.where.return_value.with_timeout.assert_called_once_with(None)
+        fake_query.where.return_value.with_timeout.return_value.fetchone.assert_called_once_with()
+
+        assert compared_result == expected_result
+
+
+class TestBaseModelManagerGetInstance:
     @pytest.mark.asyncio
-    async def test_ok_fetch_false(self, model_manager: BaseModelManager, mocker: MockFixture):
+    async def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
+        fake_where_list = mocker.Mock()
+        mocked_get_item = mocker.patch.object(
+            model_manager,
+            'get_item',
+            CoroutineMock(return_value={'foo': 'bar'})
+        )
+        mocked_row_class = mocker.patch.object(model_manager, 'row_class')
+
+        compared_result = await model_manager.get_instance(fake_where_list)
+        expected_result = mocked_row_class.return_value
+
+        mocked_get_item.assert_called_once_with(fake_where_list, timeout=None)
+        mocked_row_class.assert_called_once_with(**dict(mocked_get_item.return_value))
+
+        assert compared_result == expected_result
+
+    @pytest.mark.asyncio
+    async def test_ok_no_results(self, model_manager: BaseModelManager, mocker: MockFixture):
+        fake_where_list = mocker.Mock()
+        mocked_get_item = mocker.patch.object(model_manager, 'get_item', CoroutineMock(return_value=None))
+        mocked_row_class = mocker.patch.object(model_manager, 'row_class')
+
+        compared_result = await model_manager.get_instance(fake_where_list)
+        expected_result = None
+
+        mocked_get_item.assert_called_once_with(fake_where_list, timeout=None)
+        mocked_row_class.assert_not_called()
+
+        assert compared_result == expected_result
+
+
+@pytest.fixture
+def fake_query(mocker: MockFixture):
+    fake_query = mocker.Mock(
+        fetchall=CoroutineMock(),
+        fetchone=CoroutineMock(),
+        scalar=CoroutineMock(),
+        rowcount=CoroutineMock(),
+    )
+
+    for method in ('where', 'order_by', 'offset', 'limit', 'values', 'returning', 'with_timeout'):
+        getattr(fake_query, method).return_value = fake_query
+
+    return fake_query
+
+
+class TestBaseModelManagerInsert:
+    @pytest.mark.asyncio
+    async def test_ok(self, model_manager: BaseModelManager, fake_query, mocker: MockFixture):
+        fake_values = {'foo': 'bar'}
+        fake_fetchedone = {'foo': 'bar'}
+        fake_query.fetchone.return_value = fake_fetchedone
+        mocked_table = mocker.patch.object(model_manager, 'table', mocker.Mock(columns=[mocker.Mock(), mocker.Mock()]))
+        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=fake_query)
+        mocked_row_class = mocker.patch.object(model_manager, 'row_class')
+
+        compared_result = await model_manager.insert(**fake_values)
+        expected_result = mocked_row_class.return_value
+
+        mocked_set_sql.assert_called_once_with(mocked_table.insert.return_value, shape=(mocked_table, 'insert'))
+        mocked_table.insert.assert_called_once_with()
+        fake_query.values.assert_called_once_with(**fake_values)
+        fake_query.returning.assert_called_once_with(*mocked_table.columns)
+        fake_query.fetchone.assert_called_once_with()
+        mocked_row_class.assert_called_once_with(**fake_fetchedone)
+
+        assert compared_result == expected_result
+
+    @pytest.mark.asyncio
+    async def test_ok_fetch_false(self, model_manager: BaseModelManager, fake_query, mocker: MockFixture):
         fake_values = {'foo': 'bar'}
         mocked_table = mocker.patch.object(model_manager, 'table')
-        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=model_manager)
-        mocked_values = mocker.patch.object(model_manager, 'values', return_value=model_manager)
-        mocked_scalar = mocker.patch.object(model_manager, 'scalar', CoroutineMock())
+        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=fake_query)
 
         compared_result = await model_manager.insert(fetch=False, **fake_values)
-        expected_result = mocked_scalar.return_value
+        expected_result = fake_query.scalar.return_value
 
-        mocked_set_sql.assert_called_once_with(mocked_table.insert.return_value)
+        mocked_set_sql.assert_called_once_with(mocked_table.insert.return_value, shape=(mocked_table, 'insert'))
         mocked_table.insert.assert_called_once_with()
-        mocked_values.assert_called_once_with(**fake_values)
-        mocked_scalar.assert_called_once_with()
+        fake_query.values.assert_called_once_with(**fake_values)
+        fake_query.returning.assert_not_called()
+        fake_query.scalar.assert_called_once_with()
 
         assert compared_result == expected_result
 
 
 class TestBaseModelManagerBulkInsert:
     @pytest.mark.asyncio
-    async def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
+    async def test_ok(self, model_manager: BaseModelManager, fake_query, mocker: MockFixture):
         fake_values = [{'foo': 'bar'}]
         fake_fetchedall = [{'foo': 'bar'}]
+        fake_query.fetchall.return_value = fake_fetchedall
         mocked_table = mocker.patch.object(model_manager, 'table', mocker.Mock(columns=[mocker.Mock(), mocker.Mock()]))
-        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=model_manager)
+        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=fake_query)
         mocked_row_class = mocker.patch.object(model_manager, 'row_class')
-        mocked_values = mocker.patch.object(model_manager, 'values', return_value=model_manager)
-        mocked_returning = mocker.patch.object(model_manager, 'returning', return_value=model_manager)
-        mocked_fetchall = mocker.patch.object(
-            model_manager,
-            'fetchall',
-            CoroutineMock(return_value=fake_fetchedall)
-        )
 
         compared_result = await model_manager.bulk_insert(fake_values)
         expected_result = [mocked_row_class.return_value for _ in fake_fetchedall]
 
         mocked_set_sql.assert_called_once_with(mocked_table.insert.return_value)
         mocked_table.insert.assert_called_once_with()
-        mocked_values.assert_called_once_with(fake_values)
-        mocked_returning.assert_called_once_with(*mocked_table.columns)
-        mocked_fetchall.assert_called_once_with()
+        fake_query.values.assert_called_once_with(fake_values)
+        fake_query.returning.assert_called_once_with(*mocked_table.columns)
+        fake_query.fetchall.assert_called_once_with()
 
         row_class_calls = [mocker.call(**row) for row in fake_fetchedall]
         mocked_row_class.assert_has_calls(row_class_calls)
@@ -521,125 +1276,550 @@ class TestBaseModelManagerBulkInsert:
         assert compared_result == expected_result
 
     @pytest.mark.asyncio
-    async def test_ok_fetch_false(self, model_manager: BaseModelManager, mocker: MockFixture):
+    async def test_ok_fetch_false(self, model_manager: BaseModelManager, fake_query, mocker: MockFixture):
         fake_values = [{'foo': 'bar'}]
+        fake_query.rowcount.return_value = 1
         mocked_table = mocker.patch.object(model_manager, 'table', mocker.Mock(columns=[mocker.Mock(), mocker.Mock()]))
-        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=model_manager)
-        mocked_values = mocker.patch.object(model_manager, 'values', return_value=model_manager)
-        mocked_rowcount = mocker.patch.object(model_manager, 'rowcount', CoroutineMock())
+        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=fake_query)
+
         compared_result = await model_manager.bulk_insert(fake_values, fetch=False)
-        expected_result = mocked_rowcount.return_value
+        expected_result = 1
 
         mocked_set_sql.assert_called_once_with(mocked_table.insert.return_value)
         mocked_table.insert.assert_called_once_with()
-        mocked_values.assert_called_once_with(fake_values)
-        mocked_rowcount.assert_called_once_with()
+        fake_query.values.assert_called_once_with(fake_values)
+        fake_query.returning.assert_not_called()
+        fake_query.rowcount.assert_called_once_with()
+
+        assert compared_result == expected_result
+
+    @pytest.mark.asyncio
+    async def test_ok_empty(self, model_manager: BaseModelManager, mocker: MockFixture):
+        mocked_insert_chunk = mocker.patch.object(model_manager, '_insert_chunk', CoroutineMock())
+
+        assert await model_manager.bulk_insert([]) == []
+        assert await model_manager.bulk_insert([], fetch=False) == 0
+        mocked_insert_chunk.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_ok_chunks(self, model_manager: BaseModelManager, mocker: MockFixture):
+        fake_values = [{'foo': num, 'bar': num} for num in range(7)]
+        running = []
+        max_running = []
+
+        async def fake_insert_chunk(values, fetch):
+            running.append(values)
+            max_running.append(len(running))
+            await asyncio.sleep(0.01 * (10 - len(values)))
+            running.remove(values)
+
+            return [value['foo'] for value in values]
+
+        mocked_insert_chunk = mocker.patch.object(
+            model_manager, '_insert_chunk', CoroutineMock(side_effect=fake_insert_chunk)
+        )
+
+        compared_result = await model_manager.bulk_insert(fake_values, max_params=4, concurrency=2, atomic=False)
+        expected_result = list(range(7))
+
+        assert compared_result == expected_result
+        assert mocked_insert_chunk.call_args_list == [
+            mocker.call(fake_values[0:2], True),
+            mocker.call(fake_values[2:4], True),
+            mocker.call(fake_values[4:6], True),
+            mocker.call(fake_values[6:7], True),
+        ]
+        assert max(max_running) == 2
+
+    @pytest.mark.asyncio
+    async def test_ok_chunks_fetch_false(self, model_manager: BaseModelManager, mocker: MockFixture):
+        fake_values = [{'foo': num} for num in range(5)]
+        mocker.patch.object(
+            model_manager, '_insert_chunk', CoroutineMock(side_effect=lambda values, fetch: len(values))
+        )
+
+        compared_result = await model_manager.bulk_insert(fake_values, fetch=False, max_params=2, atomic=False)
+
+        assert compared_result == 5
+
+    @pytest.mark.asyncio
+    async def test_ok_transaction(self, model_manager: BaseModelManager, mocker: MockFixture):
+        fake_values = [{'foo': num} for num in range(3)]
+        mocker.patch.object(model_manager, 'transaction_connection', mocker.Mock())
+        mocked_gather_bounded = mocker.patch('aiosqlalchemy_miniorm.orm._gather_bounded')
+        mocked_insert_chunk = mocker.patch.object(
+            model_manager, '_insert_chunk', CoroutineMock(side_effect=lambda values, fetch: values)
+        )
+
+        compared_result = await model_manager.bulk_insert(fake_values, max_params=1)
+
+        assert compared_result == fake_values
+        assert mocked_insert_chunk.call_count == 3
+        mocked_gather_bounded.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_ok_atomic(self, model_manager: BaseModelManager, async_context_manager, mocker: MockFixture):
+        fake_values = [{'foo': num} for num in range(3)]
+        fake_model_mgr = mocker.Mock(bulk_insert=CoroutineMock())
+        mocked_transaction = mocker.patch.object(
+            model_manager, 'transaction', return_value=async_context_manager(fake_model_mgr)
+        )
+
+        compared_result = await model_manager.bulk_insert(fake_values, fetch=False, max_params=1)
+        expected_result = fake_model_mgr.bulk_insert.return_value
+
+        assert compared_result == expected_result
+        mocked_transaction.assert_called_once_with()
+        fake_model_mgr.bulk_insert.assert_called_once_with(fake_values, fetch=False, max_params=1)
+
+    @pytest.mark.asyncio
+    async def test_ok_atomic_single_chunk(self, model_manager: BaseModelManager, mocker: MockFixture):
+        fake_values = [{'foo': num} for num in range(3)]
+        mocked_transaction = mocker.patch.object(model_manager, 'transaction')
+        mocked_insert_chunk = mocker.patch.object(
+            model_manager, '_insert_chunk', CoroutineMock(side_effect=lambda values, fetch: len(values))
+        )
+
+        compared_result = await model_manager.bulk_insert(fake_values, fetch=False, max_params=10)
+
+        assert compared_result == 3
+        mocked_insert_chunk.assert_called_once_with(fake_values, False)
+        mocked_transaction.assert_not_called()
+
+
+class TestGatherBounded:
+    @pytest.mark.asyncio
+    async def test_ok(self):
+        async def fake_coroutine(num):
+            await asyncio.sleep(0.001 * (5 - num))
+            return num
+
+        compared_result = await _gather_bounded([fake_coroutine(num) for num in range(5)], 2)
+
+        assert compared_result == list(range(5))
+
+    @pytest.mark.asyncio
+    async def test_error_cancels_siblings(self):
+        finished = []
+
+        async def fake_failing():
+            raise ValueError('fake')
+
+        async def fake_sleeping():
+            await asyncio.sleep(0.01)
+            finished.append(True)
+
+        with pytest.raises(ValueError):
+            await _gather_bounded([fake_sleeping(), fake_failing(), fake_sleeping()], 2)
+
+        await asyncio.sleep(0.02)
+
+        assert finished == []
+
+
+@pytest.fixture
+def fake_transaction(mocker: MockFixture):
+    # runs `transaction()` of a manager on the manager itself and records the exceptions it exits with
+    def patch_transaction(model_manager: BaseModelManager):
+        exc_types = []
+
+        class FakeTransactionContextManager:
+            async def __aenter__(self):
+                model_manager.transaction_connection = mocker.Mock()
+
+                return model_manager
+
+            async def __aexit__(self, exc_type, exc_val, exc_tb):
+                model_manager.transaction_connection = None
+                exc_types.append(exc_type)
+
+        mocker.patch.object(model_manager, 'transaction', return_value=FakeTransactionContextManager())
+
+        return exc_types
+
+    return patch_transaction
+
+
+class TestBaseModelManagerBulkUpsert:
+    @pytest.mark.asyncio
+    async def test_ok(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_values = [{'id': 1, 'name': 'foo', 'price': 10}, {'id': 2, 'name': 'bar', 'price': 20}]
+        mocked_run_query = mocker.patch.object(
+            sa_model_manager, 'run_query', CoroutineMock(return_value=[{'id': 1}, {'id': 2}])
+        )
+        mocked_row_class = mocker.patch.object(sa_model_manager, 'row_class')
+
+        compared_result = await sa_model_manager.bulk_upsert(fake_values)
+        expected_result = [mocked_row_class.return_value] * 2
+
+        assert compared_result == expected_result
+        mocked_row_class.assert_has_calls([mocker.call(id=1), mocker.call(id=2)])
+
+        compared_sql = str(mocked_run_query.call_args[1]['sql'].sql.compile(dialect=postgresql.dialect()))
+
+        assert 'ON CONFLICT (id) DO UPDATE SET name = excluded.name, price = excluded.price' in compared_sql
+        assert compared_sql.endswith('RETURNING fake_table.id, fake_table.name, fake_table.price')
+        assert mocked_run_query.call_args[1]['fetch'] == BaseModelManager.FETCH_ALL
+
+    @pytest.mark.asyncio
+    async def test_ok_do_nothing(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_values = [{'id': 1, 'name': 'foo'}]
+        mocked_run_query = mocker.patch.object(sa_model_manager, 'run_query', CoroutineMock(return_value=1))
+
+        compared_result = await sa_model_manager.bulk_upsert(
+            fake_values, conflict_columns=['name'], update_columns=[], fetch=False
+        )
+
+        assert compared_result == 1
+
+        compared_sql = str(mocked_run_query.call_args[1]['sql'].sql.compile(dialect=postgresql.dialect()))
+
+        assert compared_sql.endswith('ON CONFLICT (name) DO NOTHING')
+        assert mocked_run_query.call_args[1]['fetch'] == BaseModelManager.FETCH_ROW_COUNT
+
+    @pytest.mark.asyncio
+    async def test_ok_chunks(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_values = [{'id': num, 'name': 'foo'} for num in range(3)]
+        mocked_upsert_chunk = mocker.patch.object(
+            sa_model_manager, '_upsert_chunk', CoroutineMock(side_effect=lambda values, *args: len(values))
+        )
+
+        compared_result = await sa_model_manager.bulk_upsert(fake_values, fetch=False, max_params=4, atomic=False)
+
+        assert compared_result == 3
+        assert mocked_upsert_chunk.call_args_list == [
+            mocker.call(fake_values[:2], ['id'], ['name'], False),
+            mocker.call(fake_values[2:], ['id'], ['name'], False),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_ok_atomic(self, sa_model_manager: BaseModelManager, fake_transaction, mocker: MockFixture):
+        fake_values = [{'id': num, 'name': 'foo'} for num in range(3)]
+        exc_types = fake_transaction(sa_model_manager)
+        mocked_upsert_chunk = mocker.patch.object(
+            sa_model_manager, '_upsert_chunk', CoroutineMock(side_effect=lambda values, *args: len(values))
+        )
+
+        compared_result = await sa_model_manager.bulk_upsert(fake_values, fetch=False, max_params=4)
+
+        assert compared_result == 3
+        assert mocked_upsert_chunk.call_count == 2
+        assert exc_types == [None]
+
+    @pytest.mark.asyncio
+    async def test_error_atomic(self, sa_model_manager: BaseModelManager, fake_transaction, mocker: MockFixture):
+        fake_values = [{'id': num, 'name': 'foo'} for num in range(3)]
+        exc_types = fake_transaction(sa_model_manager)
+        mocked_upsert_chunk = mocker.patch.object(
+            sa_model_manager, '_upsert_chunk', CoroutineMock(side_effect=[2, ValueError])
+        )
+
+        with pytest.raises(ValueError):
+            await sa_model_manager.bulk_upsert(fake_values, fetch=False, max_params=4)
+
+        # the transaction of all the chunks is rolled back
+        assert exc_types == [ValueError]
+        assert mocked_upsert_chunk.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_ok_empty(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        mocked_upsert_chunk = mocker.patch.object(sa_model_manager, '_upsert_chunk', CoroutineMock())
+
+        assert await sa_model_manager.bulk_upsert([]) == []
+        assert await sa_model_manager.bulk_upsert([], fetch=False) == 0
+        mocked_upsert_chunk.assert_not_called()
+
+
+class TestBaseModelManagerBulkUpdate:
+    @pytest.mark.asyncio
+    async def test_ok(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_rows = [{'id': 1, 'name': 'foo', 'price': 10}, {'id': 2, 'name': 'bar', 'price': 20}]
+        mocked_run_query = mocker.patch.object(sa_model_manager, 'run_query', CoroutineMock(return_value=2))
+
+        compared_result = await sa_model_manager.bulk_update(fake_rows)
+
+        assert compared_result == 2
+
+        compiled = mocked_run_query.call_args[1]['sql'].sql.compile(dialect=postgresql.dialect())
+
+        assert str(compiled) == (
+            'UPDATE fake_table SET name=bulk_update_values.name, price=bulk_update_values.price '
+            'FROM (SELECT unnest(CAST(%(param_1)s AS INTEGER[])) AS id, '
+            'unnest(CAST(%(param_2)s AS VARCHAR[])) AS name, '
+            'unnest(CAST(%(param_3)s AS NUMERIC[])) AS price) AS bulk_update_values '
+            'WHERE fake_table.id = bulk_update_values.id'
+        )
+        assert compiled.params == {'param_1': [1, 2], 'param_2': ['foo', 'bar'], 'param_3': [10, 20]}
+        assert mocked_run_query.call_args[1]['fetch'] == BaseModelManager.FETCH_ROW_COUNT
+
+    @pytest.mark.asyncio
+    async def test_ok_array_column(self, mocker: MockFixture):
+        fake_table = sa.Table(
+            'fake_table', sa.MetaData(),
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('tags', postgresql.ARRAY(sa.String)),
+        )
+        model_manager = BaseModelManager(fake_table, dict)
+        fake_rows = [{'id': 1, 'tags': ['a', 'b']}, {'id': 2, 'tags': [['c'], ['d']]}]
+        mocked_run_query = mocker.patch.object(model_manager, 'run_query', CoroutineMock(return_value=2))
+
+        compared_result = await model_manager.bulk_update(fake_rows)
+
+        assert compared_result == 2
+
+        compiled = mocked_run_query.call_args[1]['sql'].sql.compile(dialect=postgresql.dialect())
+
+        assert str(compiled) == (
+            'UPDATE fake_table SET tags=bulk_update_values.tags '
+            'FROM (SELECT CAST(%(param_1)s AS INTEGER) AS id, CAST(%(param_2)s AS VARCHAR[]) AS tags '
+            'UNION ALL SELECT CAST(%(param_3)s AS INTEGER) AS id, CAST(%(param_4)s AS VARCHAR[]) AS tags) '
+            'AS bulk_update_values WHERE fake_table.id = bulk_update_values.id'
+        )
+        assert compiled.params == {'param_1': 1, 'param_2': ['a', 'b'], 'param_3': 2, 'param_4': [['c'], ['d']]}
+
+    @pytest.mark.asyncio
+    async def test_ok_fetch(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_rows = [{'name': 'foo', 'price': 10}, {'name': 'bar', 'price': 20}]
+        mocked_run_query = mocker.patch.object(
+            sa_model_manager, 'run_query', CoroutineMock(return_value=[{'id': 1}, {'id': 2}])
+        )
+        mocked_row_class = mocker.patch.object(sa_model_manager, 'row_class')
+
+        compared_result = await sa_model_manager.bulk_update(fake_rows, key='name', fetch=True)
+        expected_result = [mocked_row_class.return_value] * 2
+
+        assert compared_result == expected_result
+        mocked_row_class.assert_has_calls([mocker.call(id=1), mocker.call(id=2)])
+
+        compared_sql = str(mocked_run_query.call_args[1]['sql'].sql.compile(dialect=postgresql.dialect()))
+
+        assert 'SET price=bulk_update_values.price' in compared_sql
+        assert 'WHERE fake_table.name = bulk_update_values.name' in compared_sql
+        assert compared_sql.endswith('RETURNING fake_table.id, fake_table.name, fake_table.price')
+
+    @pytest.mark.asyncio
+    async def test_ok_chunks(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_rows = [{'id': num, 'name': 'foo'} for num in range(3)]
+        mocked_update_chunk = mocker.patch.object(
+            sa_model_manager, '_update_chunk', CoroutineMock(side_effect=lambda rows, *args: len(rows))
+        )
+
+        compared_result = await sa_model_manager.bulk_update(fake_rows, max_params=4, atomic=False)
+
+        assert compared_result == 3
+        assert mocked_update_chunk.call_args_list == [
+            mocker.call(fake_rows[:2], ['id', 'name'], False),
+            mocker.call(fake_rows[2:], ['id', 'name'], False),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_ok_atomic(self, sa_model_manager: BaseModelManager, fake_transaction, mocker: MockFixture):
+        fake_rows = [{'id': num, 'name': 'foo'} for num in range(3)]
+        exc_types = fake_transaction(sa_model_manager)
+        mocked_update_chunk = mocker.patch.object(
+            sa_model_manager, '_update_chunk', CoroutineMock(side_effect=lambda rows, *args: len(rows))
+        )
+
+        compared_result = await sa_model_manager.bulk_update(fake_rows, max_params=4)
+
+        assert compared_result == 3
+        assert mocked_update_chunk.call_count == 2
+        assert exc_types == [None]
+
+    @pytest.mark.asyncio
+    async def test_error_atomic(self, sa_model_manager: BaseModelManager, fake_transaction, mocker: MockFixture):
+        fake_rows = [{'id': num, 'name': 'foo'} for num in range(3)]
+        exc_types = fake_transaction(sa_model_manager)
+        mocked_update_chunk = mocker.patch.object(
+            sa_model_manager, '_update_chunk', CoroutineMock(side_effect=[2, ValueError])
+        )
+
+        with pytest.raises(ValueError):
+            await sa_model_manager.bulk_update(fake_rows, max_params=4)
+
+        # the transaction of all the chunks is rolled back
+        assert exc_types == [ValueError]
+        assert mocked_update_chunk.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_ok_nothing_to_update(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        mocked_update_chunk = mocker.patch.object(sa_model_manager, '_update_chunk', CoroutineMock())
+
+        assert await sa_model_manager.bulk_update([]) == 0
+        assert await sa_model_manager.bulk_update([], fetch=True) == []
+        assert await sa_model_manager.bulk_update([{'id': 1}]) == 0
+        mocked_update_chunk.assert_not_called()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('fake_rows', [
+        [{'name': 'foo'}],
+        [{'id': 1, 'name': 'foo'}, {'id': 2}],
+        [{'id': 1, 'name': 'foo'}, {'id': 2, 'price': 10}],
+    ])
+    async def test_fail_keys(self, sa_model_manager: BaseModelManager, fake_rows: list):
+        with pytest.raises(ValueError):
+            await sa_model_manager.bulk_update(fake_rows)
+
+
+class TestBaseModelManagerCopyIn:
+    @pytest.mark.asyncio
+    async def test_ok(self, fake_table, async_context_manager, mocker: MockFixture):
+        streams = []
+        fake_connection = mocker.Mock()
+
+        class FakeCopyModelManager(BaseModelManager):
+            def copy_connection(self):
+                return async_context_manager(fake_connection)
+
+            async def copy_stream(self, connection, statement, stream):
+                assert connection is fake_connection
+                streams.append((statement, stream.read().decode()))
+
+        model_manager = FakeCopyModelManager(fake_table, dict)
+        fake_rows = AsyncIterator([{'name': 'foo{}'.format(num), 'price': num} for num in range(5)])
+
+        compared_num_rows = await model_manager.copy_in(fake_rows, batch_size=2)
+
+        assert compared_num_rows == 5
+        assert streams == [
+            ('COPY fake_table (name, price) FROM STDIN', 'foo0\t0\nfoo1\t1\n'),
+            ('COPY fake_table (name, price) FROM STDIN', 'foo2\t2\nfoo3\t3\n'),
+            ('COPY fake_table (name, price) FROM STDIN', 'foo4\t4\n'),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_ok_columns(self, sa_model_manager: BaseModelManager, async_context_manager, mocker: MockFixture):
+        fake_connection = mocker.Mock(copy_expert=CoroutineMock())
+        mocker.patch.object(sa_model_manager, 'copy_connection', return_value=async_context_manager(fake_connection))
+
+        compared_num_rows = await sa_model_manager.copy_in([(1, 'foo')], columns=['id', 'name'])
+
+        assert compared_num_rows == 1
+        fake_connection.copy_expert.assert_called_once_with('COPY fake_table (id, name) FROM STDIN', mocker.ANY)
+        assert fake_connection.copy_expert.call_args[0][1].read() == b'1\tfoo\n'
+
+    @pytest.mark.asyncio
+    async def test_error(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        exc_types = []
+
+        class FakeCopyConnectionCM(AsyncContextManager):
+            async def __aexit__(self, exc_type, exc_val, exc_tb):
+                exc_types.append(exc_type)
+
+        fake_connection = mocker.Mock(copy_expert=CoroutineMock(side_effect=ValueError))
+        mocker.patch.object(sa_model_manager, 'copy_connection', return_value=FakeCopyConnectionCM(fake_connection))
+
+        with pytest.raises(ValueError):
+            await sa_model_manager.copy_in([{'name': 'foo'}])
+
+        assert exc_types == [ValueError]
+
+    def test_ok_copy_connection(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        mocker.patch.object(
+            BaseModelManager, 'engine', mocker.PropertyMock(return_value=mocker.Mock(dsn='dbname=foo password=xxx'))
+        )
+
+        compared_connection = sa_model_manager.copy_connection()
+
+        assert isinstance(compared_connection, Psycopg2CopyConnection)
+        assert compared_connection._dsn == 'dbname=foo'
+
+    def test_ok_copy_connection_dsn(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        mocker.patch.object(sa_model_manager, 'copy_dsn', 'dbname=foo password=bar')
+
+        assert sa_model_manager.copy_connection()._dsn == 'dbname=foo password=bar'
 
-        assert compared_result == expected_result
+    def test_error_transaction(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        mocker.patch.object(sa_model_manager, 'transaction_connection', mocker.Mock())
+
+        with pytest.raises(RuntimeError):
+            sa_model_manager.copy_connection()
 
 
 class TestBaseModelManagerUpdate:
     @pytest.mark.asyncio
-    async def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
+    async def test_ok(self, model_manager: BaseModelManager, fake_query, mocker: MockFixture):
         fake_where_list = mocker.Mock()
         fake_values = {'foo': 'bar'}
+        fake_query.fetchall.return_value = [dict(test='test')]
         mocked_table = mocker.patch.object(model_manager, 'table', **{
             'update': mocker.Mock(),
             'columns': [mocker.Mock()]
         })
-        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=model_manager)
-        mocked_values = mocker.patch.object(model_manager, 'values', return_value=model_manager)
-        mocked_where = mocker.patch.object(model_manager, 'where', return_value=model_manager)
-        mocked_returning = mocker.patch.object(model_manager, 'returning', return_value=model_manager)
-        mocked_row_class = mocker.patch.object(model_manager, 'row_class', return_value=model_manager)
-        mocked_fetchall = mocker.patch.object(
-            model_manager,
-            'fetchall',
-            CoroutineMock(return_value=[dict(test='test')])
-        )
+        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=fake_query)
+        mocked_row_class = mocker.patch.object(model_manager, 'row_class')
 
         compared_result = await model_manager.update(fake_where_list, fetch=True, **fake_values)
         expected_result = [mocked_row_class.return_value]
 
-        mocked_set_sql.assert_called_once_with(mocked_table.update.return_value)
-        mocked_values.assert_called_once_with(**fake_values)
+        mocked_set_sql.assert_called_once_with(mocked_table.update.return_value, shape=(mocked_table, 'update'))
         mocked_table.update.assert_called_once_with()
-        mocked_where.assert_called_once_with(fake_where_list)
-        mocked_returning.assert_called_once_with(*mocked_table.columns)
-        mocked_values.assert_called_once_with(**fake_values)
-        mocked_fetchall.assert_called_once_with()
-        mocked_row_class.assert_called_once_with(**dict(mocked_fetchall.return_value.pop()))
+        fake_query.where.assert_called_once_with(fake_where_list)
+        fake_query.values.assert_called_once_with(**fake_values)
+        fake_query.returning.assert_called_once_with(*mocked_table.columns)
+        fake_query.fetchall.assert_called_once_with()
+        mocked_row_class.assert_called_once_with(test='test')
 
         assert compared_result == expected_result
 
     @pytest.mark.asyncio
-    async def test_ok_no_results(self, model_manager: BaseModelManager, mocker: MockFixture):
+    async def test_ok_no_results(self, model_manager: BaseModelManager, fake_query, mocker: MockFixture):
         fake_where_list = mocker.Mock()
         fake_values = {'foo': 'bar'}
+        fake_query.fetchall.return_value = None
         mocked_table = mocker.patch.object(model_manager, 'table', **{
             'update': mocker.Mock(),
             'columns': [mocker.Mock()]
         })
-        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=model_manager)
-        mocked_values = mocker.patch.object(model_manager, 'values', return_value=model_manager)
-        mocked_where = mocker.patch.object(model_manager, 'where', return_value=model_manager)
-        mocked_returning = mocker.patch.object(model_manager, 'returning', return_value=model_manager)
-        mocked_row_class = mocker.patch.object(model_manager, 'row_class', return_value=model_manager)
-        mocked_fetchall = mocker.patch.object(model_manager, 'fetchall', CoroutineMock(return_value=None))
+        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=fake_query)
+        mocked_row_class = mocker.patch.object(model_manager, 'row_class')
 
         compared_result = await model_manager.update(fake_where_list, fetch=True, **fake_values)
         expected_result = []
 
-        mocked_set_sql.assert_called_once_with(mocked_table.update.return_value)
-        mocked_values.assert_called_once_with(**fake_values)
-        mocked_table.update.assert_called_once_with()
-        mocked_where.assert_called_once_with(fake_where_list)
-        mocked_returning.assert_called_once_with(*mocked_table.columns)
-        mocked_values.assert_called_once_with(**fake_values)
-        mocked_fetchall.assert_called_once_with()
+        mocked_set_sql.assert_called_once_with(mocked_table.update.return_value, shape=(mocked_table, 'update'))
+        fake_query.where.assert_called_once_with(fake_where_list)
+        fake_query.values.assert_called_once_with(**fake_values)
+        fake_query.returning.assert_called_once_with(*mocked_table.columns)
+        fake_query.fetchall.assert_called_once_with()
         mocked_row_class.assert_not_called()
 
         assert compared_result == expected_result
 
     @pytest.mark.asyncio
-    async def test_ok_wo_fetch(self, model_manager: BaseModelManager, mocker: MockFixture):
+    async def test_ok_wo_fetch(self, model_manager: BaseModelManager, fake_query, mocker: MockFixture):
         fake_where_list = mocker.Mock()
         fake_values = {'foo': 'bar'}
         mocked_table = mocker.patch.object(model_manager, 'table')
-        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=model_manager)
-        mocked_values = mocker.patch.object(model_manager, 'values', return_value=model_manager)
-        mocked_where = mocker.patch.object(model_manager, 'where', return_value=model_manager)
-        mocked_rowcount = mocker.patch.object(model_manager, 'rowcount', CoroutineMock())
+        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=fake_query)
 
         compared_result = await model_manager.update(fake_where_list, fetch=False, **fake_values)
-        expected_result = mocked_rowcount.return_value
+        expected_result = fake_query.rowcount.return_value
 
-        mocked_set_sql.assert_called_once_with(mocked_table.update.return_value)
-        mocked_values.assert_called_once_with(**fake_values)
+        mocked_set_sql.assert_called_once_with(mocked_table.update.return_value, shape=(mocked_table, 'update'))
         mocked_table.update.assert_called_once_with()
-        mocked_where.assert_called_once_with(fake_where_list)
-        mocked_values.assert_called_once_with(**fake_values)
-        mocked_rowcount.assert_called_once_with()
+        fake_query.where.assert_called_once_with(fake_where_list)
+        fake_query.values.assert_called_once_with(**fake_values)
+        fake_query.returning.assert_not_called()
+        fake_query.rowcount.assert_called_once_with()
 
         assert compared_result == expected_result
 
 
 class TestBaseModelManagerDelete:
     @pytest.mark.asyncio
-    async def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
+    async def test_ok(self, model_manager: BaseModelManager, fake_query, mocker: MockFixture):
         fake_where_list = mocker.Mock()
         mocked_table = mocker.patch.object(model_manager, 'table')
-        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=model_manager)
-        mocked_where = mocker.patch.object(model_manager, 'where', return_value=model_manager)
-        mocked_rowcount = mocker.patch.object(model_manager, 'rowcount', CoroutineMock())
+        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=fake_query)
 
         compared_result = await model_manager.delete(fake_where_list)
-        expected_result = mocked_rowcount.return_value
+        expected_result = fake_query.rowcount.return_value
 
         mocked_table.delete.assert_called_once_with()
-        mocked_set_sql.assert_called_once_with(mocked_table.delete.return_value)
-        mocked_where.assert_called_once_with(fake_where_list)
-        mocked_rowcount.assert_called_once_with()
+        mocked_set_sql.assert_called_once_with(mocked_table.delete.return_value, shape=(mocked_table, 'delete'))
+        fake_query.where.assert_called_once_with(fake_where_list)
+        fake_query.rowcount.assert_called_once_with()
 
         assert compared_result == expected_result
 
@@ -670,51 +1850,688 @@ class TestBaseModelGetInstances:
             order_by=fake_order_by
         )
 
-        expected_result = [mocked_row_class.return_value for _ in fake_rows]
-        row_class_calls = [mocker.call(**row) for row in fake_rows]
-        mocked_row_class.assert_has_calls(row_class_calls)
-        mocked_get_items.assert_called_once_with(
-            where_list=fake_where_list,
-            limit=fake_limit,
-            offset=fake_offset,
-            order_by=fake_order_by
+        expected_result = [mocked_row_class.return_value for _ in fake_rows]
+        row_class_calls = [mocker.call(**row) for row in fake_rows]
+        mocked_row_class.assert_has_calls(row_class_calls)
+        mocked_get_items.assert_called_once_with(
+            where_list=fake_where_list,
+            limit=fake_limit,
+            offset=fake_offset,
+            order_by=fake_order_by,
+            timeout=None
+        )
+
+        assert actual_result == expected_result
+
+    @pytest.mark.asyncio
+    async def test_ok_fetch(self, model_manager: BaseModelManager, mocker: MockFixture):
+        mocked_row_class = mocker.patch.object(model_manager, 'row_class')
+        mocked_get_items = mocker.patch.object(model_manager, 'get_items', CoroutineMock())
+
+        compared_result = await model_manager.get_instances(limit=10, fetch=model_manager.FETCH_COLUMNS)
+
+        assert compared_result == mocked_get_items.return_value
+        mocked_get_items.assert_called_once_with(
+            where_list=None, limit=10, offset=0, order_by=None, fetch=model_manager.FETCH_COLUMNS,
+            timeout=None
+        )
+        mocked_row_class.assert_not_called()
+
+
+class TestBaseModelGetItems:
+    @pytest.mark.asyncio
+    async def test_ok(self, model_manager: BaseModelManager, fake_query, mocker: MockFixture):
+        fake_where_list = mocker.Mock()
+        fake_order_by = mocker.Mock()
+        fake_offset = mocker.Mock()
+        fake_limit = mocker.Mock()
+        mocked_table = mocker.patch.object(model_manager, 'table')
+        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=fake_query)
+
+        compared_result = await model_manager.get_items(
+            where_list=fake_where_list,
+            limit=fake_limit,
+            offset=fake_offset,
+            order_by=fake_order_by
+        )
+        expected_result = fake_query.fetchall.return_value
+
+        mocked_set_sql.assert_called_once_with(mocked_table.select.return_value, shape=(mocked_table, 'select'))
+        mocked_table.select.assert_called_once_with()
+        fake_query.where.assert_called_once_with(fake_where_list)
+        fake_query.order_by.assert_called_once_with(fake_order_by)
+        fake_query.offset.assert_called_once_with(fake_offset)
+        fake_query.limit.assert_called_once_with(fake_limit)
+        fake_query.fetchall.assert_called_once_with()
+
+        assert compared_result == expected_result
+
+    @pytest.mark.asyncio
+    async def test_ok_fetch(self, model_manager: BaseModelManager, fake_query, mocker: MockFixture):
+        mocker.patch.object(model_manager, 'table')
+        mocker.patch.object(model_manager, 'set_sql', return_value=fake_query)
+        fake_query.fetch = CoroutineMock()
+
+        compared_result = await model_manager.get_items(fetch=model_manager.FETCH_TUPLES)
+
+        fake_query.fetch.assert_called_once_with(model_manager.FETCH_TUPLES)
+        fake_query.fetchall.assert_not_called()
+
+        assert compared_result == fake_query.fetch.return_value
+
+
+class TestBaseModelManagerKeysetOrderBy:
+    def test_ok_appends_pk(self, sa_model_manager: BaseModelManager):
+        compared_order_by = sa_model_manager._keyset_order_by([OrderBy(field='name', order='desc')])
+        expected_order_by = [OrderBy(field='name', order='desc'), OrderBy(field='id', order='desc')]
+
+        assert compared_order_by == expected_order_by
+
+    def test_ok_with_pk(self, sa_model_manager: BaseModelManager):
+        fake_order_by = [OrderBy(field='id', order='desc'), OrderBy(field='name', order='asc')]
+
+        compared_order_by = sa_model_manager._keyset_order_by(fake_order_by)
+
+        assert compared_order_by == fake_order_by
+
+    def test_ok_wo_order_by(self, sa_model_manager: BaseModelManager):
+        compared_order_by = sa_model_manager._keyset_order_by()
+        expected_order_by = [OrderBy(field='id', order='asc')]
+
+        assert compared_order_by == expected_order_by
+
+
+class TestBaseModelManagerKeysetWhere:
+    @pytest.mark.parametrize("order,expected_sql", [
+        ('asc', '(fake_table.name, fake_table.id) > (%(param_1)s, %(param_2)s)'),
+        ('desc', '(fake_table.name, fake_table.id) < (%(param_1)s, %(param_2)s)'),
+    ])
+    def test_ok_same_order(self, order, expected_sql, sa_model_manager: BaseModelManager, fake_table):
+        fake_table.c.name.nullable = False
+        fake_order_by = [OrderBy(field='name', order=order), OrderBy(field='id', order=order)]
+
+        compared_where = sa_model_manager._keyset_where(fake_order_by, ['foo', 10])
+
+        assert str(compared_where.compile(dialect=postgresql.dialect())) == expected_sql
+        assert compared_where.compile().params == {'param_1': 'foo', 'param_2': 10}
+
+    def test_ok_mixed_order(self, sa_model_manager: BaseModelManager, fake_table):
+        fake_table.c.name.nullable = False
+        fake_order_by = [OrderBy(field='name', order='asc'), OrderBy(field='id', order='desc')]
+
+        compared_where = sa_model_manager._keyset_where(fake_order_by, ['foo', 10])
+        expected_sql = (
+            'fake_table.name > %(param_1)s OR fake_table.name = %(param_1)s AND fake_table.id < %(param_2)s'
+        )
+
+        assert str(compared_where.compile(dialect=postgresql.dialect())) == expected_sql
+
+    @pytest.mark.parametrize("order,value,expected_sql", [
+        ('asc', 'foo', (
+            'fake_table.name > %(param_1)s OR fake_table.name IS NULL '
+            'OR fake_table.name = %(param_1)s AND fake_table.id > %(param_2)s'
+        )),
+        ('asc', None, 'fake_table.name IS NULL AND fake_table.id > %(param_1)s'),
+        ('desc', 'foo', (
+            'fake_table.name < %(param_1)s OR fake_table.name = %(param_1)s AND fake_table.id < %(param_2)s'
+        )),
+        ('desc', None, 'fake_table.name IS NOT NULL OR fake_table.name IS NULL AND fake_table.id < %(param_1)s'),
+    ])
+    def test_ok_nullable(self, order, value, expected_sql, sa_model_manager: BaseModelManager):
+        fake_order_by = [OrderBy(field='name', order=order), OrderBy(field='id', order=order)]
+
+        compared_where = sa_model_manager._keyset_where(fake_order_by, [value, 10])
+
+        assert str(compared_where.compile(dialect=postgresql.dialect())) == expected_sql
+
+
+class TestBaseModelManagerGetItemsPage:
+    @pytest.mark.asyncio
+    async def test_ok_first_page(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_rows = [{'id': 1, 'name': 'foo'}, {'id': 2, 'name': 'bar'}, {'id': 3, 'name': 'baz'}]
+        fake_order_by = [OrderBy(field='name', order='asc')]
+        fake_where_list = [mocker.Mock()]
+        mocked_get_items = mocker.patch.object(sa_model_manager, 'get_items', CoroutineMock(return_value=fake_rows))
+
+        compared_rows, compared_cursor = await sa_model_manager.get_items_page(
+            2, order_by=fake_order_by, where_list=fake_where_list
+        )
+
+        assert compared_rows == fake_rows[:2]
+        assert _decode_page_cursor(compared_cursor, 2) == ['bar', 2]
+        mocked_get_items.assert_called_once_with(
+            where_list=fake_where_list,
+            order_by=[OrderBy(field='name', order='asc'), OrderBy(field='id', order='asc')],
+            limit=3
+        )
+
+    @pytest.mark.asyncio
+    async def test_ok_next_page(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_rows = [{'id': 3, 'name': 'baz'}]
+        fake_cursor = _encode_page_cursor(['bar', 2])
+        mocked_get_items = mocker.patch.object(sa_model_manager, 'get_items', CoroutineMock(return_value=fake_rows))
+        mocked_keyset_where = mocker.patch.object(sa_model_manager, '_keyset_where')
+
+        compared_rows, compared_cursor = await sa_model_manager.get_items_page(
+            2, order_by=[OrderBy(field='name', order='asc')], cursor=fake_cursor
+        )
+
+        assert compared_rows == fake_rows
+        assert compared_cursor is None
+        mocked_keyset_where.assert_called_once_with(
+            [OrderBy(field='name', order='asc'), OrderBy(field='id', order='asc')], ['bar', 2]
+        )
+        mocked_get_items.assert_called_once_with(
+            where_list=[mocked_keyset_where.return_value], order_by=mocker.ANY, limit=3
+        )
+
+    @pytest.mark.asyncio
+    async def test_error_invalid_cursor(self, sa_model_manager: BaseModelManager):
+        with pytest.raises(ValueError):
+            await sa_model_manager.get_items_page(2, cursor='foo')
+
+    @pytest.mark.asyncio
+    async def test_ok_instances(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_rows = [{'id': 1}]
+        mocked_get_items_page = mocker.patch.object(
+            sa_model_manager, 'get_items_page', CoroutineMock(return_value=(fake_rows, 'cursor'))
+        )
+        mocked_row_class = mocker.patch.object(sa_model_manager, 'row_class')
+
+        compared_instances, compared_cursor = await sa_model_manager.get_instances_page(1, cursor='foo')
+
+        assert compared_instances == [mocked_row_class.return_value]
+        assert compared_cursor == 'cursor'
+        mocked_row_class.assert_called_once_with(id=1)
+        mocked_get_items_page.assert_called_once_with(1, order_by=None, cursor='foo', where_list=None)
+
+
+class TestBaseModelManagerGetItemsWithTotal:
+    @pytest.mark.asyncio
+    async def test_ok(self, sa_model_manager: BaseModelManager, fake_table, mocker: MockFixture):
+        fake_rows = [{'id': 1, 'name': 'foo', '_total_count': 12}, {'id': 2, 'name': 'bar', '_total_count': 12}]
+        mocked_run_query = mocker.patch.object(sa_model_manager, 'run_query', CoroutineMock(return_value=fake_rows))
+        mocked_count = mocker.patch.object(sa_model_manager, 'count', CoroutineMock())
+
+        compared_rows, compared_total = await sa_model_manager.get_items_with_total(
+            where_list=[fake_table.c.price > 5], limit=2, offset=4, order_by=[OrderBy(field='name', order='asc')]
+        )
+
+        assert compared_rows == [{'id': 1, 'name': 'foo'}, {'id': 2, 'name': 'bar'}]
+        assert compared_total == 12
+        assert mocked_count.call_count == 0
+
+        query = mocked_run_query.call_args[1]['sql']
+        compiled = str(query.get_sql().compile(dialect=postgresql.dialect()))
+        assert 'count(*) OVER () AS _total_count' in compiled
+        assert 'WHERE fake_table.price > ' in compiled
+        assert 'ORDER BY fake_table.name ASC' in compiled
+        assert 'LIMIT ' in compiled and 'OFFSET ' in compiled
+
+    @pytest.mark.asyncio
+    async def test_ok_empty_first_page(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        mocker.patch.object(sa_model_manager, 'run_query', CoroutineMock(return_value=[]))
+        mocked_count = mocker.patch.object(sa_model_manager, 'count', CoroutineMock())
+
+        compared_result = await sa_model_manager.get_items_with_total(limit=10)
+
+        assert compared_result == ([], 0)
+        assert mocked_count.call_count == 0
+
+    @pytest.mark.asyncio
+    async def test_ok_page_past_the_end(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_where_list = [mocker.Mock()]
+        mocker.patch.object(sa_model_manager, 'run_query', CoroutineMock(return_value=[]))
+        mocker.patch.object(Query, 'where', lambda query, where_list: query)
+        mocked_count = mocker.patch.object(sa_model_manager, 'count', CoroutineMock(return_value=7))
+
+        compared_result = await sa_model_manager.get_items_with_total(where_list=fake_where_list, limit=10, offset=20)
+
+        assert compared_result == ([], 7)
+        mocked_count.assert_called_once_with(where_list=fake_where_list, timeout=None)
+
+    @pytest.mark.asyncio
+    async def test_ok_instances(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        mocked_get_items_with_total = mocker.patch.object(
+            sa_model_manager, 'get_items_with_total', CoroutineMock(return_value=([{'id': 1}], 3))
+        )
+        mocked_row_class = mocker.patch.object(sa_model_manager, 'row_class')
+
+        compared_instances, compared_total = await sa_model_manager.get_instances_with_total(limit=1)
+
+        assert compared_instances == [mocked_row_class.return_value]
+        assert compared_total == 3
+        mocked_row_class.assert_called_once_with(id=1)
+        mocked_get_items_with_total.assert_called_once_with(where_list=None, limit=1, offset=0, order_by=None,
+                                                            timeout=None)
+
+
+class TestPageCursor:
+    def test_ok(self):
+        fake_values = ['foo', 10, datetime.datetime(2017, 1, 2, 3, 4, 5)]
+
+        compared_values = _decode_page_cursor(_encode_page_cursor(fake_values), 3)
+        expected_values = ['foo', 10, '2017-01-02 03:04:05']
+
+        assert compared_values == expected_values
+
+    @pytest.mark.parametrize("fake_cursor", ['foo', _encode_page_cursor(['foo']), _encode_page_cursor({'foo': 1})])
+    def test_error(self, fake_cursor):
+        with pytest.raises(ValueError):
+            _decode_page_cursor(fake_cursor, 2)
+
+
+class TestBaseModelManagerIterateItems:
+    @staticmethod
+    @pytest.fixture
+    def fixture_data(sa_model_manager: BaseModelManager, async_context_manager, mocker: MockFixture):
+        fake_transaction_cm = async_context_manager(mocker.Mock())
+        fake_connection = mocker.Mock(begin=mocker.Mock(return_value=fake_transaction_cm))
+        fake_conn_cm = async_context_manager(fake_connection)
+        mocker.patch.object(
+            BaseModelManager,
+            'engine',
+            mocker.PropertyMock(return_value=mocker.Mock(acquire=mocker.Mock(return_value=fake_conn_cm)))
+        )
+        mocker.spy(fake_conn_cm, '__aexit__')
+        mocker.spy(fake_transaction_cm, '__aexit__')
+
+        return fake_connection, fake_conn_cm, fake_transaction_cm
+
+    @pytest.mark.asyncio
+    async def test_ok(self, fixture_data, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_connection, fake_conn_cm, fake_transaction_cm = fixture_data
+        fake_rows = [{'id': num} for num in range(5)]
+        mocked_run_query_with_connection = mocker.patch.object(
+            sa_model_manager,
+            'run_query_with_connection',
+            CoroutineMock(side_effect=[None, fake_rows[:2], fake_rows[2:4], fake_rows[4:]])
+        )
+
+        compared_rows = await collect(sa_model_manager.iterate_items(batch_size=2))
+
+        assert compared_rows == fake_rows
+
+        statements = [str(call[0][1]) for call in mocked_run_query_with_connection.call_args_list]
+        assert statements[0].startswith('DECLARE miniorm_cursor_')
+        assert all(statement.startswith('FETCH FORWARD 2 FROM miniorm_cursor_') for statement in statements[1:])
+        assert len(statements) == 4
+        fake_connection.begin.assert_called_once_with()
+        fake_transaction_cm.__aexit__.assert_called_once_with(None, None, None)
+        fake_conn_cm.__aexit__.assert_called_once_with(None, None, None)
+
+    @pytest.mark.asyncio
+    async def test_ok_instances(self, fixture_data, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_rows = [{'id': 1}, {'id': 2}]
+        mocker.patch.object(
+            sa_model_manager,
+            'run_query_with_connection',
+            CoroutineMock(side_effect=[None, fake_rows])
+        )
+        mocked_row_class = mocker.patch.object(sa_model_manager, 'row_class')
+
+        compared_instances = await collect(sa_model_manager.iterate_instances(batch_size=10))
+
+        assert compared_instances == [mocked_row_class.return_value] * 2
+        mocked_row_class.assert_has_calls([mocker.call(**row) for row in fake_rows])
+
+    @pytest.mark.asyncio
+    async def test_ok_instances_materialized(self, fixture_data, mocker: MockFixture):
+        model_manager = BaseModelManager(FakeDeclarativeModel.__table__, FakeDeclarativeModel)
+        fake_rows = [{'id': 1, 'name': 'foo'}, {'id': 2, 'name': 'bar'}]
+        mocker.patch.object(model_manager, 'run_query_with_connection', CoroutineMock(side_effect=[None, fake_rows]))
+        mocked_get_materializer = mocker.spy(FakeDeclarativeModel, '_get_materializer')
+
+        compared_instances = await collect(model_manager.iterate_instances(batch_size=10))
+
+        assert [dict(instance) for instance in compared_instances] == fake_rows
+        assert all('_lazy_state' in instance.__dict__ for instance in compared_instances)
+        assert all(instance._changed_keys == set() for instance in compared_instances)
+        mocked_get_materializer.assert_called_once_with(('id', 'name'))
+
+    @pytest.mark.asyncio
+    async def test_ok_transaction(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        fake_transaction_connection = mocker.Mock()
+        mocker.patch.object(sa_model_manager, 'transaction_connection', fake_transaction_connection)
+        mocked_engine = mocker.patch.object(BaseModelManager, 'engine', mocker.PropertyMock())
+        mocked_run_query_with_connection = mocker.patch.object(
+            sa_model_manager,
+            'run_query_with_connection',
+            CoroutineMock(side_effect=[None, [{'id': 1}], None])
+        )
+
+        compared_rows = await collect(sa_model_manager.iterate_items(batch_size=2))
+
+        assert compared_rows == [{'id': 1}]
+        mocked_engine.assert_not_called()
+
+        calls = mocked_run_query_with_connection.call_args_list
+        assert [call[0][0] for call in calls] == [fake_transaction_connection] * 3
+        assert str(calls[2][0][1]).startswith('CLOSE miniorm_cursor_')
+
+    @pytest.mark.asyncio
+    async def test_ok_close_early(self, fixture_data, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        _, fake_conn_cm, fake_transaction_cm = fixture_data
+        mocker.patch.object(
+            sa_model_manager,
+            'run_query_with_connection',
+            CoroutineMock(side_effect=[None, [{'id': 1}, {'id': 2}]])
+        )
+
+        async with sa_model_manager.iterate_items(batch_size=2) as rows:
+            async for row in rows:
+                break
+
+        assert row == {'id': 1}
+        fake_transaction_cm.__aexit__.assert_called_once_with(None, None, None)
+        fake_conn_cm.__aexit__.assert_called_once_with(None, None, None)
+
+    @pytest.mark.asyncio
+    async def test_error(self, fixture_data, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        _, fake_conn_cm, fake_transaction_cm = fixture_data
+        fake_error = ValueError('fake')
+        mocker.patch.object(
+            sa_model_manager,
+            'run_query_with_connection',
+            CoroutineMock(side_effect=[None, fake_error])
+        )
+
+        with pytest.raises(ValueError):
+            await collect(sa_model_manager.iterate_items())
+
+        fake_transaction_cm.__aexit__.assert_called_once_with(ValueError, fake_error, mocker.ANY)
+        fake_conn_cm.__aexit__.assert_called_once_with(ValueError, fake_error, mocker.ANY)
+
+
+class TestBaseModelManagerFetchNumpy:
+    @pytest.mark.asyncio
+    async def test_ok(self, sa_model_manager: BaseModelManager, fake_table, mocker: MockFixture):
+        numpy = pytest.importorskip('numpy')
+        mocker.patch.object(sa_model_manager, 'transaction_connection', mocker.Mock())
+        mocked_run_query_with_connection = mocker.patch.object(
+            sa_model_manager,
+            'run_query_with_connection',
+            CoroutineMock(side_effect=[None, [(1, 'foo'), (2, 'bar')], [(3, 'baz')], None])
+        )
+        fake_query = sa_model_manager.set_sql(sa.select([fake_table.c.id, fake_table.c.name]))
+
+        compared_columns = await sa_model_manager.fetch_numpy(fake_query, batch_size=2)
+
+        assert compared_columns['id'].tolist() == [1, 2, 3]
+        assert compared_columns['id'].dtype == numpy.dtype('i8')
+        assert compared_columns['name'].tolist() == ['foo', 'bar', 'baz']
+
+        statements = [str(call[0][1]) for call in mocked_run_query_with_connection.call_args_list]
+        assert len(statements) == 4
+        assert statements[-1].startswith('CLOSE miniorm_cursor_')
+
+    @pytest.mark.asyncio
+    async def test_ok_structured(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        pytest.importorskip('numpy')
+        mocker.patch.object(sa_model_manager, 'transaction_connection', mocker.Mock())
+        mocker.patch.object(
+            sa_model_manager,
+            'run_query_with_connection',
+            CoroutineMock(side_effect=[None, [(1, 'foo', 1.5)], None])
+        )
+
+        compared_array = await sa_model_manager.fetch_numpy(structured=True, dtype_overrides={'name': 'U8'})
+
+        assert compared_array.dtype.names == ('id', 'name', 'price')
+        assert compared_array.tolist() == [(1, 'foo', 1.5)]
+
+
+class TestBaseModelManagerLoad:
+    @staticmethod
+    @pytest.fixture
+    def mocked_run_query(sa_model_manager: BaseModelManager, mocker: MockFixture):
+        def fake_run_query(sql, fetch):
+            pks = sql.get_sql().compile(dialect=postgresql.dialect()).params['param_1']
+
+            return [{'id': pk, 'name': 'foo{}'.format(pk)} for pk in pks if pk < 100]
+
+        return mocker.patch.object(sa_model_manager, 'run_query', CoroutineMock(side_effect=fake_run_query))
+
+    @pytest.mark.asyncio
+    async def test_ok(self, sa_model_manager: BaseModelManager, mocked_run_query):
+        compared_rows = await asyncio.gather(
+            sa_model_manager.load(1),
+            sa_model_manager.load(2),
+            sa_model_manager.load(1),
+            sa_model_manager.load(100),
+        )
+
+        assert compared_rows == [{'id': 1, 'name': 'foo1'}, {'id': 2, 'name': 'foo2'}, {'id': 1, 'name': 'foo1'}, None]
+        assert compared_rows[0] is compared_rows[2]
+        assert mocked_run_query.call_count == 1
+
+        compared_sql = str(mocked_run_query.call_args[1]['sql'].get_sql().compile(dialect=postgresql.dialect()))
+
+        assert compared_sql.endswith('WHERE fake_table.id = ANY (CAST(%(param_1)s AS INTEGER[]))')
+
+    @pytest.mark.asyncio
+    async def test_ok_load_many(self, sa_model_manager: BaseModelManager, mocked_run_query, mocker: MockFixture):
+        mocker.patch.object(sa_model_manager, 'load_batch_size', 2)
+
+        compared_rows = await sa_model_manager.load_many([3, 2, 1, 200, 5])
+
+        assert [row and row['id'] for row in compared_rows] == [3, 2, 1, None, 5]
+        assert mocked_run_query.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_ok_window(self, sa_model_manager: BaseModelManager, mocked_run_query, mocker: MockFixture):
+        mocker.patch.object(sa_model_manager, 'load_window', 0.01)
+
+        async def load_later(pk):
+            await asyncio.sleep(0)
+            return await sa_model_manager.load(pk)
+
+        compared_rows = await asyncio.gather(sa_model_manager.load(1), load_later(2))
+
+        assert [row['id'] for row in compared_rows] == [1, 2]
+        assert mocked_run_query.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_ok_cancelled_caller(self, sa_model_manager: BaseModelManager, mocked_run_query):
+        cancelled = asyncio.ensure_future(sa_model_manager.load(1))
+        waiting = asyncio.ensure_future(sa_model_manager.load(1))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        assert (await waiting)['id'] == 1
+
+    @pytest.mark.asyncio
+    async def test_ok_in_flight(self, sa_model_manager: BaseModelManager, mocked_run_query):
+        first = asyncio.ensure_future(sa_model_manager.load(1))
+        await asyncio.sleep(0)
+
+        compared_rows = await asyncio.gather(first, sa_model_manager.load(1))
+
+        assert compared_rows[0] is compared_rows[1]
+        assert mocked_run_query.call_count == 1
+        assert len(sa_model_manager._loads) == 0
+
+    @pytest.mark.asyncio
+    async def test_error(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        mocker.patch.object(sa_model_manager, 'run_query', CoroutineMock(side_effect=ValueError('fake')))
+
+        with pytest.raises(ValueError):
+            await sa_model_manager.load_many([1, 2])
+
+        assert sa_model_manager._pending_loads == {}
+
+
+class TestBaseModelManagerCoalesceReads:
+    @staticmethod
+    @pytest.fixture
+    def mocked_run_pooled_query(sa_model_manager: BaseModelManager, mocker: MockFixture):
+        mocker.patch.object(sa_model_manager, 'coalesce_reads', True)
+
+        async def fake_run_pooled_query(sql, fetch, timeout=None):
+            await asyncio.sleep(0.01)
+            return [{'id': 1}] if fetch == BaseModelManager.FETCH_ALL else 1
+
+        return mocker.patch.object(
+            sa_model_manager, '_run_pooled_query', CoroutineMock(side_effect=fake_run_pooled_query)
+        )
+
+    @pytest.mark.asyncio
+    async def test_ok(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_pooled_query):
+        compared_results = await asyncio.gather(
+            *[sa_model_manager.get_items(where_list=[fake_table.c.id == 1]) for _ in range(5)],
+            sa_model_manager.get_items(where_list=[fake_table.c.id == 2]),
+            sa_model_manager.get_items(query=sa.select([fake_table.c.id]).where(fake_table.c.name == 'foo')),
+            sa_model_manager.get_items(query=sa.select([fake_table.c.id]).where(fake_table.c.name == 'foo'))
+        )
+
+        # custom queries have no shape, they are not coalesced
+        assert compared_results == [[{'id': 1}]] * 8
+        assert mocked_run_pooled_query.call_count == 4
+
+        await sa_model_manager.get_items(where_list=[fake_table.c.id == 1])
+
+        assert mocked_run_pooled_query.call_count == 5
+        assert len(sa_model_manager._inflight_reads) == 0
+
+    @pytest.mark.asyncio
+    async def test_ok_not_compiled(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_pooled_query,
+                                   mocker: MockFixture):
+        mocked_compile = mocker.spy(sa.sql.ClauseElement, 'compile')
+
+        await asyncio.gather(*[sa_model_manager.get_items(where_list=[fake_table.c.id == 1]) for _ in range(3)])
+
+        assert mocked_run_pooled_query.call_count == 1
+        mocked_compile.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_ok_same_repr(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_pooled_query):
+        class FakeValue:
+            def __repr__(self):
+                return 'FakeValue'
+
+        await asyncio.gather(
+            sa_model_manager.get_items(where_list=[fake_table.c.name == FakeValue()]),
+            sa_model_manager.get_items(where_list=[fake_table.c.name == FakeValue()]),
+            sa_model_manager.get_items(where_list=[fake_table.c.id == 1]),
+            sa_model_manager.get_items(where_list=[fake_table.c.id == True]),  # noqa: E712
+        )
+
+        assert mocked_run_pooled_query.call_count == 4
+
+    @pytest.mark.asyncio
+    async def test_ok_unhashable(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_pooled_query):
+        fake_tags = ['foo', 'bar']
+
+        await asyncio.gather(*[
+            sa_model_manager.get_items(where_list=[fake_table.c.name == fake_tags]) for _ in range(2)
+        ])
+
+        assert mocked_run_pooled_query.call_count == 2
+        assert len(sa_model_manager._inflight_reads) == 0
+
+    @pytest.mark.asyncio
+    async def test_ok_writes(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_pooled_query):
+        await asyncio.gather(*[
+            sa_model_manager.update(where_list=[fake_table.c.id == 1], name='foo') for _ in range(3)
+        ])
+
+        assert mocked_run_pooled_query.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_ok_transaction(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_pooled_query,
+                                  mocker: MockFixture):
+        mocker.patch.object(sa_model_manager, 'transaction_connection', mocker.Mock())
+        mocked_run_query_with_connection = mocker.patch.object(
+            sa_model_manager, 'run_query_with_connection', CoroutineMock()
+        )
+
+        await asyncio.gather(*[sa_model_manager.get_items(where_list=[fake_table.c.id == 1]) for _ in range(3)])
+
+        assert mocked_run_query_with_connection.call_count == 3
+        mocked_run_pooled_query.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_error(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        mocker.patch.object(sa_model_manager, 'coalesce_reads', True)
+        mocked_run_pooled_query = mocker.patch.object(
+            sa_model_manager, '_run_pooled_query', CoroutineMock(side_effect=ValueError('fake'))
+        )
+
+        compared_results = await asyncio.gather(
+            sa_model_manager.count(), sa_model_manager.count(), return_exceptions=True
         )
 
-        assert actual_result == expected_result
+        assert [type(result) for result in compared_results] == [ValueError, ValueError]
+        assert mocked_run_pooled_query.call_count == 1
 
 
-class TestBaseModelGetItems:
+class TestBaseModelManagerGather:
     @pytest.mark.asyncio
-    async def test_ok(self, model_manager: BaseModelManager, mocker: MockFixture):
-        fake_where_list = mocker.Mock()
-        fake_order_by = mocker.Mock()
-        fake_offset = mocker.Mock()
-        fake_limit = mocker.Mock()
-        mocked_table = mocker.patch.object(model_manager, 'table')
-        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=model_manager)
-        mocked_where = mocker.patch.object(model_manager, 'where', return_value=model_manager)
-        mocked_order_by = mocker.patch.object(model_manager, 'order_by', return_value=model_manager)
-        mocked_offset = mocker.patch.object(model_manager, 'offset', return_value=model_manager)
-        mocked_limit = mocker.patch.object(model_manager, 'limit', return_value=model_manager)
-        mocked_fetchall = mocker.patch.object(model_manager, 'fetchall', CoroutineMock())
+    async def test_ok(self, sa_model_manager: BaseModelManager, fake_table, mocker: MockFixture):
+        running = []
+        max_running = []
+
+        async def fake_run_query(sql, fetch):
+            running.append(sql)
+            max_running.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(sql)
+            return fetch
+
+        mocker.patch.object(sa_model_manager, 'run_query', CoroutineMock(side_effect=fake_run_query))
+
+        compared_results = await sa_model_manager.gather(
+            sa_model_manager.get_items(),
+            sa_model_manager.set_sql(fake_table.select()),
+            fake_table.select(),
+            sa_model_manager.count(),
+            concurrency=2
+        )
 
-        compared_result = await model_manager.get_items(
-            where_list=fake_where_list,
-            limit=fake_limit,
-            offset=fake_offset,
-            order_by=fake_order_by
+        assert compared_results == ['fetchall', 'fetchall', 'fetchall', 'scalar']
+        assert max(max_running) == 2
+
+    @pytest.mark.asyncio
+    async def test_ok_transaction(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        mocker.patch.object(sa_model_manager, 'transaction_connection', mocker.Mock())
+        mocked_gather_bounded = mocker.patch(
+            'aiosqlalchemy_miniorm.orm._gather_bounded', CoroutineMock(return_value=[])
         )
-        expected_result = mocked_fetchall.return_value
 
-        mocked_set_sql.assert_called_once_with(mocked_table.select.return_value)
-        mocked_table.select.assert_called_once_with()
-        mocked_where.assert_called_once_with(fake_where_list)
-        mocked_order_by.assert_called_once_with(fake_order_by)
-        mocked_offset.assert_called_once_with(fake_offset)
-        mocked_limit.assert_called_once_with(fake_limit)
-        mocked_fetchall.assert_called_once_with()
+        await sa_model_manager.gather()
 
-        assert compared_result == expected_result
+        mocked_gather_bounded.assert_called_once_with([], 1)
+
+    @pytest.mark.asyncio
+    async def test_error(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        cancelled = []
+
+        async def fake_failing():
+            raise ValueError('fake')
+
+        async def fake_sleeping():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        with pytest.raises(ValueError):
+            await sa_model_manager.gather(fake_sleeping(), fake_failing())
+
+        assert cancelled == [True]
+
+    @pytest.mark.asyncio
+    async def test_error_type(self, sa_model_manager: BaseModelManager):
+        async def fake_coroutine():
+            pass
+
+        fake_coroutine_obj = fake_coroutine()
+
+        with pytest.raises(TypeError):
+            await sa_model_manager.gather(fake_coroutine_obj, 'foo')
+
+        assert fake_coroutine_obj.cr_frame is None
 
 
 class TestBaseModelTransaction:
@@ -726,7 +2543,7 @@ class TestBaseModelTransaction:
         expected_transaction_cm = mocked_transaction_cm_cls.return_value
 
         assert compared_transaction_cm == expected_transaction_cm
-        mocked_transaction_cm_cls.assert_called_once_with(mocked_new_instance.return_value)
+        mocked_transaction_cm_cls.assert_called_once_with(mocked_new_instance.return_value, identity_map=False)
 
 
 class TestBaseModelNewInstance:
@@ -743,39 +2560,90 @@ class TestBaseModelNewInstance:
 
 class TestBaseModelManagerCount:
     @pytest.mark.asyncio
-    async def test_ok_wo_query(self, model_manager: BaseModelManager, mocker: MockFixture):
+    async def test_ok_wo_query(self, model_manager: BaseModelManager, fake_query, mocker: MockFixture):
         fake_where_list = mocker.Mock()
         mocked_table = mocker.patch.object(model_manager, 'table')
-        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=model_manager)
-        mocked_where = mocker.patch.object(model_manager, 'where', return_value=model_manager)
-        mocked_scalar = mocker.patch.object(model_manager, 'scalar', CoroutineMock())
+        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=fake_query)
 
         compared_result = await model_manager.count(where_list=fake_where_list)
-        expected_result = mocked_scalar.return_value
+        expected_result = fake_query.scalar.return_value
 
-        mocked_set_sql.assert_called_once_with(mocked_table.count.return_value)
+        mocked_set_sql.assert_called_once_with(mocked_table.count.return_value, shape=(mocked_table, 'count'))
         mocked_table.count.assert_called_once_with()
-        mocked_where.assert_called_once_with(fake_where_list)
-        mocked_scalar.assert_called_once_with()
+        fake_query.where.assert_called_once_with(fake_where_list)
+        fake_query.scalar.assert_called_once_with()
 
         assert compared_result == expected_result
 
     @pytest.mark.asyncio
-    async def test_ok_with_query(self, model_manager: BaseModelManager, mocker: MockFixture):
+    async def test_ok_with_query(self, model_manager: BaseModelManager, fake_query, mocker: MockFixture):
         fake_where_list = mocker.Mock()
-        fake_query = mocker.Mock()
-        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=model_manager)
-        mocked_where = mocker.patch.object(model_manager, 'where', return_value=model_manager)
-        mocked_scalar = mocker.patch.object(model_manager, 'scalar', CoroutineMock())
+        fake_sql = mocker.Mock()
+        mocked_set_sql = mocker.patch.object(model_manager, 'set_sql', return_value=fake_query)
+
+        compared_result = await model_manager.count(query=fake_sql, where_list=fake_where_list)
+        expected_result = fake_query.scalar.return_value
 
-        compared_result = await model_manager.count(query=fake_query, where_list=fake_where_list)
-        expected_result = mocked_scalar.return_value
+        mocked_set_sql.assert_called_once_with(fake_sql)
+        fake_query.where.assert_called_once_with(fake_where_list)
+        fake_query.scalar.assert_called_once_with()
 
-        mocked_set_sql.assert_called_once_with(fake_query)
-        mocked_where.assert_called_once_with(fake_where_list)
-        mocked_scalar.assert_called_once_with()
+        assert compared_result == expected_result
+
+
+class TestBaseModelManagerCountEstimate:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("fake_estimate, expected_result", [(500000, 500000), (99999, 42), (-1, 42)])
+    async def test_ok_threshold(self, sa_model_manager: BaseModelManager, mocker: MockFixture,
+                                fake_estimate, expected_result):
+        fake_where_list = [mocker.Mock()]
+        mocked_estimate_count = mocker.patch.object(
+            sa_model_manager, 'estimate_count', CoroutineMock(return_value=fake_estimate)
+        )
+        mocker.patch.object(sa_model_manager, 'run_query', CoroutineMock(return_value=42))
+        mocker.patch.object(Query, 'where', lambda query, where_list: query)
+
+        compared_result = await sa_model_manager.count(where_list=fake_where_list, estimate=True)
 
         assert compared_result == expected_result
+        mocked_estimate_count.assert_called_once_with(where_list=fake_where_list, timeout=None)
+
+    @pytest.mark.asyncio
+    async def test_error_with_query(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        with pytest.raises(ValueError):
+            await sa_model_manager.count(query=mocker.Mock(), estimate=True)
+
+    @pytest.mark.asyncio
+    async def test_ok_reltuples(self, sa_model_manager: BaseModelManager, mocker: MockFixture):
+        mocked_run_query = mocker.patch.object(sa_model_manager, 'run_query', CoroutineMock(return_value=123))
+
+        compared_result = await sa_model_manager.estimate_count()
+
+        assert compared_result == 123
+
+        query = mocked_run_query.call_args[1]['sql']
+        compiled = query.get_sql().compile(dialect=postgresql.dialect())
+        assert str(compiled) == 'SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(%(table_name)s AS regclass)'
+        assert compiled.params == {'table_name': 'fake_table'}
+        assert mocked_run_query.call_args[1]['fetch'] == sa_model_manager.FETCH_SCALAR
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("fake_plan", [
+        [{'Plan': {'Node Type': 'Seq Scan', 'Plan Rows': 3456}}],
+        '[{"Plan": {"Node Type": "Seq Scan", "Plan Rows": 3456}}]',
+    ])
+    async def test_ok_explain(self, sa_model_manager: BaseModelManager, fake_table, mocker: MockFixture, fake_plan):
+        mocked_run_query = mocker.patch.object(sa_model_manager, 'run_query', CoroutineMock(return_value=fake_plan))
+
+        compared_result = await sa_model_manager.estimate_count(where_list=[fake_table.c.price > 5])
+
+        assert compared_result == 3456
+
+        query = mocked_run_query.call_args[1]['sql']
+        compiled = query.get_sql().compile(dialect=postgresql.dialect())
+        assert str(compiled).startswith('EXPLAIN (FORMAT JSON) SELECT fake_table.id')
+        assert str(compiled).endswith('WHERE fake_table.price > %(price_1)s')
+        assert compiled.params == {'price_1': 5}
 
 
 class TestRowModelDeclarativeMetaGetAttr:
@@ -827,7 +2695,7 @@ class TestRowModelDeclarativeMetaGetAttr:
 @pytest.fixture
 def fake_row_model(mocker: MockFixture):
     class FakeRowModel(RowModel):
-        __table__ = mocker.Mock()
+        __table__ = mocker.Mock(columns=[])
         model_manager = mocker.Mock()
 
     return FakeRowModel()
@@ -1023,11 +2891,16 @@ class TestRowModelUpdate:
         fake_pk_key = 'foo'
         fake_kwargs = {'bar': 'baz'}
         fake_row_model.__table__.primary_key = [mocker.Mock(key=fake_pk_key)]
+        fake_row_model.__table__.columns = [mocker.Mock(key=key) for key in ('foo', 'bar', 'qux')]
         mocked_check = mocker.patch.object(fake_row_model, 'check')
         mocked_set_values = mocker.patch.object(fake_row_model, '_set_values')
         mocked_model_manager = mocker.patch.object(fake_row_model, 'model_manager', update=CoroutineMock())
         setattr(fake_row_model, fake_pk_key, mocker.Mock())
 
+        fake_row_model._mark_clean()
+        fake_row_model.bar = 'baz'
+        fake_row_model.qux = 'quux'
+
         await fake_row_model.update(**fake_kwargs)
 
         mocked_check.assert_called_once_with()
@@ -1037,6 +2910,7 @@ class TestRowModelUpdate:
             **fake_kwargs
         )
         mocked_set_values.assert_called_once_with(fake_kwargs)
+        assert fake_row_model._changed_keys == {'qux'}
 
     @pytest.mark.asyncio
     async def test_ok_none_result(self, fake_row_model, mocker: MockFixture):
@@ -1061,6 +2935,116 @@ class TestRowModelUpdate:
         mocked_set_values.assert_not_called()
 
 
+class TestRowModelDirtyTracking:
+    def test_ok_constructor(self):
+        instance = FakeDeclarativeEntity(id=5, name='new')
+
+        assert instance._changed_keys == {'id', 'name'}
+
+    def test_ok_tracked(self, fake_columns, fake_row_model):
+        fake_row_model.__table__.columns = fake_columns
+        fake_row_model.foo = 'bar'
+        fake_row_model._mark_clean()
+
+        fake_row_model.foo = 'baz'
+        fake_row_model.qux = 'baz'
+        fake_row_model._private = 'baz'
+        fake_row_model.model_manager = 'baz'
+
+        assert fake_row_model._changed_keys == {'foo', 'qux'}
+
+        fake_row_model._mark_clean(['qux'])
+
+        assert fake_row_model._changed_keys == {'foo'}
+
+    def test_ok_mark_changed(self, fake_columns, fake_row_model):
+        fake_row_model.__table__.columns = fake_columns
+        fake_row_model.foo = {'bar': 1}
+        fake_row_model._mark_clean()
+
+        fake_row_model.foo['bar'] = 2
+
+        assert fake_row_model._changed_keys == set()
+
+        fake_row_model.mark_changed('foo')
+
+        assert fake_row_model._changed_keys == {'foo'}
+
+    def test_ok_mark_changed_new(self, fake_row_model):
+        fake_row_model.mark_changed('foo')
+
+        assert fake_row_model._changed_keys == {'foo'}
+
+
+class TestRowModelSave:
+    @staticmethod
+    @pytest.fixture
+    def fixture_data(fake_columns, fake_row_model, mocker: MockFixture):
+        fake_row_model.__table__.columns = fake_columns
+        fake_row_model.__table__.primary_key = [fake_columns[0]]
+
+        for col in fake_columns:
+            setattr(fake_row_model, col.key, col.key)
+
+        return mocker.patch.object(fake_row_model, 'update', CoroutineMock())
+
+    @pytest.mark.asyncio
+    async def test_ok(self, fake_row_model, fixture_data):
+        fake_row_model._mark_clean()
+        fake_row_model.bar = 'changed'
+
+        compared_result = await fake_row_model.save()
+
+        assert compared_result is fake_row_model
+        fixture_data.assert_called_once_with(bar='changed')
+
+    @pytest.mark.asyncio
+    async def test_ok_nothing_changed(self, fake_row_model, fixture_data):
+        fake_row_model._mark_clean()
+
+        await fake_row_model.save()
+
+        fixture_data.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_ok_new(self, fake_row_model, fixture_data):
+        # every column but the primary key was assigned since the instance was created
+        await fake_row_model.save()
+
+        fixture_data.assert_called_once_with(bar='bar', baz='baz', qux='qux')
+
+    @pytest.mark.asyncio
+    async def test_ok_partially_set(self, mocker: MockFixture):
+        instance = FakeDeclarativeEntity(id=5, name='new')
+        mocked_update = mocker.patch.object(instance, 'update', CoroutineMock())
+
+        await instance.save()
+
+        # `num` was never set, it is neither nulled nor sent
+        mocked_update.assert_called_once_with(name='new')
+
+    @pytest.mark.asyncio
+    async def test_error_changed_pk(self, fake_row_model, fixture_data):
+        fake_row_model._mark_clean()
+        fake_row_model.foo = 'other'
+        fake_row_model.bar = 'changed'
+
+        with pytest.raises(ValueError):
+            await fake_row_model.save()
+
+        fixture_data.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_error_no_pk(self, mocker: MockFixture):
+        instance = FakeDeclarativeEntity(name='new')
+        mocked_update = mocker.patch.object(instance, 'update', CoroutineMock())
+
+        with pytest.raises(ValueError):
+            await instance.save()
+
+        mocked_update.assert_not_called()
+
+
 class TestRowModelDelete:
     @pytest.mark.asyncio
     async def test_ok(self, fake_row_model, mocker: MockFixture):
@@ -1092,7 +3076,7 @@ class TestTransactionContextManager:
         fake_conn_cm = async_context_manager(fake_connection)
         fake_model_mgr = mocker.Mock(
             transaction_connection=None,
-            engine=mocker.Mock(acquire=mocker.Mock(return_value=fake_conn_cm))
+            acquire=mocker.Mock(return_value=fake_conn_cm)
         )
         mocker.spy(fake_conn_cm, '__aenter__')
         mocker.spy(fake_conn_cm, '__aexit__')
@@ -1104,7 +3088,7 @@ class TestTransactionContextManager:
 
         async with transaction as model_objects:
             assert model_objects == fake_model_mgr
-            fake_model_mgr.engine.acquire.assert_called_once_with()
+            fake_model_mgr.acquire.assert_called_once_with()
             fake_conn_cm.__aenter__.assert_called_once_with()
             fake_transaction_cm.__aenter__.assert_called_once_with()
             fake_connection.begin.assert_called_once_with()
@@ -1113,3 +3097,420 @@ class TestTransactionContextManager:
         fake_transaction_cm.__aexit__.assert_called_once_with(exc_type, exc_val, exc_tb)
         fake_conn_cm.__aexit__.assert_called_once_with(exc_type, exc_val, exc_tb)
         assert fake_model_mgr.transaction_connection is None
+
+
+class TestBaseModelManagerIdentityMap:
+    @staticmethod
+    @pytest.fixture
+    def fake_model(fake_table, mocker: MockFixture):
+        class FakeModel(RowModel):
+            __table__ = fake_table
+
+            def __init__(self, **kwargs):
+                self._sa_instance_state = mocker.Mock(_deleted=False)
+
+                for key, value in kwargs.items():
+                    setattr(self, key, value)
+
+        return FakeModel
+
+    @staticmethod
+    @pytest.fixture
+    def fake_model_manager(fake_model, fake_table):
+        fake_model.model_manager = BaseModelManager(fake_table, fake_model)
+
+        return fake_model.model_manager
+
+    @staticmethod
+    @pytest.fixture
+    def mocked_run_query(fake_model, mocker: MockFixture):
+        fake_rows = {'fetchone': {'id': 1, 'name': 'foo', 'price': 10}, 'rowcount': 1}
+
+        return mocker.patch.object(
+            BaseModelManager, 'run_query', CoroutineMock(side_effect=lambda sql, fetch: fake_rows[fetch])
+        )
+
+    @pytest.mark.asyncio
+    async def test_ok_same_instance(self, fake_model_manager, fake_table, mocked_run_query):
+        async with fake_model_manager.session() as model_mgr:
+            instance = await model_mgr.get_instance([fake_table.c.id == 1])
+            compared_instance = await model_mgr.get_instance([fake_table.c.id == 1])
+
+            assert compared_instance is instance
+            assert instance.model_manager is model_mgr
+            assert mocked_run_query.call_count == 1
+
+            compared_instance = await model_mgr.get_instance([fake_table.c.name == 'foo'])
+
+            assert compared_instance is instance
+            assert mocked_run_query.call_count == 2
+
+        assert model_mgr.identity_map is None
+        assert await fake_model_manager.get_instance([fake_table.c.id == 1]) is not instance
+
+    @pytest.mark.asyncio
+    async def test_ok_update(self, fake_model_manager, fake_table, mocked_run_query):
+        async with fake_model_manager.session() as model_mgr:
+            instance = await model_mgr.get_instance([fake_table.c.id == 1])
+            await instance.update(name='bar')
+
+            compared_instance = await model_mgr.get_instance([fake_table.c.id == 1])
+
+            assert compared_instance is instance
+            assert compared_instance.name == 'bar'
+            assert mocked_run_query.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_ok_reload_unsaved(self, fake_model_manager, fake_table, mocked_run_query):
+        async with fake_model_manager.session() as model_mgr:
+            instance = await model_mgr.get_instance([fake_table.c.id == 1])
+            instance.name = 'bar'
+            instance.price = 20
+
+            compared_instance = await model_mgr.get_instance([fake_table.c.name == 'foo'])
+
+            assert compared_instance is instance
+            assert (instance.name, instance.price) == ('bar', 20)
+
+            await instance.save()
+
+        compiled = mocked_run_query.call_args[1]['sql'].sql.compile(dialect=postgresql.dialect())
+
+        assert mocked_run_query.call_count == 3
+        assert str(compiled).startswith('UPDATE fake_table SET name=%(name)s, price=%(price)s')
+        assert compiled.params['name'] == 'bar'
+        assert compiled.params['price'] == 20
+
+    @pytest.mark.asyncio
+    async def test_ok_delete(self, fake_model_manager, fake_table, mocked_run_query):
+        async with fake_model_manager.session() as model_mgr:
+            instance = await model_mgr.get_instance([fake_table.c.id == 1])
+            await instance.delete()
+
+            assert model_mgr.identity_map == {}
+
+            compared_instance = await model_mgr.get_instance([fake_table.c.id == 1])
+
+            assert compared_instance is not instance
+            assert mocked_run_query.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_ok_transaction(self, fake_model_manager, async_context_manager, mocker: MockFixture):
+        fake_connection = mocker.Mock(begin=mocker.Mock(return_value=async_context_manager(mocker.Mock())))
+        mocker.patch.object(
+            fake_model_manager.engine, 'acquire', mocker.Mock(return_value=async_context_manager(fake_connection)),
+            create=True
+        )
+
+        async with fake_model_manager.transaction(identity_map=True) as model_mgr:
+            assert model_mgr.identity_map == {}
+
+        assert model_mgr.identity_map is None
+
+        async with fake_model_manager.transaction() as model_mgr:
+            assert model_mgr.identity_map is None
+
+    @pytest.mark.parametrize('fake_where_list', [
+        None,
+        [sa.column('id') == 1],
+        [sa.literal_column('id') > 1],
+        [sa.column('name') == 'foo', sa.column('id') == 1],
+    ])
+    def test_ok_not_pk_lookup(self, sa_model_manager: BaseModelManager, fake_where_list):
+        sa_model_manager.identity_map = {(dict, 1): {'id': 1}}
+
+        assert sa_model_manager._identity_map_get(fake_where_list) is None
+
+
+class TestBaseModelManagerPkCache:
+    @staticmethod
+    @pytest.fixture
+    def mocked_run_query(sa_model_manager: BaseModelManager, mocker: MockFixture):
+        mocker.patch.object(sa_model_manager, 'pk_cache', TTLCache())
+
+        return mocker.patch.object(
+            sa_model_manager, 'run_query',
+            CoroutineMock(side_effect=lambda sql, fetch: {'id': 1, 'name': 'foo'} if fetch == 'fetchone' else 1)
+        )
+
+    @pytest.mark.asyncio
+    async def test_ok_read_through(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_query):
+        compared_rows = await asyncio.gather(*[sa_model_manager.get_item([fake_table.c.id == 1]) for _ in range(5)])
+
+        assert compared_rows == [{'id': 1, 'name': 'foo'}] * 5
+        assert mocked_run_query.call_count == 1
+
+        await sa_model_manager.get_instance([fake_table.c.id == 1])
+        await sa_model_manager.get_item([fake_table.c.name == 'foo'])
+
+        assert mocked_run_query.call_count == 2
+        assert sa_model_manager.pk_cache.stats()['hits'] == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('fake_write', [
+        lambda model_mgr, table: model_mgr.update(where_list=[table.c.id == 1], name='bar'),
+        lambda model_mgr, table: model_mgr.update(where_list=[table.c.name == 'foo'], name='bar'),
+        lambda model_mgr, table: model_mgr.delete(where_list=[table.c.id == 1]),
+        lambda model_mgr, table: model_mgr.insert(fetch=False, id=1, name='foo'),
+        lambda model_mgr, table: model_mgr.bulk_update([{'id': 1, 'name': 'bar'}]),
+    ])
+    async def test_ok_invalidated(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_query,
+                                  fake_write):
+        await sa_model_manager.get_item([fake_table.c.id == 1])
+        await sa_model_manager.get_item([fake_table.c.id == 2])
+
+        await fake_write(sa_model_manager, fake_table)
+
+        assert (fake_table, 1) not in sa_model_manager.pk_cache
+
+    @pytest.mark.asyncio
+    async def test_ok_transaction(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_query,
+                                  mocker: MockFixture):
+        fake_row = {'id': 1, 'name': 'foo'}
+        sa_model_manager.pk_cache.set((fake_table, 1), fake_row)
+        sa_model_manager.transaction_connection = mocker.Mock()
+
+        await sa_model_manager.get_item([fake_table.c.id == 1])
+
+        assert mocked_run_query.call_count == 1
+
+        await sa_model_manager.delete(where_list=[fake_table.c.id == 1])
+        sa_model_manager.pk_cache.set((fake_table, 1), fake_row)
+        sa_model_manager.transaction_connection = None
+        sa_model_manager._flush_cache_invalidations()
+
+        assert (fake_table, 1) not in sa_model_manager.pk_cache
+
+
+class TestBaseModelManagerCountCache:
+    @staticmethod
+    @pytest.fixture
+    def mocked_run_query(sa_model_manager: BaseModelManager, mocker: MockFixture):
+        mocker.patch.object(sa_model_manager, 'count_cache', TTLCache())
+
+        return mocker.patch.object(sa_model_manager, 'run_query', CoroutineMock(return_value=3))
+
+    @pytest.mark.asyncio
+    async def test_ok_read_through(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_query):
+        compared_counts = await asyncio.gather(*[
+            sa_model_manager.count(where_list=[fake_table.c.price > 5]) for _ in range(3)
+        ])
+
+        assert compared_counts == [3, 3, 3]
+        assert mocked_run_query.call_count == 1
+
+        await sa_model_manager.count(where_list=[fake_table.c.price > 5])
+        await sa_model_manager.count(where_list=[fake_table.c.price > 6])
+        await sa_model_manager.count()
+
+        assert mocked_run_query.call_count == 3
+
+        stats = sa_model_manager.count_cache.stats()
+        assert stats['hits'] + stats['shared_loads'] == 3
+
+    @pytest.mark.asyncio
+    async def test_ok_not_compiled(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_query,
+                                   mocker: MockFixture):
+        mocked_compile = mocker.spy(sa.sql.ClauseElement, 'compile')
+
+        await sa_model_manager.count(where_list=[fake_table.c.price > 5])
+        await sa_model_manager.count(where_list=[fake_table.c.price > 5])
+
+        assert mocked_run_query.call_count == 1
+        mocked_compile.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_ok_same_repr(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_query):
+        class FakeValue:
+            def __repr__(self):
+                return 'FakeValue'
+
+        await sa_model_manager.count(where_list=[fake_table.c.name == FakeValue()])
+        await sa_model_manager.count(where_list=[fake_table.c.name == FakeValue()])
+
+        assert mocked_run_query.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_ok_not_cached(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_query,
+                                 mocker: MockFixture):
+        await sa_model_manager.count(query=sa.select([sa.func.count()]).select_from(fake_table))
+        await sa_model_manager.count(query=sa.select([sa.func.count()]).select_from(fake_table))
+        # a filter without a shape
+        await sa_model_manager.count(where_list=[fake_table.c.id == sa.cast('1', sa.Integer)])
+        await sa_model_manager.count(where_list=[fake_table.c.id == sa.cast('1', sa.Integer)])
+        # a filter with an unhashable value
+        await sa_model_manager.count(where_list=[fake_table.c.name == ['foo']])
+        await sa_model_manager.count(where_list=[fake_table.c.name == ['foo']])
+
+        sa_model_manager.transaction_connection = mocker.Mock()
+        await sa_model_manager.count()
+        await sa_model_manager.count()
+
+        assert mocked_run_query.call_count == 8
+        assert len(sa_model_manager.count_cache) == 0
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('fake_write', [
+        lambda model_mgr, table: model_mgr.insert(fetch=False, name='foo'),
+        lambda model_mgr, table: model_mgr.bulk_insert([{'name': 'foo'}], fetch=False),
+        lambda model_mgr, table: model_mgr.update(where_list=[table.c.id == 1], name='bar'),
+        lambda model_mgr, table: model_mgr.delete(where_list=[table.c.name == 'foo']),
+        lambda model_mgr, table: model_mgr.bulk_update([{'id': 1, 'name': 'bar'}]),
+    ])
+    async def test_ok_invalidated(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_query,
+                                  fake_write):
+        other_table = sa.Table('other_table', sa.MetaData(), sa.Column('id', sa.Integer, primary_key=True))
+        sa_model_manager.count_cache.set((other_table, 'statement', '[]'), 5)
+        await sa_model_manager.count(where_list=[fake_table.c.price > 5])
+        await sa_model_manager.count()
+
+        await fake_write(sa_model_manager, fake_table)
+
+        assert len(sa_model_manager.count_cache) == 1
+        assert (other_table, 'statement', '[]') in sa_model_manager.count_cache
+
+    @pytest.mark.asyncio
+    async def test_ok_transaction(self, sa_model_manager: BaseModelManager, fake_table, mocked_run_query,
+                                  mocker: MockFixture):
+        sa_model_manager.transaction_connection = mocker.Mock()
+        await sa_model_manager.delete(where_list=[fake_table.c.id == 1])
+        sa_model_manager.transaction_connection = None
+
+        # a concurrent reader caches the count before the transaction ends
+        await sa_model_manager.count()
+        assert len(sa_model_manager.count_cache) == 1
+
+        sa_model_manager._flush_cache_invalidations()
+
+        assert len(sa_model_manager.count_cache) == 0
+
+
+class TestBaseModelManagerMaterialize:
+    @staticmethod
+    @pytest.fixture
+    def fake_model_manager():
+        return BaseModelManager(FakeDeclarativeModel.__table__, FakeDeclarativeModel)
+
+    def test_ok(self, fake_model_manager: BaseModelManager):
+        fake_rows = [{'id': 1, 'name': 'foo'}, {'id': 2, 'name': 'bar'}]
+
+        compared_instances = fake_model_manager._materialize(fake_rows)
+
+        assert [type(instance) for instance in compared_instances] == [FakeDeclarativeModel] * 2
+        assert [dict(instance) for instance in compared_instances] == fake_rows
+        assert '_sa_instance_state' not in compared_instances[0].__dict__
+        assert compared_instances[0]._changed_keys == set()
+
+    def test_ok_sequences(self, fake_model_manager: BaseModelManager):
+        compared_instances = fake_model_manager._materialize([(1, 'foo')], keys=('id', 'name'))
+
+        assert dict(compared_instances[0]) == {'id': 1, 'name': 'foo'}
+
+    def test_ok_lazy_state(self, fake_model_manager: BaseModelManager):
+        instance = fake_model_manager._materialize([{'id': 1}])[0]
+
+        instance.check()
+        instance.name = 'foo'
+
+        assert instance.name == 'foo'
+        assert instance._changed_keys == {'name'}
+        assert instance._sa_instance_state.obj() is instance
+
+        instance._sa_instance_state._deleted = True
+
+        with pytest.raises(Exception):
+            instance.check()
+
+    def test_ok_fallback(self, mocker: MockFixture):
+        fake_model_manager = BaseModelManager(
+            FakeDeclarativeModelWithInit.__table__, FakeDeclarativeModelWithInit
+        )
+        mocked_build_instance = mocker.spy(fake_model_manager, '_build_instance')
+
+        compared_instances = fake_model_manager._materialize([{'id': 1}])
+
+        assert compared_instances[0].id == 1
+        assert '_sa_instance_state' in compared_instances[0].__dict__
+        mocked_build_instance.assert_called_once_with({'id': 1})
+
+    @pytest.mark.asyncio
+    async def test_ok_single_row(self, fake_model_manager: BaseModelManager, mocker: MockFixture):
+        mocker.patch.object(fake_model_manager, 'get_item', CoroutineMock(return_value={'id': 1, 'name': 'foo'}))
+
+        compared_instance = await fake_model_manager.get_instance([FakeDeclarativeModel.id == 1])
+
+        assert dict(compared_instance) == {'id': 1, 'name': 'foo'}
+        assert '_lazy_state' in compared_instance.__dict__
+        assert compared_instance._changed_keys == set()
+
+    def test_ok_identity_map(self, fake_model_manager: BaseModelManager):
+        fake_model_manager.identity_map = {}
+
+        compared_instances = fake_model_manager._materialize([{'id': 1, 'name': 'foo'}, {'id': 1, 'name': 'bar'}])
+
+        assert compared_instances[0] is compared_instances[1]
+        assert compared_instances[0].name == 'bar'
+        assert compared_instances[0].model_manager is fake_model_manager
+        assert '_lazy_state' in compared_instances[0].__dict__
+        assert compared_instances[0]._changed_keys == set()
+
+    def test_ok_empty(self, fake_model_manager: BaseModelManager):
+        assert fake_model_manager._materialize([]) == []
+
+
+class FakeResultProxy:
+    def __init__(self, params):
+        self.rowcount = params
+        self._params = params
+
+    async def fetchall(self):
+        return [self._params]
+
+
+class FakeConnection:
+    def __init__(self, dialect):
+        self.dialect = dialect
+        self.connection = FakeRawConnection()
+
+    async def execute(self, sql, *multiparams):
+        params = multiparams[0] if multiparams else sql.compile(dialect=self.dialect).params
+
+        # let other coroutines build their statements in between
+        for _ in range(random.randint(1, 3)):
+            await asyncio.sleep(0)
+
+        return FakeResultProxy(params)
+
+
+class FakeEngine:
+    def __init__(self):
+        self.dialect = postgresql.dialect()
+
+    def acquire(self):
+        return AsyncContextManager(FakeConnection(self.dialect))
+
+
+class TestBaseModelManagerConcurrency:
+    @pytest.mark.asyncio
+    async def test_interleaved_queries(self, mocker: MockFixture):
+        table = sa.Table(
+            'fake_table', sa.MetaData(bind=FakeEngine()),
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('name', sa.String),
+        )
+        model_manager = BaseModelManager(table, dict)
+        mocker.patch.object(model_manager, 'statement_cache', LRUCache())
+
+        async def get_items(num):
+            rows = await model_manager.get_items(where_list=[table.c.id == num], limit=num + 1)
+
+            assert rows == [{'id_1': num, 'param_1': num + 1}]
+
+        async def update(num):
+            row_count = await model_manager.update(where_list=[table.c.id == num], name=str(num))
+
+            assert row_count == {'id_1': num, 'name': str(num)}
+
+        await asyncio.gather(*[
+            coro(num) for num in range(500) for coro in (get_items, update)
+        ])
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+from pytest_mock import MockFixture
+
+from aiosqlalchemy_miniorm.pool import (
+    AcquireContextManager,
+    AcquireTimeoutError,
+    get_pool_stats,
+    set_statement_timeout,
+)
+
+
+class FakeRawConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, error=None):
+        self.statements = []
+        self.error = error
+        self.connection = FakeRawConnection()
+
+    async def execute(self, sql):
+        self.statements.append(sql)
+
+        if self.error is not None:
+            raise self.error
+
+
+class FakeAcquireContextManager:
+    def __init__(self, engine, delay):
+        self.engine = engine
+        self.delay = delay
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.delay)
+        self.engine.freesize -= 1
+
+        return self.engine.connection
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.engine.freesize += 1
+
+
+class FakeEngine:
+    size = 2
+    maxsize = 10
+
+    def __init__(self, delay=0, connection=None):
+        self.delay = delay
+        self.freesize = 2
+        self.connection = connection or FakeConnection()
+
+    def acquire(self):
+        return FakeAcquireContextManager(self, self.delay)
+
+
+class TestAcquireContextManager:
+    @pytest.mark.asyncio
+    async def test_ok(self):
+        engine = FakeEngine()
+        acquire_cm = AcquireContextManager(engine)
+
+        async with acquire_cm as connection:
+            assert connection is engine.connection
+            assert acquire_cm.wait >= 0
+
+            compared_stats = get_pool_stats(engine).as_dict(engine)
+
+            assert compared_stats['in_use'] == 1
+            assert compared_stats['free'] == 1
+            assert compared_stats['maxsize'] == 10
+            assert compared_stats['acquires'] == 1
+            assert compared_stats['waiting'] == 0
+
+        assert get_pool_stats(engine).as_dict(engine)['in_use'] == 0
+
+    @pytest.mark.asyncio
+    async def test_ok_waiting(self):
+        engine = FakeEngine(delay=0.01)
+
+        async def acquire():
+            async with AcquireContextManager(engine):
+                pass
+
+        future = asyncio.ensure_future(acquire())
+        await asyncio.sleep(0)
+
+        assert get_pool_stats(engine).waiting == 1
+
+        await future
+        compared_stats = get_pool_stats(engine).as_dict(engine)
+
+        assert compared_stats['waiting'] == 0
+        assert compared_stats['wait_max'] >= 0.01
+
+    @pytest.mark.asyncio
+    async def test_error_timeout(self):
+        engine = FakeEngine(delay=1)
+
+        with pytest.raises(AcquireTimeoutError):
+            async with AcquireContextManager(engine, timeout=0.01):
+                pass
+
+        compared_stats = get_pool_stats(engine).as_dict(engine)
+
+        assert compared_stats['timeouts'] == 1
+        assert compared_stats['acquires'] == 0
+        assert compared_stats['waiting'] == 0
+        assert compared_stats['in_use'] == 0
+
+    @pytest.mark.asyncio
+    async def test_error_engine_timeout(self, mocker: MockFixture):
+        engine = mocker.Mock(**{'acquire.return_value.__aenter__': mocker.Mock(side_effect=asyncio.TimeoutError)})
+
+        with pytest.raises(asyncio.TimeoutError) as exc_info:
+            async with AcquireContextManager(engine):
+                pass
+
+        assert not isinstance(exc_info.value, AcquireTimeoutError)
+        assert get_pool_stats(engine).timeouts == 0
+
+
+class TestSetStatementTimeout:
+    @pytest.mark.asyncio
+    async def test_ok(self):
+        connection = FakeConnection()
+
+        await set_statement_timeout(connection, 0.5)
+        await set_statement_timeout(connection, 0.0001)
+        await set_statement_timeout(connection)
+
+        assert connection.statements == [
+            'SET statement_timeout = 500', 'SET statement_timeout = 1', 'RESET statement_timeout'
+        ]
+
+    @pytest.mark.asyncio
+    async def test_error(self, mocker: MockFixture):
+        connection = FakeConnection(error=Exception('connection lost'))
+        mocked_logger = mocker.patch('aiosqlalchemy_miniorm.pool.logger')
+
+        with pytest.raises(Exception):
+            await set_statement_timeout(connection, 0.5)
+
+        assert connection.connection.closed
+        mocked_logger.warning.assert_called_once_with(mocker.ANY)
+
+    @pytest.mark.asyncio
+    async def test_ok_acquire(self):
+        engine = FakeEngine()
+
+        async with AcquireContextManager(engine) as connection:
+            assert connection.statements == []
+
+        async with AcquireContextManager(engine, statement_timeout=0.5) as connection:
+            assert connection.statements == ['SET statement_timeout = 500']
+
+        assert engine.connection.statements == ['SET statement_timeout = 500', 'RESET statement_timeout']
+        assert get_pool_stats(engine).as_dict(engine)['in_use'] == 0
+
+    @pytest.mark.asyncio
+    async def test_error_release(self, mocker: MockFixture):
+        engine = FakeEngine()
+        mocker.patch('aiosqlalchemy_miniorm.pool.logger')
+
+        async with AcquireContextManager(engine, statement_timeout=0.5) as connection:
+            connection.error = Exception('connection lost')
+
+        assert engine.connection.statements == ['SET statement_timeout = 500', 'RESET statement_timeout']
+        assert engine.connection.connection.closed
+        assert get_pool_stats(engine).as_dict(engine)['in_use'] == 0
+
+    @pytest.mark.asyncio
+    async def test_error_body(self):
+        engine = FakeEngine()
+
+        with pytest.raises(ValueError):
+            async with AcquireContextManager(engine, statement_timeout=0.5):
+                raise ValueError
+
+        assert engine.connection.statements == ['SET statement_timeout = 500', 'RESET statement_timeout']
+        assert not engine.connection.connection.closed
+        assert get_pool_stats(engine).as_dict(engine)['in_use'] == 0
+
+    @pytest.mark.asyncio
+    async def test_error_acquire(self, mocker: MockFixture):
+        engine = FakeEngine(connection=FakeConnection(error=Exception('connection lost')))
+        mocker.patch('aiosqlalchemy_miniorm.pool.logger')
+
+        with pytest.raises(Exception):
+            async with AcquireContextManager(engine, statement_timeout=0.5):
+                pass
+
+        assert engine.connection.connection.closed
+        assert get_pool_stats(engine).as_dict(engine)['in_use'] == 0
+
+
+class TestGetPoolStats:
+    def test_ok(self):
+        engine = FakeEngine()
+
+        assert get_pool_stats(engine) is get_pool_stats(engine)
+        assert get_pool_stats(engine) is not get_pool_stats(FakeEngine())
+
+    def test_ok_without_gauges(self):
+        compared_stats = get_pool_stats(object).as_dict(object)
+
+        assert compared_stats['in_use'] is None
+        assert compared_stats['wait_p50'] is None
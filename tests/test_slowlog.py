@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from pytest_mock import MockFixture
+
+from aiosqlalchemy_miniorm.slowlog import SlowQueryLog, redact_value
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def fake_event(mocker: MockFixture, execution_time=2.0):
+    return mocker.Mock(
+        fingerprint='abcdef', statement='SELECT 1 WHERE name = %(name)s', params={'name': 'secret', 'flag': None},
+        execution_time=execution_time, rowcount=5,
+    )
+
+
+def render(call):
+    message, *args = call[0]
+
+    return message % tuple(args)
+
+
+class TestRedactValue:
+    def test_ok(self):
+        assert redact_value('foo', 'secret') == '<str>'
+        assert redact_value('foo', 10) == '<int>'
+        assert redact_value('foo', None) is None
+        assert redact_value('foo', True) is True
+
+
+class TestSlowQueryLog:
+    def test_ok(self, mocker: MockFixture):
+        fake_logger = mocker.Mock(**{'isEnabledFor.return_value': True})
+        slow_log = SlowQueryLog(threshold=1, logger=fake_logger)
+
+        slow_log.after_execute(fake_event(mocker, execution_time=0.5))
+        slow_log.after_execute(fake_event(mocker, execution_time=1.5))
+
+        assert fake_logger.warning.call_count == 1
+        assert render(fake_logger.warning.call_args) == (
+            "Slow query abcdef took 1.500s, 5 rows (0 slow queries not logged): "
+            "SELECT 1 WHERE name = %(name)s with {'name': '<str>', 'flag': None}"
+        )
+
+    def test_ok_lazy(self, mocker: MockFixture):
+        fake_logger = mocker.Mock(**{'isEnabledFor.return_value': True})
+        event = fake_event(mocker)
+        mocked_statement = mocker.PropertyMock(return_value='SELECT 1')
+        type(event).statement = mocked_statement
+
+        SlowQueryLog(threshold=1, logger=fake_logger).after_execute(event)
+
+        assert mocked_statement.call_count == 0
+        render(fake_logger.warning.call_args)
+        assert mocked_statement.call_count == 1
+
+    def test_ok_disabled_logger(self, mocker: MockFixture):
+        fake_logger = logging.getLogger('tests.slow_queries')
+        fake_logger.setLevel(logging.ERROR)
+        mocked_warning = mocker.patch.object(fake_logger, 'warning')
+
+        SlowQueryLog(threshold=1, logger=fake_logger).after_execute(fake_event(mocker))
+
+        assert mocked_warning.call_count == 0
+
+    def test_ok_rate_limit(self, mocker: MockFixture):
+        fake_logger = mocker.Mock(**{'isEnabledFor.return_value': True})
+        timer = FakeTimer()
+        slow_log = SlowQueryLog(threshold=1, rate_limit=2, interval=10, logger=fake_logger, timer=timer)
+
+        for _ in range(5):
+            slow_log.after_execute(fake_event(mocker))
+
+        assert fake_logger.warning.call_count == 2
+        assert slow_log.suppressed == 3
+
+        timer.now = 10
+        slow_log.after_execute(fake_event(mocker))
+
+        assert fake_logger.warning.call_count == 3
+        assert '(3 slow queries not logged)' in render(fake_logger.warning.call_args)
+        assert slow_log.suppressed == 0
+
+    def test_ok_not_redacted(self, mocker: MockFixture):
+        fake_logger = mocker.Mock(**{'isEnabledFor.return_value': True})
+
+        SlowQueryLog(threshold=1, redact=None, logger=fake_logger).after_execute(fake_event(mocker))
+
+        assert "'name': 'secret'" in render(fake_logger.warning.call_args)
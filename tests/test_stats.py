@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import pytest
+from pytest_mock import MockFixture
+
+from aiosqlalchemy_miniorm.stats import LatencyHistogram, QueryStatsRegistry
+
+
+def fake_event(mocker: MockFixture, model=dict, statement='SELECT 1', fetch='fetchall', execution_time=0.01,
+               rowcount=1, shape=None):
+    return mocker.Mock(model=model, statement=statement, fingerprint=statement.lower(), fetch=fetch,
+                       execution_time=execution_time, rowcount=rowcount, shape=shape)
+
+
+class TestLatencyHistogram:
+    def test_ok(self):
+        histogram = LatencyHistogram(buckets=(0.01, 0.1, 1))
+
+        for value in [0.005] * 50 + [0.05] * 45 + [0.5] * 4 + [2]:
+            histogram.observe(value)
+
+        assert histogram.counts == [50, 45, 4, 1]
+        assert histogram.count == 100
+        assert histogram.max == 2
+        assert histogram.sum == pytest.approx(0.25 + 2.25 + 2 + 2)
+        assert histogram.percentile(0.5) == pytest.approx(0.01)
+        assert 0.01 < histogram.percentile(0.9) < 0.1
+        assert 0.1 < histogram.percentile(0.99) <= 1
+        assert histogram.percentile(1) == 2
+
+    def test_ok_max_below_bound(self):
+        histogram = LatencyHistogram(buckets=(0.01, 1))
+        histogram.observe(0.02)
+        histogram.observe(0.03)
+
+        assert histogram.percentile(1) == 0.03
+
+    def test_ok_empty(self):
+        assert LatencyHistogram().percentile(0.5) is None
+
+    def test_ok_cumulative_counts(self):
+        histogram = LatencyHistogram(buckets=(0.01, 0.1))
+        histogram.observe(0.01)
+        histogram.observe(0.5)
+
+        assert histogram.cumulative_counts() == [(0.01, 1), (0.1, 1), (float('inf'), 2)]
+
+
+class TestQueryStatsRegistry:
+    def test_ok(self, mocker: MockFixture):
+        registry = QueryStatsRegistry()
+
+        registry.after_execute(fake_event(mocker, execution_time=0.01, rowcount=3))
+        registry.after_execute(fake_event(mocker, execution_time=0.03, rowcount=-1))
+        registry.on_error(fake_event(mocker, execution_time=None), Exception())
+        registry.after_execute(fake_event(mocker, model=list, execution_time=1))
+
+        compared_stats = registry.get_stats(model=dict)
+
+        assert len(compared_stats) == 1
+        assert compared_stats[0]['model'] == 'dict'
+        assert compared_stats[0]['fingerprint'] == 'select 1'
+        assert compared_stats[0]['statement'] == 'SELECT 1'
+        assert compared_stats[0]['fetch'] == 'fetchall'
+        assert compared_stats[0]['calls'] == 3
+        assert compared_stats[0]['errors'] == 1
+        assert compared_stats[0]['rows'] == 3
+        assert compared_stats[0]['total_time'] == pytest.approx(0.04)
+        assert compared_stats[0]['max_time'] == 0.03
+        assert compared_stats[0]['mean_time'] == pytest.approx(0.02)
+        assert [stats['model'] for stats in registry.get_stats()] == ['list', 'dict']
+
+    def test_ok_shape(self, mocker: MockFixture):
+        registry = QueryStatsRegistry()
+        first_event = fake_event(mocker, shape=('fake_table', 'select'))
+        registry.after_execute(first_event)
+
+        for _ in range(3):
+            event = fake_event(mocker, shape=('fake_table', 'select'))
+            type(event).fingerprint = mocker.PropertyMock(side_effect=AssertionError('fingerprint computed again'))
+            type(event).statement = mocker.PropertyMock(side_effect=AssertionError('statement compiled again'))
+            registry.after_execute(event)
+
+        compared_stats = registry.get_stats()
+
+        assert len(compared_stats) == 1
+        assert compared_stats[0]['calls'] == 4
+        assert compared_stats[0]['fingerprint'] == 'select 1'
+
+    def test_ok_max_entries(self, mocker: MockFixture):
+        registry = QueryStatsRegistry(max_entries=1)
+
+        registry.after_execute(fake_event(mocker, statement='SELECT 1'))
+        registry.after_execute(fake_event(mocker, statement='SELECT 2'))
+        registry.after_execute(fake_event(mocker, statement='SELECT 1'))
+
+        assert [stats['calls'] for stats in registry.get_stats()] == [2]
+        assert registry.dropped == 1
+
+    def test_ok_prometheus(self, mocker: MockFixture):
+        registry = QueryStatsRegistry(buckets=(0.01, 0.1))
+        registry.after_execute(fake_event(mocker, statement='SELECT "a"', execution_time=0.05, rowcount=2))
+
+        compared_text = registry.to_prometheus()
+        labels = 'model="dict",fingerprint="select \\"a\\"",fetch="fetchall"'
+
+        assert compared_text.splitlines() == [
+            '# HELP miniorm_query_calls_total Executed queries.',
+            '# TYPE miniorm_query_calls_total counter',
+            'miniorm_query_calls_total{%s} 1' % labels,
+            '# HELP miniorm_query_errors_total Failed queries.',
+            '# TYPE miniorm_query_errors_total counter',
+            'miniorm_query_errors_total{%s} 0' % labels,
+            '# HELP miniorm_query_rows_total Rows returned or affected.',
+            '# TYPE miniorm_query_rows_total counter',
+            'miniorm_query_rows_total{%s} 2' % labels,
+            '# HELP miniorm_query_duration_seconds_max Longest execution time.',
+            '# TYPE miniorm_query_duration_seconds_max gauge',
+            'miniorm_query_duration_seconds_max{%s} 0.05' % labels,
+            '# HELP miniorm_query_duration_seconds Execution time.',
+            '# TYPE miniorm_query_duration_seconds histogram',
+            'miniorm_query_duration_seconds_bucket{%s,le="0.01"} 0' % labels,
+            'miniorm_query_duration_seconds_bucket{%s,le="0.1"} 1' % labels,
+            'miniorm_query_duration_seconds_bucket{%s,le="+Inf"} 1' % labels,
+            'miniorm_query_duration_seconds_sum{%s} 0.05' % labels,
+            'miniorm_query_duration_seconds_count{%s} 1' % labels,
+        ]